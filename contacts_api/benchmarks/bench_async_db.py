@@ -0,0 +1,141 @@
+"""
+Benchmark of simultaneous logins against the sync and async database layers.
+
+Every login looks the user up by email and stores a new refresh token, which is
+the database work done by the ``/login`` route. Three strategies are compared:
+
+* ``inline`` - sync session called straight from the event loop (the old behaviour),
+* ``threadpool`` - sync session sent to the thread pool through ``run_db``,
+* ``async`` - AsyncSession on the async driver through ``run_db``.
+
+A network round trip to PostgreSQL is simulated by sleeping inside SQLite for
+``--latency-ms`` on every statement. The heartbeat column shows the longest time
+the event loop could not run anything else.
+
+Usage:
+    python benchmarks/bench_async_db.py --logins 50 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+os.environ.setdefault("REDIS_BACKEND", "memory")
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.db import run_db
+from src.database.models import Base, User
+from src.repository import users as repository_users
+
+LATENCY = 0.005
+
+
+class LatencyConnection(sqlite3.Connection):
+    """
+    SQLite connection that sleeps on every statement to mimic a network round trip.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(lambda statement: time.sleep(LATENCY))
+
+
+def seed(path: str, logins: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all(User(username=f"user{i}", email=f"user{i}@example.com", password="x") for i in range(logins))
+        db.commit()
+    engine.dispose()
+
+
+async def heartbeat(stop: asyncio.Event, stalls: list):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last)
+        last = now
+
+
+async def login_inline(session_factory, email: str):
+    with session_factory() as db:
+        user = repository_users._get_user_by_email(db, email)
+        repository_users._update_token(db, user, "refresh-token")
+
+
+async def login_run_db(session_factory, email: str):
+    async with session_factory() as db:
+        user = await repository_users.get_user_by_email(email, db)
+        await repository_users.update_token(user, "refresh-token", db)
+
+
+class SyncSessionContext:
+    """
+    Async context manager around a sync session so both layers share ``login_run_db``.
+    """
+    def __init__(self, factory):
+        self.db = factory()
+
+    async def __aenter__(self):
+        return self.db
+
+    async def __aexit__(self, *exc):
+        self.db.close()
+
+
+async def run(mode: str, path: str, logins: int) -> dict:
+    connect_args = {"factory": LatencyConnection, "timeout": 30}
+    if mode == "async":
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args=connect_args)
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        login = login_run_db
+    else:
+        engine = create_engine(f"sqlite:///{path}", connect_args={**connect_args, "check_same_thread": False},
+                               pool_size=logins)
+        sync_factory = sessionmaker(bind=engine)
+        if mode == "inline":
+            factory, login = sync_factory, login_inline
+        else:
+            factory, login = (lambda: SyncSessionContext(sync_factory)), login_run_db
+
+    stop, stalls = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, stalls))
+    start = time.perf_counter()
+    await asyncio.gather(*(login(factory, f"user{i}@example.com") for i in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    if mode == "async":
+        await engine.dispose()
+    else:
+        engine.dispose()
+    return {"mode": mode, "seconds": elapsed, "logins_per_second": logins / elapsed,
+            "max_loop_stall_ms": max(stalls, default=0) * 1000}
+
+
+def main():
+    global LATENCY
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=50, help="number of simultaneous logins")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated round trip per statement")
+    args = parser.parse_args()
+    LATENCY = args.latency_ms / 1000
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    seed(path, args.logins)
+    print(f"{'mode':<12}{'seconds':>10}{'logins/s':>12}{'max stall ms':>15}")
+    for mode in ("inline", "threadpool", "async"):
+        result = asyncio.run(run(mode, path, args.logins))
+        print(f"{result['mode']:<12}{result['seconds']:>10.3f}{result['logins_per_second']:>12.1f}"
+              f"{result['max_loop_stall_ms']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of per-row versus bulk update and delete of contacts.
+
+Seeds one user with ``--contacts`` contacts and changes all of them twice:
+``per-row`` runs what PUT and DELETE /contacts/{id} do for every contact
+(``get_contact`` then ``refresh_contact`` / ``remove_contact``), ``bulk`` runs
+one ``bulk_update_contacts`` / ``bulk_delete_contacts`` call for all ids.
+The per-row path is timed on the first ``--sample`` contacts and scaled up.
+
+Usage:
+    python benchmarks/bench_bulk.py --contacts 10000
+    SQLALCHEMY_DATABASE_URL=postgresql+psycopg2://... python benchmarks/bench_bulk.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from src.schemas import ContactCreate
+from crud import bulk_delete_contacts, bulk_update_contacts, get_contact, refresh_contact, remove_contact
+
+
+def seed(engine, contacts: int):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    user = User(username="user0", email="user0@example.com", password="x")
+    db.add(user)
+    db.commit()
+    db.execute(insert(Contact), [{"first_name": f"First{i}", "last_name": f"Last{i}", "email": f"contact{i}@example.com",
+                                  "phone_number": str(10_000_000 + i), "birthday": date(1990, 1, 1),
+                                  "birthday_key": 101, "user_id": user.id} for i in range(contacts)])
+    db.commit()
+    return db, user, [c.id for c in db.query(Contact.id).order_by(Contact.id)]
+
+
+def per_row_update(db, user, contact_id):
+    contact = get_contact(db, contact_id, user)
+    changes = ContactCreate(first_name=contact.first_name, last_name="Renamed", email=contact.email,
+                            phone_number=contact.phone_number, birthday=contact.birthday, additional_data=None)
+    refresh_contact(db, user, contact_id, changes)
+
+
+def per_row_delete(db, user, contact_id):
+    get_contact(db, contact_id, user)
+    remove_contact(db, contact_id, user)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--contacts", type=int, default=10000, help="contacts changed by each operation")
+    parser.add_argument("--sample", type=int, default=1000, help="contacts timed on the per-row path")
+    args = parser.parse_args()
+
+    url = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    engine = create_engine(url)
+    sample = min(args.sample, args.contacts)
+    results = {}
+
+    for name, per_row in (("update", per_row_update), ("delete", per_row_delete)):
+        db, user, ids = seed(engine, args.contacts)
+        start = time.perf_counter()
+        for contact_id in ids[:sample]:
+            per_row(db, user, contact_id)
+        per_row_seconds = (time.perf_counter() - start) * args.contacts / sample
+        db.close()
+
+        db, user, ids = seed(engine, args.contacts)
+        start = time.perf_counter()
+        if name == "update":
+            result = bulk_update_contacts(db, user, {"last_name": "Renamed"}, ids=ids)
+        else:
+            result = bulk_delete_contacts(db, user, ids=ids)
+        bulk_seconds = time.perf_counter() - start
+        assert result["count"] == args.contacts
+        db.close()
+        results[name] = (per_row_seconds, bulk_seconds)
+    engine.dispose()
+
+    print(f"{args.contacts} contacts, per-row timed on {sample} and scaled")
+    print(f"{'operation':<10}{'per-row s':>12}{'bulk s':>10}{'speedup':>10}")
+    for name, (per_row_seconds, bulk_seconds) in results.items():
+        print(f"{name:<10}{per_row_seconds:>12.2f}{bulk_seconds:>10.3f}{per_row_seconds / bulk_seconds:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
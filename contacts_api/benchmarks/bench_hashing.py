@@ -0,0 +1,72 @@
+"""
+Benchmark of bcrypt verification for simultaneous logins, inline versus the hashing pool.
+
+``inline`` verifies on the event loop thread like ``Auth.verify_password``,
+``pool`` goes through ``HashingExecutor``. Throughput is bounded by the number of
+cores either way; the heartbeat column shows how long the event loop was unable
+to serve anything else (for example a contact read) while the logins ran.
+
+Usage:
+    python benchmarks/bench_hashing.py --logins 50 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.services.hashing import HashingExecutor, get_pwd_context
+
+
+async def heartbeat(stop: asyncio.Event, stalls: list):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last)
+        last = now
+
+
+async def verify_inline(hashed: str):
+    return get_pwd_context().verify("password", hashed)
+
+
+async def run(mode: str, logins: int, workers: int, hashed: str) -> dict:
+    executor = HashingExecutor(workers=workers, max_in_flight=workers, max_queue=logins)
+    if mode == "pool":
+        # Start the worker processes before timing
+        await asyncio.gather(*(executor.verify("password", hashed) for _ in range(workers)))
+        verify = lambda: executor.verify("password", hashed)
+    else:
+        verify = lambda: verify_inline(hashed)
+
+    stop, stalls = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, stalls))
+    start = time.perf_counter()
+    await asyncio.gather(*(verify() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    executor.shutdown()
+    return {"mode": mode, "seconds": elapsed, "logins_per_second": logins / elapsed,
+            "max_loop_stall_ms": max(stalls, default=0) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=50, help="number of simultaneous logins")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="hashing processes")
+    args = parser.parse_args()
+
+    hashed = get_pwd_context().hash("password")
+    print(f"{'mode':<10}{'seconds':>10}{'logins/s':>12}{'max stall ms':>15}")
+    for mode in ("inline", "pool"):
+        result = asyncio.run(run(mode, args.logins, args.workers, hashed))
+        print(f"{result['mode']:<10}{result['seconds']:>10.3f}{result['logins_per_second']:>12.1f}"
+              f"{result['max_loop_stall_ms']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
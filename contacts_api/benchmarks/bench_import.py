@@ -0,0 +1,79 @@
+"""
+Benchmark of loading contacts one by one versus the bulk import.
+
+Generates a CSV file of ``--contacts`` rows and loads it twice into an empty
+table: ``per-row`` calls ``crud.add_contact`` for every row (what clients of
+POST /contacts/ had to do), ``import`` runs ``crud.import_contacts`` with
+``--batch-size``.
+
+Usage:
+    python benchmarks/bench_import.py --contacts 200000 --batch-size 1000
+    SQLALCHEMY_DATABASE_URL=postgresql+psycopg2://... python benchmarks/bench_import.py
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from src.schemas import ContactCreate
+from crud import add_contact, import_contacts
+
+
+def make_csv(contacts: int) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["first_name", "last_name", "email", "phone_number", "birthday", "additional_data"])
+    for i in range(contacts):
+        writer.writerow([f"First{i}", f"Last{i}", f"contact{i}@example.com", str(10_000_000 + i),
+                         f"19{50 + i % 50}-{1 + i % 12:02d}-{1 + i % 28:02d}", ""])
+    return buffer.getvalue().encode()
+
+
+def reset(engine):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    user = User(username="user0", email="user0@example.com", password="x")
+    db.add(user)
+    db.commit()
+    return db, user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--contacts", type=int, default=20000, help="rows in the imported file")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per import transaction")
+    args = parser.parse_args()
+
+    url = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    engine = create_engine(url)
+    data = make_csv(args.contacts)
+
+    db, user = reset(engine)
+    start = time.perf_counter()
+    for record in csv.DictReader(io.StringIO(data.decode())):
+        add_contact(db, ContactCreate.model_validate({k: v or None for k, v in record.items()}), user)
+    per_row = time.perf_counter() - start
+    db.close()
+
+    db, user = reset(engine)
+    result = import_contacts(db, user, io.BytesIO(data), "csv", args.batch_size)
+    assert result["imported"] == args.contacts == db.query(Contact).count()
+    db.close()
+    engine.dispose()
+
+    print(f"{'mode':<10}{'seconds':>10}{'rows/s':>12}")
+    print(f"{'per-row':<10}{per_row:>10.2f}{args.contacts / per_row:>12.0f}")
+    print(f"{'import':<10}{result['seconds']:>10.2f}{result['rows_per_second']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Load benchmark of the whole application, driven through an in-process ASGI client.
+
+Seeds a fresh database with ``--users`` confirmed users owning ``--contacts``
+contacts each, starts the app lifespan (with a local SMTP stand-in) and runs
+one phase per operation, in order:
+
+    signup, login, refresh_token, list, search, birthdays, create, update, delete
+
+Each phase sends its requests from ``--concurrency`` concurrent clients; the
+auth phases send ``--auth-requests`` requests, the others ``--requests``.
+The report gives throughput and p50/p95/p99 latency per operation as JSON.
+
+With ``--baseline`` the report is compared with a stored one and the run
+exits with status 1 when an operation got slower or lost throughput by more
+than ``--tolerance``; ``--save-baseline`` stores the report as the new
+baseline.
+
+Usage:
+    python benchmarks/bench_load.py --users 100 --contacts 100 --concurrency 20 --output report.json
+    python benchmarks/bench_load.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_load.py --baseline benchmarks/baseline.json --tolerance 0.25
+    SQLALCHEMY_DATABASE_URL=postgresql+psycopg2://... DB_MODE=async python benchmarks/bench_load.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Configure the app before it is imported: a throwaway SQLite database and the in-memory Redis stand-in
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("REDIS_BACKEND", "memory")
+
+import httpx
+from sqlalchemy import insert
+from main import app, lifespan
+from src.database.db import SessionLocal, engine
+from src.database.models import Base, Contact, User, birthday_key
+from src.services.hashing import hash_password
+from src.services.mail import DebuggingSMTPServer, email_outbox
+from src.services.ratelimit import rate_limiter
+
+PASSWORD = "secret1"
+OPERATIONS = ("signup", "login", "refresh_token", "list", "search", "birthdays", "create", "update", "delete")
+# Metrics compared with the baseline and whether higher values are better
+COMPARED = {"throughput_rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False}
+FIRST_NAMES = ["John", "Mary", "Peter", "Anna", "Oleksandr", "Olena", "Taras", "Iryna", "David", "Sophia"]
+LAST_NAMES = ["Smith", "Johnson", "Shevchenko", "Kovalenko", "Bondarenko", "Brown", "Walker", "Melnyk"]
+
+
+def seed(users: int, contacts: int) -> list:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    password = hash_password(PASSWORD)
+    emails = [f"user{i}@example.com" for i in range(users)]
+    with SessionLocal() as db:
+        db.execute(insert(User), [{"username": f"user{i:05d}", "email": email, "password": password,
+                                   "email_verified": True} for i, email in enumerate(emails)])
+        user_ids = [user_id for user_id, in db.query(User.id).order_by(User.id)]
+        rng = random.Random(15)
+        rows = []
+        for n in range(users * contacts):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            birthday = date(1960, 1, 1) + timedelta(days=rng.randrange(365 * 40))
+            rows.append({"first_name": first_name, "last_name": last_name,
+                         "email": f"{first_name}.{last_name}.{n}@example.com".lower(),
+                         "phone_number": str(100_000_000 + n), "birthday": birthday,
+                         "birthday_key": birthday_key(birthday), "user_id": user_ids[n % users]})
+            if len(rows) == 10_000:
+                db.execute(insert(Contact), rows)
+                rows = []
+        if rows:
+            db.execute(insert(Contact), rows)
+        db.commit()
+    return emails
+
+
+def percentile(latencies: list, q: float) -> float:
+    # Nearest-rank percentile of sorted latencies
+    return latencies[max(0, min(len(latencies) - 1, round(q * len(latencies) + 0.5) - 1))]
+
+
+async def run_phase(requests: int, concurrency: int, operation) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def client():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            ok = await operation(i)
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run(args) -> dict:
+    emails = seed(args.users, args.contacts)
+    smtp = DebuggingSMTPServer()
+    await smtp.start()
+    # The stand-in server speaks plain SMTP without STARTTLS or AUTH
+    email_outbox.host, email_outbox.port = smtp.host, smtp.port
+    email_outbox.starttls, email_outbox.username = False, None
+    # Every request comes from one client address, which the auth rate limits would refuse
+    rate_limiter.limits = {}
+    tokens = {}
+    refresh_locks = {email: asyncio.Lock() for email in emails}
+    created = []
+    results = {}
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            def auth(i):
+                return {"Authorization": f"Bearer {tokens[emails[i % len(emails)]]['access_token']}"}
+
+            def contact_body(i):
+                return {"first_name": "Load", "last_name": f"Test{i}", "email": f"load{i}@example.com",
+                        "phone_number": str(900_000_000 + i), "birthday": "1990-06-15", "additional_data": None}
+
+            async def signup(i):
+                response = await client.post("/signup", json={"username": f"new{i:08d}", "email": f"new{i}@example.com",
+                                                              "password": PASSWORD})
+                return response.status_code == 201
+
+            async def login(i):
+                email = emails[i % len(emails)]
+                response = await client.post("/login", data={"username": email, "password": PASSWORD})
+                if response.status_code == 200:
+                    tokens[email] = response.json()
+                return response.status_code == 200
+
+            async def refresh_token(i):
+                # Refresh tokens rotate, so the refreshes of one user are sent one after the other
+                email = emails[i % len(emails)]
+                async with refresh_locks[email]:
+                    headers = {"Authorization": f"Bearer {tokens[email]['refresh_token']}"}
+                    response = await client.get("/refresh_token", headers=headers)
+                    if response.status_code == 200:
+                        tokens[email] = response.json()
+                return response.status_code == 200
+
+            async def read_list(i):
+                return (await client.get("/contacts/", params={"limit": 20}, headers=auth(i))).status_code == 200
+
+            async def search(i):
+                query = random.choice(LAST_NAMES)[:5]
+                response = await client.get("/contacts/", params={"query": query, "limit": 20}, headers=auth(i))
+                return response.status_code == 200
+
+            async def birthdays(i):
+                response = await client.get("/contacts/upcoming_birthdays/", params={"days": 30}, headers=auth(i))
+                return response.status_code == 200
+
+            async def create(i):
+                response = await client.post("/contacts/", json=contact_body(i), headers=auth(i))
+                if response.status_code == 201:
+                    created.append((i, response.json()["id"]))
+                return response.status_code == 201
+
+            async def update(i):
+                owner, contact_id = created[i % len(created)]
+                body = {**contact_body(owner), "first_name": "Updated"}
+                return (await client.put(f"/contacts/{contact_id}", json=body, headers=auth(owner))).status_code == 200
+
+            async def delete(i):
+                if i >= len(created):
+                    return False
+                owner, contact_id = created[i]
+                return (await client.delete(f"/contacts/{contact_id}", headers=auth(owner))).status_code == 200
+
+            phases = {
+                "signup": (args.auth_requests, signup),
+                # Every user logs in once so the later phases have tokens for all of them
+                "login": (max(args.auth_requests, len(emails)), login),
+                "refresh_token": (args.auth_requests, refresh_token),
+                "list": (args.requests, read_list),
+                "search": (args.requests, search),
+                "birthdays": (args.requests, birthdays),
+                "create": (args.requests, create),
+                "update": (args.requests, update),
+                "delete": (args.requests, delete),
+            }
+            for name in OPERATIONS:
+                requests, operation = phases[name]
+                results[name] = await run_phase(requests, args.concurrency, operation)
+                print(f"{name:<14}{json.dumps(results[name])}", file=sys.stderr)
+    await smtp.stop()
+    engine.dispose()
+
+    return {
+        "config": {"users": args.users, "contacts": args.contacts, "concurrency": args.concurrency,
+                   "requests": args.requests, "auth_requests": args.auth_requests,
+                   "database": engine.dialect.name, "db_mode": os.getenv("DB_MODE", "sync")},
+        "operations": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare a report with a baseline report.
+
+    Args:
+        report (dict): Report of this run.
+        baseline (dict): Stored report.
+        tolerance (float): Allowed relative change, e.g. 0.2 for 20%.
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+    for name, stats in report["operations"].items():
+        expected = baseline["operations"].get(name)
+        if expected is None:
+            continue
+        if stats["errors"] > expected["errors"]:
+            regressions.append(f"{name}: {stats['errors']} errors, baseline {expected['errors']}")
+        for metric, higher_is_better in COMPARED.items():
+            value, reference = stats[metric], expected[metric]
+            change = (value - reference) / reference if reference else 0.0
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name}: {metric} {value} vs baseline {reference} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100, help="seeded users")
+    parser.add_argument("--contacts", type=int, default=100, help="seeded contacts per user")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="requests per contact operation")
+    parser.add_argument("--auth-requests", type=int, default=50, help="requests per signup/login/refresh phase")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="compare with this stored report and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--save-baseline", help="store the report as the baseline in this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark of offset versus keyset (cursor) pagination of GET /contacts/.
+
+Seeds one user with ``--contacts`` contacts (plus the same number spread over
+other users) and times ``crud.get_contacts`` for page 1 and page ``--page`` in
+both modes. Offset latency grows with the page number, keyset stays flat.
+
+Usage:
+    python benchmarks/bench_pagination.py --contacts 50000 --page 1000 --limit 10
+    SQLALCHEMY_DATABASE_URL=postgresql+psycopg2://... python benchmarks/bench_pagination.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from crud import encode_cursor, get_contacts
+
+
+def seed(db, contacts: int) -> User:
+    users = [User(username=f"user{i}", email=f"user{i}@example.com", password="x") for i in range(10)]
+    db.add_all(users)
+    db.commit()
+    rows = []
+    for i in range(contacts * 2):
+        # Half of the rows belong to the benchmarked user, interleaved with the others
+        owner = users[0] if i % 2 == 0 else users[1 + i % 9]
+        rows.append({"first_name": f"First{i}", "last_name": f"Last{i}", "email": f"contact{i}@example.com",
+                     "phone_number": str(10_000_000 + i), "birthday": date(1990, 1, 1), "user_id": owner.id})
+    db.execute(insert(Contact), rows)
+    db.commit()
+    return users[0]
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--contacts", type=int, default=50000, help="contacts of the benchmarked user")
+    parser.add_argument("--page", type=int, default=1000, help="deep page to compare with page 1")
+    parser.add_argument("--limit", type=int, default=10, help="page size")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    url = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    user = seed(db, args.contacts)
+
+    # The cursor of a page is the id of the last contact of the page before it
+    skip = (args.page - 1) * args.limit
+    previous = get_contacts(db, user, skip=skip - 1, limit=1)[0]
+    cursor = encode_cursor(user.id, previous.id)
+    assert [c.id for c in get_contacts(db, user, cursor=cursor, limit=args.limit)] == \
+        [c.id for c in get_contacts(db, user, skip=skip, limit=args.limit)]
+
+    print(f"{'mode':<8}{'page 1 ms':>12}{f'page {args.page} ms':>16}")
+    offset_first = timed(lambda: get_contacts(db, user, skip=0, limit=args.limit), args.repeat)
+    offset_deep = timed(lambda: get_contacts(db, user, skip=skip, limit=args.limit), args.repeat)
+    print(f"{'offset':<8}{offset_first:>12.3f}{offset_deep:>16.3f}")
+    keyset_first = timed(lambda: get_contacts(db, user, limit=args.limit), args.repeat)
+    keyset_deep = timed(lambda: get_contacts(db, user, cursor=cursor, limit=args.limit), args.repeat)
+    print(f"{'keyset':<8}{keyset_first:>12.3f}{keyset_deep:>16.3f}")
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark of contact reads while the login endpoint is flooded with wrong passwords.
+
+Seeds the database like bench_load, then runs three scenarios of ``--seconds``
+each, with ``--readers`` clients reading contact pages in a loop:
+
+    reads only
+    reads during a login flood, rate limits off
+    reads during a login flood, rate limits on (the configured limits)
+
+The flood posts wrong passwords for the seeded accounts from one address at
+a fixed ``--flood-rps``, the same in both flood scenarios, with at most
+``--flooders`` attempts in flight (the attempts past that are counted as
+dropped). Without limits every attempt costs a user lookup and a bcrypt
+verification. The report gives the p50/p99 latency of the reads and the
+login responses by status as JSON.
+
+Usage:
+    python benchmarks/bench_rate_limit.py
+    python benchmarks/bench_rate_limit.py --users 20 --contacts 200 --readers 10 --flood-rps 500 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+
+from bench_load import PASSWORD, percentile, seed
+
+import httpx
+from main import app, lifespan
+from src.database.db import engine
+from src.services.ratelimit import LocalBuckets, load_limits, rate_limiter
+
+
+async def scenario(client: httpx.AsyncClient, args, emails: list, tokens: dict, flood: bool) -> dict:
+    deadline = time.perf_counter() + args.seconds
+    latencies, logins = [], Counter()
+
+    async def reader(i):
+        headers = {"Authorization": f"Bearer {tokens[emails[i % len(emails)]]}"}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get("/contacts/", params={"limit": 20}, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, (response.status_code, response.text)
+
+    async def attempt(n):
+        response = await client.post("/login", data={"username": emails[n % len(emails)],
+                                                     "password": "wrong-password"})
+        logins[response.status_code] += 1
+
+    async def flood_loop():
+        # Open loop: attempts are sent on schedule whether or not the earlier ones were answered
+        in_flight, n = set(), 0
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            if len(in_flight) < args.flooders:
+                task = asyncio.create_task(attempt(n))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            else:
+                logins["dropped"] += 1
+            n += 1
+            await asyncio.sleep(max(0.0, start + n / args.flood_rps - time.perf_counter()))
+        await asyncio.gather(*in_flight)
+
+    tasks = [reader(i) for i in range(args.readers)]
+    if flood:
+        tasks.append(flood_loop())
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    return {
+        "reads": len(latencies),
+        "read_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "read_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "logins": {str(code): count for code, count in sorted(logins.items(), key=str)},
+    }
+
+
+async def run(args) -> dict:
+    emails = seed(args.users, args.contacts)
+    limits = load_limits()
+    results = {}
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            rate_limiter.limits = {}
+            tokens = {}
+            for email in emails:
+                response = await client.post("/login", data={"username": email, "password": PASSWORD})
+                tokens[email] = response.json()["access_token"]
+
+            for name, flood, scenario_limits in (("reads_only", False, {}), ("flood_limits_off", True, {}),
+                                                 ("flood_limits_on", True, limits)):
+                rate_limiter.limits, rate_limiter.local = scenario_limits, LocalBuckets()
+                results[name] = await scenario(client, args, emails, tokens, flood)
+                print(f"{name:<18}{json.dumps(results[name])}", file=sys.stderr)
+    engine.dispose()
+
+    return {
+        "config": {"users": args.users, "contacts": args.contacts, "readers": args.readers,
+                   "flood_rps": args.flood_rps, "flooders": args.flooders, "seconds": args.seconds, "limits": limits},
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20, help="seeded users")
+    parser.add_argument("--contacts", type=int, default=100, help="seeded contacts per user")
+    parser.add_argument("--readers", type=int, default=5, help="concurrent contact readers")
+    parser.add_argument("--flood-rps", type=float, default=200, help="wrong-password logins sent per second")
+    parser.add_argument("--flooders", type=int, default=50, help="most login attempts in flight at once")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each scenario")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of the contacts search: the old unindexed ILIKE scan versus search_contacts.
+
+Seeds ``--contacts`` rows (1M by default) spread over ``--users`` users and times
+a few searches for one user. ``ilike`` is the query GET /contacts/?query= used
+to run: three ``ILIKE '%q%'`` predicates over the whole table. ``indexed`` is
+``crud.search_contacts`` (FTS5 on SQLite, pg_trgm GIN indexes on PostgreSQL).
+
+Usage:
+    python benchmarks/bench_search.py --contacts 1000000
+    SQLALCHEMY_DATABASE_URL=postgresql+psycopg2://... python benchmarks/bench_search.py
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, insert, or_
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from crud import search_contacts
+
+FIRST_NAMES = ["John", "Mary", "Peter", "Anna", "Oleksandr", "Olena", "Taras", "Iryna", "David", "Sophia"]
+LAST_NAMES = ["Smith", "Johnson", "Shevchenko", "Kovalenko", "Bondarenko", "Brown", "Walker", "Melnyk"]
+QUERIES = ["shevch", "john", "olena.kovalenko", "zzzz"]
+
+
+def seed(db, contacts: int, users: int):
+    db.execute(insert(User), [{"username": f"user{i}", "email": f"user{i}@example.com", "password": "x"}
+                              for i in range(users)])
+    db.commit()
+    user_ids = [u.id for u in db.query(User.id)]
+    rng = random.Random(14)
+    batch = []
+    for i in range(contacts):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        batch.append({"first_name": first_name, "last_name": last_name,
+                      "email": f"{first_name}.{last_name}.{i}@example.com".lower(),
+                      "phone_number": str(100_000_000 + i), "birthday": date(1990, 1, 1),
+                      "user_id": user_ids[i % users]})
+        if len(batch) == 10_000:
+            db.execute(insert(Contact), batch)
+            batch = []
+    if batch:
+        db.execute(insert(Contact), batch)
+    db.commit()
+
+
+def ilike_search(db, query: str, limit: int):
+    # The query GET /contacts/?query= ran before the search indexes
+    pattern = f"%{query}%"
+    return db.query(Contact).filter(
+        or_(Contact.first_name.ilike(pattern), Contact.last_name.ilike(pattern), Contact.email.ilike(pattern))
+    ).offset(0).limit(limit).all()
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--contacts", type=int, default=1_000_000, help="rows in the contacts table")
+    parser.add_argument("--users", type=int, default=1000, help="users owning the contacts")
+    parser.add_argument("--limit", type=int, default=10, help="page size")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    url = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    start = time.perf_counter()
+    seed(db, args.contacts, args.users)
+    print(f"seeded {args.contacts} contacts in {time.perf_counter() - start:.1f}s")
+    user = db.query(User).first()
+
+    print(f"{'query':<18}{'ilike ms':>12}{'indexed ms':>12}{'hits':>6}")
+    for query in QUERIES:
+        ilike_ms = timed(lambda: ilike_search(db, query, args.limit), args.repeat)
+        indexed_ms = timed(lambda: search_contacts(db, user, query, limit=args.limit), args.repeat)
+        hits = len(search_contacts(db, user, query, limit=args.limit))
+        print(f"{query:<18}{ilike_ms:>12.2f}{indexed_ms:>12.2f}{hits:>6}")
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
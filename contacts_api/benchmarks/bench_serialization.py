@@ -0,0 +1,104 @@
+"""
+Benchmark and CPU profile of the contact list serialization: response_model validation versus dump_contacts.
+
+Loads a ``--page``-row page of contacts (1000 by default) as ORM objects
+and serializes it both ways. ``validated`` is what FastAPI does for a route
+returning the rows with ``response_model=List[Contact]``: validate every
+row into a Contact (from attributes, including EmailStr) and dump the
+models to JSON. ``fast`` is ``schemas.dump_contacts``, which builds the
+models with ``model_construct`` and dumps them with the same TypeAdapter.
+Both produce the same bytes.
+
+With ``--profile`` the top functions of a cProfile run of each path are
+printed, sorted by ``--sort``.
+
+Usage:
+    python benchmarks/bench_serialization.py --page 1000
+    python benchmarks/bench_serialization.py --page 1000 --profile --top 15
+"""
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from src.schemas import contact_list_adapter, dump_contacts
+
+
+def load_page(page: int) -> list:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(username="bench", email="bench@example.com", password="x"))
+        db.commit()
+        db.execute(insert(Contact), [
+            {"first_name": f"First{i}", "last_name": f"Last{i}", "email": f"contact{i}@example.com",
+             "phone_number": str(100_000_000 + i), "birthday": date(1960, 1, 1) + timedelta(days=i % 14000),
+             "additional_data": None if i % 2 else f"note {i}", "user_id": 1}
+            for i in range(page)
+        ])
+        db.commit()
+        contacts = db.query(Contact).order_by(Contact.id).all()
+        db.expunge_all()
+    engine.dispose()
+    return contacts
+
+
+def validated(contacts: list) -> bytes:
+    # What FastAPI's serialize_response does with a response_model
+    return contact_list_adapter.dump_json(contact_list_adapter.validate_python(contacts, from_attributes=True))
+
+
+def timed(fn, contacts: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(contacts)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def profile(fn, contacts: list, repeat: int, sort: str, top: int) -> str:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for _ in range(repeat):
+        fn(contacts)
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats(sort).print_stats(top)
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--page", type=int, default=1000, help="contacts per page")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement, best is reported")
+    parser.add_argument("--profile", action="store_true", help="print a CPU profile of each path")
+    parser.add_argument("--sort", default="tottime", help="pstats sort key of the profiles")
+    parser.add_argument("--top", type=int, default=12, help="functions shown per profile")
+    args = parser.parse_args()
+
+    contacts = load_page(args.page)
+    assert validated(contacts) == dump_contacts(contacts)
+
+    validated_ms = timed(validated, contacts, args.repeat)
+    fast_ms = timed(dump_contacts, contacts, args.repeat)
+    print(f"{'page':>6}{'validated ms':>14}{'fast ms':>10}{'speedup':>9}")
+    print(f"{args.page:>6}{validated_ms:>14.2f}{fast_ms:>10.2f}{validated_ms / fast_ms:>8.1f}x")
+
+    if args.profile:
+        for name, fn in (("validated", validated), ("fast", dump_contacts)):
+            print(f"\n=== {name}: {args.repeat} pages of {args.page} contacts ===")
+            print(profile(fn, contacts, args.repeat, args.sort, args.top))
+
+
+if __name__ == "__main__":
+    main()
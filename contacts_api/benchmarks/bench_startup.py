@@ -0,0 +1,119 @@
+"""
+Benchmark of the time a fresh uvicorn server takes to answer its first requests.
+
+Builds a throwaway SQLite database with one user, then starts
+``uvicorn main:app`` ``--runs`` times with ``--workers`` workers and
+measures, for each start:
+
+    first_response_s   from spawning the server to its first HTTP answer (any status)
+    first_read_ms      latency of the first authenticated contact read
+    second_read_ms     latency of the next one
+
+``--app-dir`` points the server at another checkout of the application, so
+a tree from before a change can be measured with the same script. The report
+gives the median of each measurement as JSON.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --workers 4 --runs 10
+    python benchmarks/bench_startup.py --app-dir /tmp/before/contacts_api
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Configure the app before it is imported: a throwaway SQLite database and the in-memory Redis stand-in
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("REDIS_BACKEND", "memory")
+
+import httpx
+from src.database.db import SessionLocal, engine
+from src.database.models import User
+from src.database.schema import migrate
+from src.services.auth import auth_service
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+EMAIL = "startup@example.com"
+
+
+def seed() -> str:
+    migrate(os.environ["SQLALCHEMY_DATABASE_URL"])
+    with SessionLocal() as db:
+        if db.query(User).filter(User.email == EMAIL).first() is None:
+            db.add(User(username="startup", email=EMAIL, password="x", email_verified=True))
+            db.commit()
+    engine.dispose()
+    return asyncio.run(auth_service.create_access_token(data={"sub": EMAIL}))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(args, token: str) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--app-dir", args.app_dir,
+                               "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+                              cwd=args.app_dir)
+    try:
+        with httpx.Client(base_url=base_url) as client:
+            while True:
+                try:
+                    client.get("/healthz")
+                    break
+                except httpx.TransportError:
+                    if server.poll() is not None:
+                        raise RuntimeError(f"server exited with status {server.returncode}")
+                    if time.perf_counter() - started > args.timeout:
+                        raise RuntimeError("server did not answer in time")
+                    time.sleep(0.005)
+            first_response = time.perf_counter() - started
+
+            reads = []
+            for _ in range(2):
+                start_read = time.perf_counter()
+                response = client.get("/contacts/", headers={"Authorization": f"Bearer {token}"})
+                reads.append(time.perf_counter() - start_read)
+                response.raise_for_status()
+    finally:
+        server.terminate()
+        server.wait()
+    return {"first_response_s": first_response, "first_read_ms": reads[0] * 1000, "second_read_ms": reads[1] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--runs", type=int, default=5, help="server starts measured")
+    parser.add_argument("--app-dir", default=APP_DIR, help="directory of the application's main.py")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the first answer")
+    args = parser.parse_args()
+
+    token = seed()
+    runs = []
+    for _ in range(args.runs):
+        runs.append(start(args, token))
+        print(json.dumps({name: round(value, 3) for name, value in runs[-1].items()}), file=sys.stderr)
+    report = {
+        "config": {"workers": args.workers, "runs": args.runs, "app_dir": args.app_dir,
+                   "database": engine.dialect.name},
+        "median": {name: round(statistics.median(run[name] for run in runs), 3) for name in runs[0]},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
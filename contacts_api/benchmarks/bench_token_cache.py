@@ -0,0 +1,72 @@
+"""
+Microbenchmark of access token verification with and without the claims cache.
+
+``decode`` compares verifying a token with ``jwt.decode`` on every call with
+``auth_service.decode_token``, which verifies once and then serves the
+claims from the cache. ``get_current_user`` times the whole dependency with
+the user already in the user cache, once with the claims cache emptied
+before every call and once with it warm.
+
+Usage:
+    python benchmarks/bench_token_cache.py --iterations 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.setdefault("REDIS_BACKEND", "memory")
+
+from jose import jwt
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.cache import token_claims, user_cache
+
+EMAIL = "bench@example.com"
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def per_call_async_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def run(iterations: int):
+    token = await auth_service.create_access_token(data={"sub": EMAIL})
+    await user_cache.set_user(EMAIL, User(id=1, username="bench", email=EMAIL))
+
+    uncached = per_call_us(lambda: jwt.decode(token, auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM]),
+                           iterations)
+    cached = per_call_us(lambda: auth_service.decode_token(token), iterations)
+    print(f"{'operation':<18}{'uncached us':>14}{'cached us':>12}{'speedup':>10}")
+    print(f"{'decode':<18}{uncached:>14.2f}{cached:>12.2f}{uncached / cached:>9.1f}x")
+
+    async def cold_current_user():
+        token_claims.invalidate(token)
+        return await auth_service.get_current_user(token=token, db=None)
+
+    uncached = await per_call_async_us(cold_current_user, iterations)
+    cached = await per_call_async_us(lambda: auth_service.get_current_user(token=token, db=None), iterations)
+    print(f"{'get_current_user':<18}{uncached:>14.2f}{cached:>12.2f}{uncached / cached:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000, help="calls per measurement")
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
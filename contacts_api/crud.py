@@ -1,77 +1,521 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from libgravatar import Gravatar
-from datetime import datetime, timedelta
-from src.database.models import Contact, User
-from src.schemas import ContactCreate, UserModel
-
-
-def add_contact(db: Session, contact: ContactCreate, user: User):
-    db_contact = Contact(**contact.model_dump(), user_id=user.id)
-    db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
-    return db_contact
-
-
-def get_contact(db: Session, contact_id: int, user: User):
-    return db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
-
-
-def get_contacts(db: Session,  user: User, skip: int = 0, limit: int = 10, query: str = None):
-    if query:
-        return db.query(Contact).filter(
-            or_(
-                Contact.first_name.ilike(f"%{query}%"),
-                Contact.last_name.ilike(f"%{query}%"),
-                Contact.email.ilike(f"%{query}%")
-            )
-        ).offset(skip).limit(limit).all()
-    return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
-
-
-def refresh_contact(db: Session, user: User, contact_id: int, contact: ContactCreate):
-    db_contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
-    for key, value in contact.model_dump().items():
-        setattr(db_contact, key, value)
-    db.commit()
-    db.refresh(db_contact)
-    return db_contact
-
-
-def remove_contact(db: Session, contact_id: int, user: User):
-    db_contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
-    db.delete(db_contact)
-    db.commit()
-    return db_contact
-
-def get_upcoming_birthdays(db: Session, user: User):
-    today = datetime.now().date()
-    end_date = today + timedelta(days=7)
-    return db.query(Contact).filter(
-        func.extract('month', Contact.birthday) == today.month,
-        func.extract('day', Contact.birthday) >= today.day,
-    ).union(
-        db.query(Contact).filter(
-            func.extract('month', Contact.birthday) == end_date.month,
-            func.extract('day', Contact.birthday) <= end_date.day,
-        )
-    ).filter(
-        Contact.user_id == user.id
-    ).all()
-
-async def get_user_by_email(email: str, db: Session, user: User) -> User:
-    return db.query(User).filter(User.email == email, Contact.user_id == user.id).first()
-
-async def create_user(body: UserModel, db: Session, user: User) -> User:
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        print(e)
-    new_user = User(**body.model_dump(), avatar=avatar) # dict don't work 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+from sqlalchemy.orm import Session
+from sqlalchemy import or_, func, table, column, literal_column, case, select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
+from datetime import date, datetime, timedelta
+import calendar
+import base64
+import binascii
+import csv
+import io
+import json
+import time
+from src.database.db import stream_rows
+from src.database.models import Contact, User, birthday_key
+from src.database.shards import ContactsMoved, contact_ids
+from src.schemas import ContactCreate, ContactFilter, UserModel
+
+# Import and export configuration
+IMPORT_MAX_ERRORS = 1000
+EXPORT_FIELDS = ("id", "first_name", "last_name", "email", "phone_number", "birthday", "additional_data")
+
+
+def _bump_contacts_version(db: Session, user: User):
+    # Runs in the transaction of the change, so a committed change always comes with a new version.
+    # The row only matches while it still places the contacts in this database: when they were moved
+    # to another shard meanwhile, the change is not committed here
+    placed = User.shard.is_(None) if user.shard is None else User.shard == user.shard
+    result = db.execute(update(User).where(User.id == user.id, placed)
+                        .values(contacts_version=User.contacts_version + 1)
+                        .execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        db.rollback()
+        raise ContactsMoved(f"The contacts of user {user.id} moved to another shard")
+
+
+async def reserve_contact_ids(count: int):
+    """
+    Reserve the IDs a write of ``count`` contacts needs before it starts, when there are shards.
+
+    Args:
+        count (int): Number of contacts the write inserts at most, or per batch.
+    """
+    if contact_ids is not None:
+        await contact_ids.reserve(count)
+
+
+def get_contacts_version(db: Session, user: User) -> int:
+    """
+    Get the version of the user's contacts, bumped by every change to them.
+
+    Args:
+        db (Session): Database session.
+        user (User): Owner of the contacts.
+
+    Returns:
+        int: The version.
+    """
+    return db.scalar(select(User.contacts_version).where(User.id == user.id)) or 0
+
+
+def _commit_returned(db: Session, user: User, db_contact: Contact):
+    # The RETURNING row already holds every column; detach it so the commit doesn't expire it into a reload
+    if db_contact is not None:
+        _bump_contacts_version(db, user)
+        db.expunge(db_contact)
+    db.commit()
+    return db_contact
+
+
+def add_contact(db: Session, contact: ContactCreate, user: User):
+    values = {**contact.model_dump(), "birthday_key": birthday_key(contact.birthday), "user_id": user.id}
+    if contact_ids is not None:
+        values["id"], = contact_ids.take(1)
+    db_contact = db.scalars(insert(Contact).values(**values).returning(Contact)).one()
+    return _commit_returned(db, user, db_contact)
+
+
+def get_contact(db: Session, contact_id: int, user: User):
+    return db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
+
+
+def encode_cursor(user_id: int, contact_id: int) -> str:
+    """
+    Encode the position after a contact into an opaque pagination cursor.
+
+    Args:
+        user_id (int): Owner of the contact.
+        contact_id (int): ID of the last contact of the page.
+
+    Returns:
+        str: URL-safe cursor.
+    """
+    raw = json.dumps([user_id, contact_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, user: User) -> int:
+    """
+    Decode a pagination cursor issued to the user.
+
+    Args:
+        cursor (str): Cursor produced by encode_cursor.
+        user (User): Current user.
+
+    Returns:
+        int: ID of the last contact of the previous page.
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued to another user.
+    """
+    try:
+        user_id, contact_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (TypeError, binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if user_id != user.id or not isinstance(contact_id, int):
+        raise ValueError("Invalid cursor")
+    return contact_id
+
+
+def search_contacts(db: Session, user: User, query: str, skip: int = 0, limit: int = 10):
+    """
+    Search the user's contacts by first name, last name or email, best matches first.
+
+    On PostgreSQL the substring match is served by the pg_trgm GIN indexes and
+    ranked by trigram similarity. On SQLite it goes through the contacts_fts
+    FTS5 trigram table, restricted to the user by its owner column, and is
+    ranked by bm25. Other databases, and queries too short for
+    trigrams, fall back to a scan of the user's own contacts.
+
+    Args:
+        db (Session): Database session.
+        user (User): Owner of the contacts.
+        query (str): Text to look for.
+        skip (int): Number of results to skip.
+        limit (int): Maximum number of results to return.
+
+    Returns:
+        list: Matching contacts.
+    """
+    dialect = db.get_bind().dialect.name
+    pattern = f"%{query}%"
+    contacts = db.query(Contact).filter(Contact.user_id == user.id)
+    if dialect == "sqlite" and len(query) >= 3:
+        fts = table("contacts_fts", column("rowid"), column("rank"))
+        phrase = '"' + query.replace('"', '""') + '"'
+        # The owner column narrows the match to the user's rows inside the FTS index itself
+        expression = f'owner : "[{user.id}]" AND {{first_name last_name email}} : {phrase}'
+        contacts = contacts.join(fts, fts.c.rowid == Contact.id).filter(
+            literal_column("contacts_fts").match(expression)
+        ).order_by(fts.c.rank, Contact.id)
+    else:
+        contacts = contacts.filter(
+            or_(
+                Contact.first_name.ilike(pattern),
+                Contact.last_name.ilike(pattern),
+                Contact.email.ilike(pattern)
+            )
+        )
+        if dialect == "postgresql":
+            contacts = contacts.order_by(func.greatest(
+                func.similarity(Contact.first_name, query),
+                func.similarity(Contact.last_name, query),
+                func.similarity(Contact.email, query),
+            ).desc(), Contact.id)
+        else:
+            contacts = contacts.order_by(Contact.id)
+    return contacts.offset(skip).limit(limit).all()
+
+
+def get_contacts(db: Session,  user: User, skip: int = 0, limit: int = 10, query: str = None,
+                 cursor: str = None):
+    if query:
+        if cursor:
+            raise ValueError("Search results are ranked and can't be paged with a cursor")
+        return search_contacts(db, user, query, skip=skip, limit=limit)
+    contacts = db.query(Contact).filter(Contact.user_id == user.id).order_by(Contact.id)
+    if cursor:
+        # Keyset pagination: an index range scan on (user_id, id) instead of skipping rows
+        contacts = contacts.filter(Contact.id > decode_cursor(cursor, user))
+    else:
+        contacts = contacts.offset(skip)
+    return contacts.limit(limit).all()
+
+
+def refresh_contact(db: Session, user: User, contact_id: int, contact: ContactCreate):
+    values = {**contact.model_dump(), "birthday_key": birthday_key(contact.birthday)}
+    db_contact = db.scalars(
+        update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).values(**values)
+        .returning(Contact).execution_options(synchronize_session=False)
+    ).one_or_none()
+    return _commit_returned(db, user, db_contact)
+
+
+def remove_contact(db: Session, contact_id: int, user: User):
+    db_contact = db.scalars(
+        delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id)
+        .returning(Contact).execution_options(synchronize_session=False)
+    ).one_or_none()
+    return _commit_returned(db, user, db_contact)
+
+def _selection_criteria(user: User, ids: list = None, contact_filter: ContactFilter = None) -> list:
+    criteria = [Contact.user_id == user.id]
+    if ids is not None:
+        criteria.append(Contact.id.in_(ids))
+    if contact_filter is not None:
+        fields = contact_filter.model_dump(exclude_none=True)
+        birthday_from, birthday_to = fields.pop("birthday_from", None), fields.pop("birthday_to", None)
+        criteria.extend(getattr(Contact, name) == value for name, value in fields.items())
+        if birthday_from is not None:
+            criteria.append(Contact.birthday >= birthday_from)
+        if birthday_to is not None:
+            criteria.append(Contact.birthday <= birthday_to)
+    if len(criteria) == 1:
+        raise ValueError("ids or a non-empty filter is required")
+    return criteria
+
+
+def bulk_update_contacts(db: Session, user: User, changes: dict, ids: list = None,
+                         contact_filter: ContactFilter = None) -> dict:
+    """
+    Update the selected contacts of a user with one UPDATE statement.
+
+    Contacts are selected by ``ids``, by ``contact_filter`` or by both; ids
+    of other users' contacts are ignored.
+
+    Args:
+        db (Session): Database session.
+        user (User): Owner of the contacts.
+        changes (dict): Column values to set.
+        ids (list): IDs of the contacts to update.
+        contact_filter (ContactFilter): Field values the contacts must match.
+
+    Returns:
+        dict: Number and IDs of the updated contacts.
+
+    Raises:
+        ValueError: Neither ids nor a non-empty filter were given.
+    """
+    criteria = _selection_criteria(user, ids, contact_filter)
+    if "birthday" in changes:
+        changes = {**changes, "birthday_key": birthday_key(changes["birthday"])}
+    if not changes:
+        updated = db.scalars(select(Contact.id).filter(*criteria)).all()
+    else:
+        updated = db.scalars(update(Contact).where(*criteria).values(**changes).returning(Contact.id)
+                             .execution_options(synchronize_session=False)).all()
+        if updated:
+            _bump_contacts_version(db, user)
+        db.commit()
+    return {"count": len(updated), "ids": sorted(updated)}
+
+
+def bulk_delete_contacts(db: Session, user: User, ids: list = None, contact_filter: ContactFilter = None) -> dict:
+    """
+    Delete the selected contacts of a user with one DELETE statement.
+
+    Args:
+        db (Session): Database session.
+        user (User): Owner of the contacts.
+        ids (list): IDs of the contacts to delete.
+        contact_filter (ContactFilter): Field values the contacts must match.
+
+    Returns:
+        dict: Number and IDs of the deleted contacts.
+
+    Raises:
+        ValueError: Neither ids nor a non-empty filter were given.
+    """
+    criteria = _selection_criteria(user, ids, contact_filter)
+    deleted = db.scalars(delete(Contact).where(*criteria).returning(Contact.id)
+                         .execution_options(synchronize_session=False)).all()
+    if deleted:
+        _bump_contacts_version(db, user)
+    db.commit()
+    return {"count": len(deleted), "ids": sorted(deleted)}
+
+def get_upcoming_birthdays(db: Session, user: User, days: int = 7, today: date = None):
+    """
+    Get the user's contacts whose birthday falls within the next ``days`` days, soonest first.
+
+    The window is matched on the indexed birthday_key column, so it is one
+    index range scan per user (two ranges when it wraps from December to
+    January). In years without February 29, birthdays on February 29 are
+    celebrated on March 1.
+
+    Args:
+        db (Session): Database session.
+        user (User): Owner of the contacts.
+        days (int): Length of the window after today.
+        today (date): First day of the window. Defaults to the current date.
+
+    Returns:
+        list: Contacts with upcoming birthdays.
+    """
+    today = today or datetime.now().date()
+    contacts = db.query(Contact).filter(Contact.user_id == user.id, Contact.birthday_key.isnot(None))
+    if days >= 365:
+        return contacts.order_by(Contact.birthday_key).all()
+
+    end_date = today + timedelta(days=days)
+    start_key, end_key = birthday_key(today), birthday_key(end_date)
+    if start_key == 301 and not calendar.isleap(today.year):
+        start_key = 229
+    if start_key <= end_key:
+        return contacts.filter(Contact.birthday_key.between(start_key, end_key)).order_by(
+            Contact.birthday_key
+        ).all()
+    # The window wraps into the next year: the rest of this year, then the start of the next one
+    return contacts.filter(
+        or_(Contact.birthday_key >= start_key, Contact.birthday_key <= end_key)
+    ).order_by(case((Contact.birthday_key >= start_key, 0), else_=1), Contact.birthday_key).all()
+
+def read_import_rows(stream, file_format: str):
+    """
+    Read records one at a time from an uploaded CSV or NDJSON file.
+
+    Args:
+        stream (BinaryIO): The uploaded file.
+        file_format (str): "csv" (with a header row) or "ndjson".
+
+    Yields:
+        tuple: Line number and the record as a dict, or the error message for an unreadable line.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if file_format == "csv":
+            reader = csv.DictReader(text)
+            for record in reader:
+                # Empty cells are missing values
+                yield reader.line_num, {key: value or None for key, value in record.items() if key}
+        else:
+            for line_num, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_num, f"invalid JSON: {e.msg}"
+                    continue
+                yield line_num, record if isinstance(record, dict) else "expected a JSON object"
+    finally:
+        text.detach()
+
+
+def _upsert_statement(db: Session, user: User):
+    # The dialect's own insert, imported here so the PostgreSQL dialect is only loaded where it is used
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(Contact)
+    # Only the user's own contacts are updated; an email owned by another user is left alone
+    return stmt.on_conflict_do_update(
+        index_elements=[Contact.email],
+        set_={name: stmt.excluded[name] for name in (*ContactCreate.model_fields, "birthday_key")},
+        where=Contact.user_id == user.id,
+    ).returning(Contact.email)
+
+
+def _upsert_batch(db: Session, user: User, batch: dict) -> tuple[int, list]:
+    # One transaction per batch; on a conflict the batch is replayed row by row to find the bad rows
+    stmt = _upsert_statement(db, user)
+    errors = []
+    if contact_ids is not None:
+        # A replayed row keeps its ID; an updated contact keeps the one it has
+        missing = [values for _, values in batch.values() if "id" not in values]
+        for values, contact_id in zip(missing, contact_ids.take(len(missing))):
+            values["id"] = contact_id
+    try:
+        upserted = set(db.scalars(stmt, [values for _, values in batch.values()]).all())
+        if upserted:
+            _bump_contacts_version(db, user)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        upserted = set()
+        for line, values in batch.values():
+            try:
+                with db.begin_nested():
+                    upserted.update(db.scalars(stmt, [values]).all())
+            except IntegrityError:
+                errors.append((line, ["phone_number: a contact with this phone number already exists"]))
+        if upserted:
+            _bump_contacts_version(db, user)
+        db.commit()
+    failed = {line for line, _ in errors}
+    for email, (line, _) in batch.items():
+        if email not in upserted and line not in failed:
+            errors.append((line, ["email: a contact with this email already exists"]))
+    return len(upserted), errors
+
+
+def import_contacts(db: Session, user: User, stream, file_format: str = "csv", batch_size: int = 1000):
+    """
+    Import contacts from a CSV or NDJSON file, inserting or updating them by email.
+
+    Rows are validated against ContactCreate and written in batches of
+    ``batch_size`` rows, each batch as one multi-row INSERT ... ON CONFLICT
+    DO UPDATE in its own transaction. The file is read as it goes, so memory
+    use does not depend on its size.
+
+    Args:
+        db (Session): Database session.
+        user (User): Owner of the contacts.
+        stream (BinaryIO): The uploaded file.
+        file_format (str): "csv" or "ndjson".
+        batch_size (int): Rows per batch.
+
+    Returns:
+        dict: Row counts, timing and the errors of the rejected rows.
+    """
+    start = time.perf_counter()
+    total = imported = failed = 0
+    errors = []
+    batch = {}
+
+    def report(line: int, messages: list):
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"row": line, "errors": messages})
+
+    def flush():
+        nonlocal imported
+        count, batch_errors = _upsert_batch(db, user, batch)
+        imported += count
+        for line, messages in sorted(batch_errors):
+            report(line, messages)
+        batch.clear()
+
+    for line, record in read_import_rows(stream, file_format):
+        total += 1
+        if isinstance(record, str):
+            report(line, [record])
+            continue
+        try:
+            contact = ContactCreate.model_validate(record)
+        except ValidationError as e:
+            report(line, [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()])
+            continue
+        values = {**contact.model_dump(), "birthday_key": birthday_key(contact.birthday), "user_id": user.id}
+        # A later row with the same email replaces the earlier one, like it would across batches
+        batch.pop(contact.email, None)
+        batch[contact.email] = (line, values)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    seconds = time.perf_counter() - start
+    return {"total": total, "imported": imported, "failed": failed, "seconds": round(seconds, 3),
+            "rows_per_second": round(total / seconds, 1) if seconds else 0.0, "errors": errors}
+
+def format_export_rows(rows, file_format: str, header: bool = False) -> str:
+    """
+    Format exported contact rows as CSV or NDJSON.
+
+    Args:
+        rows (list): Rows with the columns of EXPORT_FIELDS.
+        file_format (str): "csv" or "ndjson".
+        header (bool): Whether to start the CSV with the header row.
+
+    Returns:
+        str: The formatted rows.
+    """
+    buffer = io.StringIO()
+    if file_format == "csv":
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(EXPORT_FIELDS)
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            record = dict(zip(EXPORT_FIELDS, row))
+            record["birthday"] = record["birthday"].isoformat()
+            buffer.write(json.dumps(record) + "\n")
+    return buffer.getvalue()
+
+
+async def export_contacts(user: User, file_format: str = "csv", chunk_size: int = 1000, bind=None):
+    """
+    Export all contacts of a user as CSV or NDJSON, chunk by chunk.
+
+    Rows come from a server-side cursor and each chunk is encoded and
+    yielded as soon as it is fetched, so memory use does not depend on the
+    number of contacts.
+
+    Args:
+        user (User): Owner of the contacts.
+        file_format (str): "csv" or "ndjson".
+        chunk_size (int): Rows per yielded chunk.
+        bind (Engine | AsyncEngine): Engine of the shard holding the contacts, None for the primary.
+
+    Yields:
+        bytes: The next part of the file.
+    """
+    stmt = select(*(getattr(Contact, name) for name in EXPORT_FIELDS)).filter(
+        Contact.user_id == user.id
+    ).order_by(Contact.id)
+    if file_format == "csv":
+        yield format_export_rows([], file_format, header=True).encode()
+    async for rows in stream_rows(stmt, chunk_size, bind):
+        yield format_export_rows(rows, file_format).encode()
+
+async def get_user_by_email(email: str, db: Session, user: User) -> User:
+    return db.query(User).filter(User.email == email, Contact.user_id == user.id).first()
+
+async def create_user(body: UserModel, db: Session, user: User) -> User:
+    from libgravatar import Gravatar
+
+    avatar = None
+    try:
+        g = Gravatar(body.email)
+        avatar = g.get_image()
+    except Exception as e:
+        print(e)
+    new_user = User(**body.model_dump(), avatar=avatar) # dict don't work 
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
     return new_user
\ No newline at end of file
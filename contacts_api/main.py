@@ -1,31 +1,98 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Response, Query, Security, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm, HTTPBearer
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import logging
 from typing import List
-from src.database.db import engine, get_db
-from src.schemas import ContactCreate, Contact, UserModel, UserResponse, TokenModel
-from crud import add_contact, get_contacts, get_contact, refresh_contact, remove_contact, get_upcoming_birthdays
+from src.database.db import get_session, run_db, pool_status, warm_pool, ping_db, QueryStatsMiddleware
+from src.database.replicas import read_router
+from src.database.shards import shard_router, ContactsMoved
+from src.schemas import ContactCreate, Contact, dump_contacts, UserModel, UserResponse, TokenModel, ContactImportResult, \
+    ContactSelection, ContactBulkUpdate, ContactBulkResult, SessionModel
+from crud import add_contact, get_contacts, get_contact, refresh_contact, remove_contact, get_upcoming_birthdays, encode_cursor, \
+    import_contacts, export_contacts, bulk_update_contacts, bulk_delete_contacts, get_contacts_version, \
+    reserve_contact_ids
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.database.models import Base, User
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from src.services.sessions import refresh_tokens
+from src.services.ratelimit import rate_limited, rate_limiter
+from src.services.avatars import avatar_pipeline, AVATAR_STORAGE, AVATAR_LOCAL_DIR, AVATAR_LOCAL_URL
+from src.services.cache import user_cache
+from src.services.hashing import hashing_executor
+from src.services.mail import email_outbox
+from src.services.metrics import metrics, MetricsMiddleware
+from src.services import redis_client
+from src.database.models import User
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import smtplib
-import cloudinary.uploader
-import redis
 
-# Redis configuration
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
-USER_CACHE_KEY_PREFIX = "user:"
-USER_CACHE_EXPIRE_SECONDS = 3600
+logger = logging.getLogger(__name__)
+
+
+async def warm_up():
+    """
+    Open the database and Redis pool connections before the worker takes requests.
+
+    A backend that can't be reached doesn't stop the worker from starting;
+    /readyz reports it until it answers.
+    """
+    results = await asyncio.gather(warm_pool(), redis_client.warm_redis(), return_exceptions=True)
+    for name, result in zip(("database", "redis"), results):
+        if isinstance(result, BaseException):
+            logger.warning("Could not warm up the %s pool: %r", name, result)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the shared clients and warm their pools on startup, close them on shutdown.
+
+    The schema is not touched here: it is managed with Alembic, see src.database.schema.
+
+    Args:
+        app (FastAPI): The application.
+    """
+    await redis_client.init_redis()
+    await warm_up()
+    await user_cache.start()
+    await email_outbox.start()
+    await metrics.start()
+    yield
+    await metrics.stop()
+    await avatar_pipeline.stop()
+    await email_outbox.stop()
+    await user_cache.stop()
+    await redis_client.close_redis()
+    await read_router.dispose()
+    await shard_router.dispose()
+    await asyncio.to_thread(hashing_executor.shutdown)
 
 # FastAPI application initialization
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(ContactsMoved)
+async def contacts_moved_handler(request, exc: ContactsMoved):
+    """
+    Answer a write that raced a move of the user's contacts to another shard: nothing was changed, retry.
+
+    Args:
+        request (Request): The request.
+        exc (ContactsMoved): The error.
 
-# Database initialization
-Base.metadata.create_all(bind=engine)
+    Returns:
+        JSONResponse: 503 with a Retry-After header.
+    """
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"},
+                        content={"detail": "Contacts are moving to another shard, retry"})
+
+# Avatars of the local storage backend are served by the application
+if AVATAR_STORAGE == "local":
+    app.mount(AVATAR_LOCAL_URL, StaticFiles(directory=AVATAR_LOCAL_DIR, check_dir=False), name="avatars")
 
 # Middleware for CORS
 app.add_middleware(
@@ -36,31 +103,134 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Function to cache user data
-async def get_user_from_cache_or_db(email: str, db_session: Session):
+# Statement count and database time of each request in the Server-Timing header
+app.add_middleware(QueryStatsMiddleware)
+
+# Latency, size and status metrics of each request, served at /metrics
+app.add_middleware(MetricsMiddleware)
+
+
+def collect_gauges():
+    pool = pool_status()
+    cache = user_cache.stats()
+    outbox = email_outbox.stats()
+    return [
+        ("db_pool_size", (), pool["size"]),
+        ("db_pool_checked_out", (), pool["checked_out"]),
+        ("db_pool_overflow", (), pool["overflow"]),
+        ("user_cache_requests_total", ("local_hit",), cache["local_hits"]),
+        ("user_cache_requests_total", ("redis_hit",), cache["redis_hits"]),
+        ("user_cache_requests_total", ("miss",), cache["misses"]),
+        ("user_cache_size", (), cache["local_size"]),
+        ("rate_limit_rejections_total", (), rate_limiter.rejected),
+        ("db_read_sessions_total", ("primary",), read_router.reads["primary"]),
+        ("db_read_sessions_total", ("replica",), read_router.reads["replica"]),
+        *(("db_shard_sessions_total", (name,), count) for name, count in shard_router.sessions.items()),
+        ("email_outbox_depth", (), outbox["depth"]),
+        ("email_outbox_retrying", (), outbox["retrying"]),
+        *(("email_outbox_messages_total", (result,), outbox[result]) for result in ("sent", "failed", "dropped")),
+        ("email_outbox_connections_total", (), outbox["connections"]),
+    ]
+
+
+metrics.add_collector(collect_gauges)
+
+# Clients may keep contacts but must revalidate them with If-None-Match before use
+CONTACTS_CACHE_CONTROL = "private, no-cache"
+
+
+def contacts_etag(user_id: int, version: int, *params) -> str:
     """
-    Get user data from cache or database.
-    
+    Build the strong ETag of a contacts response.
+
     Args:
-        email (str): The email of the user.
-        db_session (Session): SQLAlchemy database session.
+        user_id (int): Owner of the contacts.
+        version (int): Version of the owner's contacts.
+        *params: Request parameters the response depends on.
 
     Returns:
-        str: Cached user data or user data from the database.
+        str: The quoted entity tag.
+    """
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+    return f'"{user_id}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
     """
-    cached_user_data = redis_client.get(USER_CACHE_KEY_PREFIX + email)
-    if cached_user_data:
-        return cached_user_data
-    user = await repository_users.get_user_by_email(email, db_session)
-    redis_client.setex(USER_CACHE_KEY_PREFIX + email, USER_CACHE_EXPIRE_SECONDS, user)
-    return user
+    Check an If-None-Match header against an entity tag, with the weak comparison RFC 9110 asks for.
+
+    Args:
+        if_none_match (str | None): The header value.
+        etag (str): The current entity tag.
+
+    Returns:
+        bool: True if the client's copy is current.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag, "Cache-Control": CONTACTS_CACHE_CONTROL})
+
+async def get_contacts_db(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Session dependency of the routes that change contacts: a session on the shard holding the user's contacts.
+
+    Args:
+        current_user (User): Current authenticated user.
+
+    Yields:
+        Session | AsyncSession: Database session.
+    """
+    async for db in shard_router.session(current_user.shard):
+        yield db
+
+
+async def get_read_db(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Session dependency of the read-only routes: for contacts on the primary a read replica session,
+    or the primary's while the user's own writes may not have reached the replicas; for contacts
+    on a shard the shard's.
+
+    Args:
+        current_user (User): Current authenticated user.
+
+    Yields:
+        Session | AsyncSession: Database session.
+    """
+    if current_user.shard is not None:
+        async for db in shard_router.session(current_user.shard):
+            yield db
+        return
+    async for db in read_router.session(current_user.id):
+        yield db
+
+
+async def pin_to_primary(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Dependency of the routes that change contacts: the user's reads go to the primary until the replicas have caught up.
+
+    Args:
+        current_user (User): Current authenticated user.
+    """
+    await read_router.pin(current_user.id)
+    yield
+    # Pinned again when the write is done, for writes that take longer than the window
+    await read_router.pin(current_user.id)
 
 # Signup route
-@app.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, db: Session = Depends(get_db)):
+@app.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED,
+          dependencies=[Depends(rate_limited("signup", "email"))])
+async def signup(body: UserModel, db: Session = Depends(get_session)):
     """
     Signup route for creating a new user account.
 
+    Requests are rate limited per client IP and per email before any work is done.
+
     Args:
         body (UserModel): Request body containing user data.
         db (Session): SQLAlchemy database session.
@@ -71,23 +241,49 @@ async def signup(body: UserModel, db: Session = Depends(get_db)):
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash_async(body.password)
     new_user = await repository_users.create_user(body, db)
 
     # Generating and sending email confirmation
-    confirmation_link = f"http://example.com/confirm_email?token={new_user.email_verification_token}"
+    confirmation_link = f"http://example.com/confirm_email?token={new_user.email}"
     send_confirmation_email(body.email, confirmation_link)
 
     return {"user": new_user, "detail": "User successfully created"}
 
+async def issue_tokens(email: str, session: dict) -> dict:
+    """
+    Create an access token and the next refresh token of a session family.
+
+    Args:
+        email (str): The user's email.
+        session (dict): ``fam`` and ``jti`` claims from the refresh token store.
+
+    Returns:
+        dict: Access token, refresh token and token type.
+    """
+    access_token = await auth_service.create_access_token(data={"sub": email})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, **session},
+                                                            expires_delta=refresh_tokens.expire_seconds)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
 # Login route
-@app.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@app.post("/login", response_model=TokenModel, dependencies=[Depends(rate_limited("login", "username"))])
+async def login(body: OAuth2PasswordRequestForm = Depends(), user_agent: str = Header(None),
+                db: Session = Depends(get_session)):
     """
     Login route for user authentication.
 
+    Requests are rate limited per client IP and per account before the user
+    is loaded or the password is checked, and answered with 429 and
+    Retry-After when over the limit.
+
+    Every login starts a session of its own, so a user can be logged in on
+    several devices. The device is named by the form's ``client_id`` or the
+    User-Agent header.
+
     Args:
         body (OAuth2PasswordRequestForm): Request body containing login credentials.
+        user_agent (str): User-Agent header of the client.
         db (Session): SQLAlchemy database session.
 
     Returns:
@@ -96,23 +292,25 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password_async(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
-    # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+    session = await refresh_tokens.start(user.email, body.client_id or user_agent)
+    return await issue_tokens(user.email, session)
 
 # HTTPBearer for authentication
 security = HTTPBearer()
 
 # Refresh token route
-@app.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = security, db: Session = Depends(get_db)):
+@app.get('/refresh_token', response_model=TokenModel, dependencies=[Depends(rate_limited("refresh_token"))])
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security),
+                        db: Session = Depends(get_session)):
     """
     Route for refreshing access token using refresh token.
 
+    The refresh token is rotated: the presented one stops working and a new
+    one is returned. Presenting a refresh token that was already used ends
+    its session. Nothing is written to the database.
+
     Args:
         credentials (HTTPAuthorizationCredentials): HTTP authorization credentials.
         db (Session): SQLAlchemy database session.
@@ -121,46 +319,83 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = security, db
         dict: Response containing new access token, new refresh token, and token type.
     """
     token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    claims = auth_service.decode_refresh_claims(token)
+    email = claims["sub"]
+    session = await refresh_tokens.rotate(claims)
+    if session is None:
+        auth_service.revoke_token(token)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    user = await user_cache.get_user(email, lambda: repository_users.get_user_by_email(email, db))
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    return await issue_tokens(email, session)
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+# Route for listing the user's sessions
+@app.get("/sessions", response_model=List[SessionModel])
+async def read_sessions(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Route for listing the devices the user is logged in on.
+
+    Args:
+        current_user (User): Current authenticated user.
+
+    Returns:
+        list: Sessions with their id, device and creation and last refresh times.
+    """
+    return await refresh_tokens.sessions(current_user.email)
+
+# Route for ending a session
+@app.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(session_id: str, current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Route for logging a device out: the refresh tokens of the session stop working.
+
+    Args:
+        session_id (str): Id of the session.
+        current_user (User): Current authenticated user.
+    """
+    if not await refresh_tokens.revoke(current_user.email, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
 
 # Route for updating user avatar
-@app.put("/avatar", status_code=status.HTTP_200_OK)
+@app.put("/avatar", status_code=status.HTTP_202_ACCEPTED)
 async def update_avatar(
-    file: UploadFile = File(...), 
-    db: Session = Depends(get_db),
+    file: UploadFile = File(...),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     Route for updating user avatar.
 
+    The image is resized and stored in the background; the user's avatar
+    changes when that is done. Progress is reported by ``GET /avatar/status``.
+
     Args:
         file (UploadFile): Uploaded file containing the new avatar image.
-        db (Session): SQLAlchemy database session.
         current_user (User): Current authenticated user.
 
     Returns:
-        dict: Response indicating the success of the avatar update.
+        dict: Response with the pending status and the id of the avatar job.
     """
-    # Upload file to Cloudinary
-    response = cloudinary.uploader.upload(file.file)
-    # Update user avatar URL in the database
-    user = await repository_users.get_user_by_email(current_user.email, db)
-    user.avatar = response["secure_url"]
-    db.commit()
-    return {"detail": "Avatar updated successfully"}
+    job = await avatar_pipeline.submit(current_user, file)
+    return {"detail": "Avatar is being processed", **job}
+
+# Route for reading the avatar processing status
+@app.get("/avatar/status")
+async def avatar_status(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Route for reading the state of the user's latest avatar upload.
+
+    Args:
+        current_user (User): Current authenticated user.
+
+    Returns:
+        dict: Status ("pending", "ready", "failed" or "none"), with the thumbnail URLs when ready.
+    """
+    return await avatar_pipeline.status(current_user.id)
 
 # Confirm email route
 @app.get("/confirm_email")
-async def confirm_email(token: str, db: Session = Depends(get_db)):
+async def confirm_email(token: str, db: Session = Depends(get_session)):
     """
     Route for confirming user email.
 
@@ -179,37 +414,19 @@ async def confirm_email(token: str, db: Session = Depends(get_db)):
 # Function to send confirmation email
 def send_confirmation_email(email, confirmation_link):
     """
-    Function to send confirmation email.
+    Function to queue the confirmation email in the outbox.
 
     Args:
         email (str): Email address of the recipient.
         confirmation_link (str): Link for confirming email address.
     """
-    # Email configuration
-    sender_email = "your_email@example.com"
-    receiver_email = email
-    password = "your_email_password"
-
-    # Create email message
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = receiver_email
-    msg['Subject'] = "Confirmation Email"
-
-    # Message body
     body = f"Please click the following link to confirm your email address: {confirmation_link}"
-    msg.attach(MIMEText(body, 'plain'))
-
-    # Send email message through SMTP server
-    with smtplib.SMTP('smtp.gmail.com', 587) as server:
-        server.starttls()
-        server.login(sender_email, password)
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
+    email_outbox.enqueue(email, "Confirmation Email", body)
 
 # Create contact
-@app.post("/contacts/", response_model=Contact, status_code=status.HTTP_201_CREATED)
-def create_contact(contact: ContactCreate, db: Session = Depends(get_db),
+@app.post("/contacts/", response_model=Contact, status_code=status.HTTP_201_CREATED,
+          dependencies=[Depends(pin_to_primary)])
+async def create_contact(contact: ContactCreate, db: Session = Depends(get_contacts_db),
                    current_user: User = Depends(auth_service.get_current_user)):
     """
     Route for creating a new contact.
@@ -222,52 +439,192 @@ def create_contact(contact: ContactCreate, db: Session = Depends(get_db),
     Returns:
         dict: Response containing the created contact data.
     """
-    return add_contact(db=db, contact=contact, user=current_user)
+    await reserve_contact_ids(1)
+    return await run_db(db, add_contact, contact=contact, user=current_user)
+
+# Import contacts from a file
+@app.post("/contacts/import", response_model=ContactImportResult, dependencies=[Depends(pin_to_primary)])
+async def import_contacts_file(
+    file: UploadFile = File(...), file_format: str = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+    batch_size: int = Query(1000, ge=1, le=10000), db: Session = Depends(get_contacts_db),
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """
+    Route for importing contacts from a CSV or NDJSON file.
+
+    Contacts are inserted, or updated when the user already has a contact
+    with the same email. Invalid rows are skipped and reported.
+
+    Args:
+        file (UploadFile): CSV file with a header row, or NDJSON file with one contact per line.
+        file_format (str): "csv" or "ndjson". Guessed from the file name when not given.
+        batch_size (int): Number of rows written per transaction.
+        db (Session): SQLAlchemy database session.
+        current_user (User): Current authenticated user.
+
+    Returns:
+        dict: Row counts, rows per second and per-row errors.
+    """
+    if file_format is None:
+        is_ndjson = (file.filename or "").endswith((".ndjson", ".jsonl")) or \
+            file.content_type in ("application/x-ndjson", "application/jsonl")
+        file_format = "ndjson" if is_ndjson else "csv"
+    await reserve_contact_ids(batch_size)
+    return await run_db(db, import_contacts, user=current_user, stream=file.file, file_format=file_format,
+                        batch_size=batch_size)
 
 # Read contacts
 @app.get("/contacts/", response_model=List[Contact])
-def read_contacts(
-    skip: int = 0, limit: int = 10, query: str = None, db: Session = Depends(get_db),
+async def read_contacts(
+    skip: int = 0, limit: int = 10, query: str = None, cursor: str = None,
+    if_none_match: str = Header(None), db: Session = Depends(get_read_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     Route for reading contacts.
 
+    Pages can be requested by offset with ``skip`` or by keyset with ``cursor``.
+    When a page is full the cursor of the next page is returned in the
+    ``X-Next-Cursor`` header. Search results (``query``) are ranked by
+    relevance and paged by offset only.
+
+    The response carries an ETag derived from the version of the user's
+    contacts; a request whose ``If-None-Match`` still matches is answered
+    with 304 without reading any contacts.
+
     Args:
         skip (int): Number of items to skip.
         limit (int): Maximum number of items to return.
         query (str): Query string for filtering contacts.
+        cursor (str): Cursor from the ``X-Next-Cursor`` header of the previous page.
+        if_none_match (str): ETag of the copy the client holds.
+        db (Session): SQLAlchemy database session, on a read replica when one is configured.
+        current_user (User): Current authenticated user.
+
+    Returns:
+        Response: JSON list of contacts, serialized without validating the rows again.
+    """
+    # The version is read before the contacts: a change committed in between gives the new rows the old tag,
+    # which costs the client one more download but never serves it a stale copy
+    version = await run_db(db, get_contacts_version, user=current_user)
+    etag = contacts_etag(current_user.id, version, "list", skip, limit, query, cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    try:
+        contacts = await run_db(db, get_contacts, skip=skip, limit=limit, query=query, cursor=cursor,
+                                user=current_user)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    headers = {"ETag": etag, "Cache-Control": CONTACTS_CACHE_CONTROL}
+    if not query and contacts and len(contacts) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(current_user.id, contacts[-1].id)
+    return Response(dump_contacts(contacts), media_type="application/json", headers=headers)
+
+# Export contacts
+@app.get("/contacts/export")
+async def export_contacts_file(
+    file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """
+    Route for downloading all contacts as a CSV or NDJSON file.
+
+    The file is streamed from a server-side cursor as the rows are read.
+
+    Args:
+        file_format (str): "csv" or "ndjson".
+        current_user (User): Current authenticated user.
+
+    Returns:
+        StreamingResponse: The contacts file.
+    """
+    media_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+    # Read from the shard holding the contacts
+    bind = shard_router.engine(current_user.shard)
+    return StreamingResponse(
+        export_contacts(current_user, file_format, bind=bind), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="contacts.{file_format}"'}
+    )
+
+# Update contacts in bulk
+@app.patch("/contacts/bulk", response_model=ContactBulkResult, dependencies=[Depends(pin_to_primary)])
+async def update_contacts_bulk(body: ContactBulkUpdate, db: Session = Depends(get_contacts_db),
+                               current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Route for updating many contacts at once.
+
+    Contacts are selected by a list of IDs, a filter, or both. Only the
+    fields given in ``changes`` are updated.
+
+    Args:
+        body (ContactBulkUpdate): Selected contacts and the changes to apply.
+        db (Session): SQLAlchemy database session.
+        current_user (User): Current authenticated user.
+
+    Returns:
+        dict: Number and IDs of the updated contacts.
+    """
+    try:
+        return await run_db(db, bulk_update_contacts, user=current_user,
+                            changes=body.changes.model_dump(exclude_unset=True), ids=body.ids,
+                            contact_filter=body.filter)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+# Delete contacts in bulk
+@app.delete("/contacts/bulk", response_model=ContactBulkResult, dependencies=[Depends(pin_to_primary)])
+async def delete_contacts_bulk(body: ContactSelection, db: Session = Depends(get_contacts_db),
+                               current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Route for deleting many contacts at once.
+
+    Args:
+        body (ContactSelection): IDs and/or filter of the contacts to delete.
         db (Session): SQLAlchemy database session.
         current_user (User): Current authenticated user.
 
     Returns:
-        list: List of contacts.
+        dict: Number and IDs of the deleted contacts.
     """
-    return get_contacts(db=db, skip=skip, limit=limit, query=query, user=current_user)
+    try:
+        return await run_db(db, bulk_delete_contacts, user=current_user, ids=body.ids, contact_filter=body.filter)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 # Read contact by ID
 @app.get("/contacts/{contact_id}", response_model=Contact)
-def read_contact(contact_id: int, db: Session = Depends(get_db), 
-                 current_user: User = Depends(auth_service.get_current_user)):
+async def read_contact(contact_id: int, response: Response, if_none_match: str = Header(None),
+                       db: Session = Depends(get_read_db),
+                       current_user: User = Depends(auth_service.get_current_user)):
     """
     Route for reading a contact by ID.
 
+    Conditional requests are answered like in ``read_contacts``.
+
     Args:
         contact_id (int): ID of the contact to retrieve.
-        db (Session): SQLAlchemy database session.
+        response (Response): Response used to set the ETag header.
+        if_none_match (str): ETag of the copy the client holds.
+        db (Session): SQLAlchemy database session, on a read replica when one is configured.
         current_user (User): Current authenticated user.
 
     Returns:
         dict: Contact data.
     """
-    db_contact = get_contact(db=db, contact_id=contact_id, user=current_user)
+    version = await run_db(db, get_contacts_version, user=current_user)
+    etag = contacts_etag(current_user.id, version, "contact", contact_id)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    db_contact = await run_db(db, get_contact, contact_id=contact_id, user=current_user)
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CONTACTS_CACHE_CONTROL
     return db_contact
 
 # Update contact
-@app.put("/contacts/{contact_id}", response_model=Contact)
-def update_contact(contact_id: int, contact: ContactCreate, db: Session = Depends(get_db),
+@app.put("/contacts/{contact_id}", response_model=Contact, dependencies=[Depends(pin_to_primary)])
+async def update_contact(contact_id: int, contact: ContactCreate, db: Session = Depends(get_contacts_db),
                    current_user: User = Depends(auth_service.get_current_user)):
     """
     Route for updating a contact.
@@ -281,14 +638,14 @@ def update_contact(contact_id: int, contact: ContactCreate, db: Session = Depend
     Returns:
         dict: Updated contact data.
     """
-    db_contact = get_contact(db=db, contact_id=contact_id, user=current_user)
+    db_contact = await run_db(db, refresh_contact, contact_id=contact_id, contact=contact, user=current_user)
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return refresh_contact(db=db, contact_id=contact_id, contact=contact, user=current_user)
+    return db_contact
 
 # Delete contact
-@app.delete("/contacts/{contact_id}", response_model=Contact)
-def delete_contact(contact_id: int, db: Session = Depends(get_db),
+@app.delete("/contacts/{contact_id}", response_model=Contact, dependencies=[Depends(pin_to_primary)])
+async def delete_contact(contact_id: int, db: Session = Depends(get_contacts_db),
                    current_user: User = Depends(auth_service.get_current_user)):
     """
     Route for deleting a contact.
@@ -301,23 +658,71 @@ def delete_contact(contact_id: int, db: Session = Depends(get_db),
     Returns:
         dict: Deleted contact data.
     """
-    db_contact = get_contact(db=db, contact_id=contact_id, user=current_user)
+    db_contact = await run_db(db, remove_contact, contact_id=contact_id, user=current_user)
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return remove_contact(db=db, contact_id=contact_id, user=current_user)
+    return db_contact
 
 # Get contacts with upcoming birthdays
 @app.get("/contacts/upcoming_birthdays/", response_model=List[Contact])
-def get_upcoming_birthdays_list(db: Session = Depends(get_db),
+async def get_upcoming_birthdays_list(days: int = Query(7, ge=0, le=366), db: Session = Depends(get_read_db),
                                 current_user: User = Depends(auth_service.get_current_user)):
     """
     Route for retrieving contacts with upcoming birthdays.
 
     Args:
-        db (Session): SQLAlchemy database session.
+        days (int): Number of days ahead to look for birthdays.
+        db (Session): SQLAlchemy database session, on a read replica when one is configured.
         current_user (User): Current authenticated user.
 
     Returns:
-        list: List of contacts with upcoming birthdays.
+        Response: JSON list of contacts with upcoming birthdays.
+    """
+    contacts = await run_db(db, get_upcoming_birthdays, user=current_user, days=days)
+    return Response(dump_contacts(contacts), media_type="application/json")
+
+# Liveness probe
+@app.get("/healthz")
+async def healthz():
+    """
+    Route for checking the worker is up and its event loop is serving requests.
+
+    Returns:
+        dict: ``{"status": "ok"}``.
+    """
+    return {"status": "ok"}
+
+# Readiness probe
+@app.get("/readyz")
+async def readyz(response: Response):
+    """
+    Route for checking the worker can serve traffic: the database and Redis answer.
+
+    Args:
+        response (Response): Response whose status is set to 503 when a check fails.
+
+    Returns:
+        dict: The overall status, each check's result, the database pool's connection counts and
+        how many read replicas are in use; reads fall back to the primary, so replicas don't decide readiness.
+    """
+    results = await asyncio.gather(ping_db(), redis_client.ping_redis(), return_exceptions=True)
+    checks = {name: "ok" if result is None else f"unavailable: {type(result).__name__}"
+              for name, result in zip(("database", "redis"), results)}
+    ready = all(check == "ok" for check in checks.values())
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "ready" if ready else "unavailable", "checks": checks, "pool": pool_status(),
+            "replicas": read_router.status()}
+
+# Prometheus metrics
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Route for scraping the request, database pool, cache and email outbox metrics of all worker processes.
+
+    Returns:
+        PlainTextResponse: Metrics in the Prometheus text format.
     """
-    return get_upcoming_birthdays(db=db, user=current_user)
+    # The snapshot of this worker is taken on the event loop, the other workers' files are read in a thread
+    text = await asyncio.to_thread(metrics.render, metrics.snapshot())
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
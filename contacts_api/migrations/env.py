@@ -16,6 +16,8 @@ load_dotenv()
 
 # Getting environment variables
 SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
+# Imported once .env is loaded, as the shard URLs are read when the module is imported
+from src.database.shards import SQLALCHEMY_SHARD_URLS
 CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
@@ -29,6 +31,13 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# The application's database, when it is configured, wins over the URL in alembic.ini
+if SQLALCHEMY_DATABASE_URL:
+    config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
+
+# `alembic -x shard=<name> upgrade head` migrates one contact shard, `-x shard=all` the primary and every shard
+SHARD = context.get_x_argument(as_dictionary=True).get("shard")
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
@@ -72,19 +81,36 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
-
+    # src.database.schema passes the connection it runs in
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
         with context.begin_transaction():
             context.run_migrations()
+        return
+
+    section = config.get_section(config.config_ini_section, {})
+    if SHARD is None:
+        urls = [section["sqlalchemy.url"]]
+    elif SHARD == "all":
+        urls = [section["sqlalchemy.url"], *SQLALCHEMY_SHARD_URLS.values()]
+    else:
+        urls = [SQLALCHEMY_SHARD_URLS[SHARD]]
+
+    for url in urls:
+        connectable = engine_from_config(
+            {**section, "sqlalchemy.url": url},
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+        )
+
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection, target_metadata=target_metadata
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,27 @@
+"""Add contacts_version counter to users for contact ETags
+
+Revision ID: 2619763844e3
+Revises: bcdc09e95c70
+Create Date: 2026-10-17 16:02:41.538210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2619763844e3'
+down_revision: Union[str, None] = 'bcdc09e95c70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('contacts_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('contacts_version')
@@ -0,0 +1,64 @@
+"""Add trigram search indexes on contacts (FTS5 table on SQLite)
+
+Revision ID: 7865fbc0e718
+Revises: a88baa9f8852
+Create Date: 2026-10-17 11:03:17.552904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7865fbc0e718'
+down_revision: Union[str, None] = 'a88baa9f8852'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ('first_name', 'last_name', 'email')
+
+SQLITE_UPGRADE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "first_name, last_name, email, owner, content='', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, owner) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, '[' || new.user_id || ']'); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, owner) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, '[' || old.user_id || ']'); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, owner) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, '[' || old.user_id || ']'); "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, owner) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, '[' || new.user_id || ']'); END",
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, owner) "
+    "SELECT id, first_name, last_name, email, '[' || user_id || ']' FROM contacts",
+)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        with op.get_context().autocommit_block():
+            for column in SEARCH_COLUMNS:
+                op.create_index(f'ix_contacts_{column}_trgm', 'contacts', [column], unique=False,
+                                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+                                postgresql_concurrently=True)
+    elif dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            for column in SEARCH_COLUMNS:
+                op.drop_index(f'ix_contacts_{column}_trgm', table_name='contacts', postgresql_concurrently=True)
+    elif dialect == 'sqlite':
+        for trigger in ('contacts_fts_ai', 'contacts_fts_ad', 'contacts_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS contacts_fts')
@@ -0,0 +1,34 @@
+"""Add users.shard and the id_blocks counters for sharded contacts
+
+Revision ID: 8216431ece83
+Revises: 2619763844e3
+Create Date: 2026-10-17 19:12:08.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8216431ece83'
+down_revision: Union[str, None] = '2619763844e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('shard', sa.String(length=64), nullable=True))
+    op.create_table('id_blocks',
+                    sa.Column('name', sa.String(length=50), nullable=False),
+                    sa.Column('next_id', sa.BigInteger(), nullable=False),
+                    sa.PrimaryKeyConstraint('name'))
+    # Contact IDs handed out from now on start after the ones the database gave so far
+    op.execute("INSERT INTO id_blocks (name, next_id) SELECT 'contacts', COALESCE(MAX(id), 0) + 1 FROM contacts")
+
+
+def downgrade() -> None:
+    op.drop_table('id_blocks')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('shard')
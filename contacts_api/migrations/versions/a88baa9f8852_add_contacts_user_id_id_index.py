@@ -0,0 +1,30 @@
+"""Add composite (user_id, id) index on contacts for keyset pagination
+
+Revision ID: a88baa9f8852
+Revises: 99bbca48fb6d
+Create Date: 2026-10-17 09:12:41.208733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a88baa9f8852'
+down_revision: Union[str, None] = '99bbca48fb6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently on PostgreSQL so the contacts table stays writable
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_id', table_name='contacts', postgresql_concurrently=True)
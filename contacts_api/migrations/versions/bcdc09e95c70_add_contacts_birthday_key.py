@@ -0,0 +1,38 @@
+"""Add indexed birthday_key column to contacts for upcoming birthdays
+
+Revision ID: bcdc09e95c70
+Revises: 7865fbc0e718
+Create Date: 2026-10-17 13:27:05.114390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bcdc09e95c70'
+down_revision: Union[str, None] = '7865fbc0e718'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_key', sa.Integer(), nullable=True))
+    # Backfill month * 100 + day from the existing birthdays
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE contacts SET birthday_key = CAST(strftime('%m', birthday) AS INTEGER) * 100 "
+                   "+ CAST(strftime('%d', birthday) AS INTEGER) WHERE birthday IS NOT NULL")
+    else:
+        op.execute("UPDATE contacts SET birthday_key = EXTRACT(MONTH FROM birthday) * 100 "
+                   "+ EXTRACT(DAY FROM birthday) WHERE birthday IS NOT NULL")
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_birthday_key', 'contacts', ['user_id', 'birthday_key'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_birthday_key', table_name='contacts', postgresql_concurrently=True)
+    op.drop_column('contacts', 'birthday_key')
@@ -1,11 +1,26 @@
-from sqlalchemy import Column, Integer, String, Boolean, func, Table, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, func, Table, UniqueConstraint, Index, DDL, event
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import DateTime, Date
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+
+def birthday_key(birthday):
+    """
+    Day-of-year key of a birthday that ignores the year: month * 100 + day.
+
+    Args:
+        birthday (date | None): The birthday.
+
+    Returns:
+        int | None: The key, e.g. 1231 for December 31.
+    """
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
 class Contact(Base):
     """
     A model for storing user contacts.
@@ -19,9 +34,22 @@ class Contact(Base):
     phone_number = Column(String, unique=True, index=True)
     birthday = Column(Date)
     additional_data = Column(String, nullable=True)
+    # birthday_key(birthday), kept in sync whenever birthday is assigned
+    birthday_key = Column(Integer, nullable=True)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    # Serve keyset pagination and upcoming birthdays as index range scans per user
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_birthday_key', 'user_id', 'birthday_key'),
+    )
+
+    @validates('birthday')
+    def _sync_birthday_key(self, key, birthday):
+        self.birthday_key = birthday_key(birthday)
+        return birthday
+
 class User(Base):
     """
     User storage model.
@@ -35,3 +63,47 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
     email_verified = Column(Boolean, default=False)
+    # Bumped in the same transaction as every change to the user's contacts; the ETags of the contacts derive from it
+    contacts_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Shard holding the user's contacts, None for the primary; on a shard's own copy of the row, the shard it names
+    shard = Column(String(64), nullable=True)
+
+
+class IdBlock(Base):
+    """
+    Next free ID of a table whose IDs are handed out by the application in blocks.
+    """
+    __tablename__ = "id_blocks"
+    name = Column(String(50), primary_key=True)
+    next_id = Column(BigInteger, nullable=False)
+
+
+# Search indexes for Contact: trigram GIN indexes on PostgreSQL, an FTS5 trigram table on SQLite
+CONTACT_SEARCH_COLUMNS = ("first_name", "last_name", "email")
+
+event.listen(Contact.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+for column in CONTACT_SEARCH_COLUMNS:
+    event.listen(Contact.__table__, "after_create", DDL(
+        f"CREATE INDEX IF NOT EXISTS ix_contacts_{column}_trgm ON contacts USING gin ({column} gin_trgm_ops)"
+    ).execute_if(dialect="postgresql"))
+
+# Contentless FTS5 table kept in sync by triggers; owner holds "[user_id]" so a search can be scoped to one user
+CONTACTS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "first_name, last_name, email, owner, content='', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, owner) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, '[' || new.user_id || ']'); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, owner) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, '[' || old.user_id || ']'); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email, owner) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, '[' || old.user_id || ']'); "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email, owner) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email, '[' || new.user_id || ']'); END",
+)
+for statement in CONTACTS_FTS_DDL:
+    event.listen(Contact.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Contact.__table__, "before_drop", DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect="sqlite"))
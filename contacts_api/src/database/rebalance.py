@@ -0,0 +1,241 @@
+"""
+Move users' contacts to the shards the hash ring places them on, while the application serves them.
+
+The users whose ``users.shard`` differs from the ring's choice (all of
+them, or the ``--user-id`` ones) are moved one at a time:
+
+1. the user's row and contacts are copied to the target shard in one
+   transaction, replacing whatever an earlier attempt left there;
+2. the source's row is switched to the target, only if the user's
+   ``contacts_version`` is still the one copied; after a change during the
+   copy the user goes back to step 1. A write that commits on the source
+   after the switch no longer finds its row placed there and is rolled back
+   (503 with Retry-After), so no change is left behind;
+3. the directory row on the primary is pointed at the target and the
+   user's cached record is dropped;
+4. after ``--settle-seconds``, longer than the workers keep users in their
+   local cache, the contacts left on the source are deleted.
+
+Reads go to the source until the workers see the new placement, and the
+contacts are there until step 4. Contact IDs don't change. A contact whose
+email or phone number another user of the target shard already has stops
+the move of its user, who stays where they are. Moves are safe to rerun; a
+move cut short resumes where it stopped.
+
+Usage:
+    python -m src.database.rebalance --dry-run
+    python -m src.database.rebalance
+    python -m src.database.rebalance --user-id 42 --user-id 43 --settle-seconds 60
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from src.database.db import SQLALCHEMY_DATABASE_URL
+from src.database.models import Contact, User
+from src.database.shards import SQLALCHEMY_SHARD_URLS, SHARD_RING_VNODES, HashRing, shard_user_row
+from src.services.cache import USER_CACHE_LOCAL_EXPIRE_SECONDS, user_cache
+
+logger = logging.getLogger(__name__)
+
+# Rebalancing configuration
+MOVE_ATTEMPTS = 5
+SETTLE_SECONDS = USER_CACHE_LOCAL_EXPIRE_SECONDS + 5
+
+users = User.__table__
+contacts = Contact.__table__
+
+
+def placed_on(name: str | None):
+    """
+    Criterion of a user row that places the contacts on ``name``.
+
+    Args:
+        name (str | None): Name of the shard, None for the primary.
+
+    Returns:
+        ColumnElement: The criterion.
+    """
+    return users.c.shard.is_(None) if name is None else users.c.shard == name
+
+
+class Rebalancer:
+    """
+    Moves users' contacts between the primary and the shards, with sync engines of its own.
+    """
+
+    def __init__(self, url: str = SQLALCHEMY_DATABASE_URL, shard_urls: dict = SQLALCHEMY_SHARD_URLS,
+                 vnodes: int = SHARD_RING_VNODES, batch_size: int = 1000, attempts: int = MOVE_ATTEMPTS,
+                 cache=user_cache):
+        self.primary = create_engine(url)
+        self.shards = {name: create_engine(shard_url) for name, shard_url in shard_urls.items()}
+        self.ring = HashRing(shard_urls, vnodes)
+        self.batch_size = batch_size
+        self.attempts = attempts
+        self.cache = cache
+
+    def engine(self, name: str | None):
+        if name is not None and name not in self.shards:
+            raise RuntimeError(f"Shard {name!r} is not in SQLALCHEMY_SHARD_URLS")
+        return self.primary if name is None else self.shards[name]
+
+    def plan(self, user_ids: list = None) -> list:
+        """
+        Find the users whose contacts are not where the ring places them.
+
+        Args:
+            user_ids (list): Only consider these users.
+
+        Returns:
+            list: One dict per move, with ``user_id``, ``email``, ``source`` and ``target``.
+        """
+        stmt = select(users.c.id, users.c.email, users.c.shard).order_by(users.c.id)
+        if user_ids:
+            stmt = stmt.where(users.c.id.in_(user_ids))
+        with self.primary.connect() as conn:
+            rows = conn.execute(stmt).all()
+        moves = []
+        for row in rows:
+            target = self.ring.lookup(row.id)
+            if target is not None and target != row.shard:
+                moves.append({"user_id": row.id, "email": row.email, "source": row.shard, "target": target})
+        return moves
+
+    def _copy(self, move: dict) -> tuple | None:
+        # Returns the copied version and number of contacts, None when an earlier run already switched the source
+        with self.engine(move["source"]).connect() as reader, self.engine(move["target"]).begin() as writer:
+            user = reader.execute(select(users).where(users.c.id == move["user_id"])).first()
+            if user is None:
+                raise RuntimeError(f"Shard {move['source']!r} has no row of user {move['user_id']}")
+            if user.shard == move["target"]:
+                return None
+            if user.shard != move["source"]:
+                raise RuntimeError(f"User {move['user_id']} is placed on {user.shard!r} by {move['source']!r}")
+            writer.execute(delete(contacts).where(contacts.c.user_id == move["user_id"]))
+            writer.execute(delete(users).where(users.c.id == move["user_id"]))
+            writer.execute(insert(users).values(shard_user_row(user, move["target"])))
+            copied, last_id = 0, None
+            while True:
+                stmt = select(contacts).where(contacts.c.user_id == move["user_id"]).order_by(contacts.c.id)
+                if last_id is not None:
+                    stmt = stmt.where(contacts.c.id > last_id)
+                rows = reader.execute(stmt.limit(self.batch_size)).mappings().all()
+                if not rows:
+                    break
+                writer.execute(insert(contacts), [dict(row) for row in rows])
+                copied += len(rows)
+                last_id = rows[-1]["id"]
+        return user.contacts_version, copied
+
+    def _switch(self, move: dict, version: int) -> bool:
+        with self.engine(move["source"]).begin() as conn:
+            result = conn.execute(update(users).where(users.c.id == move["user_id"], placed_on(move["source"]),
+                                                      users.c.contacts_version == version)
+                                  .values(shard=move["target"]))
+        return result.rowcount == 1
+
+    def _point(self, move: dict):
+        with self.primary.begin() as conn:
+            conn.execute(update(users).where(users.c.id == move["user_id"]).values(shard=move["target"]))
+
+    def _clean(self, move: dict):
+        with self.engine(move["source"]).begin() as conn:
+            shard = conn.scalar(select(users.c.shard).where(users.c.id == move["user_id"]))
+            # Placed back on the source meanwhile: its contacts are in use again
+            if shard == move["source"]:
+                return
+            conn.execute(delete(contacts).where(contacts.c.user_id == move["user_id"]))
+            if move["source"] is not None:
+                conn.execute(delete(users).where(users.c.id == move["user_id"]))
+
+    async def move(self, move: dict) -> dict:
+        """
+        Copy a user's contacts to the target shard and place the user there; the source is cleaned later.
+
+        Args:
+            move (dict): A move from plan.
+
+        Returns:
+            dict: The move with its ``status``: "moved", "busy" when the contacts kept changing,
+            "conflict" when the target already has one of the emails or phone numbers, or "failed".
+        """
+        try:
+            for _ in range(self.attempts):
+                copied = await asyncio.to_thread(self._copy, move)
+                if copied is None:
+                    break
+                version, count = copied
+                if await asyncio.to_thread(self._switch, move, version):
+                    move = {**move, "contacts": count}
+                    break
+            else:
+                return {**move, "status": "busy"}
+            await asyncio.to_thread(self._point, move)
+        except IntegrityError as e:
+            return {**move, "status": "conflict", "error": str(e.orig)}
+        except (DBAPIError, OSError, RuntimeError) as e:
+            return {**move, "status": "failed", "error": str(e)}
+        await self.cache.invalidate(move["email"])
+        return {**move, "status": "moved"}
+
+    async def run(self, user_ids: list = None, dry_run: bool = False, settle_seconds: float = SETTLE_SECONDS) -> list:
+        """
+        Move every user whose contacts are not where the ring places them.
+
+        Args:
+            user_ids (list): Only consider these users.
+            dry_run (bool): Only plan the moves.
+            settle_seconds (float): Wait between placing the users and deleting their contacts from the sources.
+
+        Returns:
+            list: The moves, with their status unless ``dry_run``.
+        """
+        moves = await asyncio.to_thread(self.plan, user_ids)
+        if dry_run:
+            return moves
+        results = []
+        for move in moves:
+            results.append(await self.move(move))
+            logger.info("User %s from %s to %s: %s", move["user_id"], move["source"] or "primary", move["target"],
+                        results[-1]["status"])
+        moved = [result for result in results if result["status"] == "moved"]
+        if moved:
+            # Workers that cached a user before the switch read from the source until their entry expires
+            await asyncio.sleep(settle_seconds)
+            for move in moved:
+                await asyncio.to_thread(self._clean, move)
+        return results
+
+    def dispose(self):
+        self.primary.dispose()
+        for shard in self.shards.values():
+            shard.dispose()
+
+
+async def main():
+    from src.services.redis_client import close_redis
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--user-id", type=int, action="append", help="move only this user, repeatable")
+    parser.add_argument("--dry-run", action="store_true", help="print the planned moves only")
+    parser.add_argument("--batch-size", type=int, default=1000, help="contacts copied per statement")
+    parser.add_argument("--settle-seconds", type=float, default=SETTLE_SECONDS,
+                        help="wait before deleting the moved contacts from their source")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    rebalancer = Rebalancer(batch_size=args.batch_size)
+    try:
+        results = await rebalancer.run(args.user_id, args.dry_run, args.settle_seconds)
+    finally:
+        rebalancer.dispose()
+        await close_redis()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+import logging
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.db import DB_MODE, AsyncSessionLocal, SessionLocal, instrument_engine, to_async_url
+from src.services.redis_client import get_redis, redis_errors
+
+logger = logging.getLogger(__name__)
+
+# Read replica configuration
+# Comma-separated sync URLs of the replicas; without any, reads stay on the primary
+SQLALCHEMY_REPLICA_URLS = [url.strip() for url in os.getenv("SQLALCHEMY_REPLICA_URLS", "").split(",") if url.strip()]
+# Reads of a user stay on the primary this long after the user's last write, longer than the replicas lag
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+REPLICA_RETRY_SECONDS = 30
+PRIMARY_PIN_KEY_PREFIX = "primary:user:"
+
+
+class Replica:
+    """
+    A read replica: its engine and sessions, and until when it is skipped after failing.
+    """
+
+    def __init__(self, url: str, mode: str = DB_MODE):
+        self.url = url
+        self.mode = mode
+        if mode == "async":
+            self.engine = create_async_engine(to_async_url(url), pool_pre_ping=True)
+            instrument_engine(self.engine.sync_engine)
+            self.sessions = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        else:
+            self.engine = instrument_engine(create_engine(url, pool_pre_ping=True))
+            self.sessions = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.down_until = 0.0
+
+    async def open(self):
+        """
+        Open a session with its connection already checked out, so an unreachable replica fails here.
+
+        Returns:
+            Session | AsyncSession: Session on the replica.
+        """
+        db = self.sessions()
+        try:
+            if self.mode == "async":
+                await db.connection()
+            else:
+                await run_in_threadpool(db.connection)
+        except BaseException:
+            await (db.close() if self.mode == "async" else run_in_threadpool(db.close))
+            raise
+        return db
+
+    async def close(self, db):
+        await (db.close() if self.mode == "async" else run_in_threadpool(db.close))
+
+    async def dispose(self):
+        if self.mode == "async":
+            await self.engine.dispose()
+        else:
+            self.engine.dispose()
+
+
+class ReplicaRouter:
+    """
+    Sends read-only work to the read replicas, round-robin.
+
+    A replica that can't be connected to is skipped for REPLICA_RETRY_SECONDS
+    and the next one is tried; with none left the read goes to the primary.
+    After a user writes, the user's reads stay on the primary for
+    READ_YOUR_WRITES_SECONDS, so replica lag never hides the user's own
+    changes. The pin is kept in Redis so every worker sees it; while Redis
+    is unreachable reads go to the primary.
+    """
+
+    def __init__(self, urls: list = SQLALCHEMY_REPLICA_URLS, mode: str = DB_MODE,
+                 pin_seconds: int = READ_YOUR_WRITES_SECONDS, redis_client=None):
+        self.mode = mode
+        self.replicas = [Replica(url, mode) for url in urls]
+        self.pin_seconds = pin_seconds
+        self.reads = {"primary": 0, "replica": 0}
+        self._redis = redis_client
+        self._next = 0
+
+    @property
+    def redis(self):
+        """
+        The Redis client, the shared one unless a client was passed in.
+        """
+        return self._redis if self._redis is not None else get_redis()
+
+    def pin_key(self, user_id: int) -> str:
+        return f"{PRIMARY_PIN_KEY_PREFIX}{user_id}"
+
+    async def pin(self, user_id: int):
+        """
+        Keep the reads of a user on the primary for the next ``pin_seconds``. Called on every write.
+
+        Args:
+            user_id (int): The user who writes.
+        """
+        if not self.replicas:
+            return
+        try:
+            await self.redis.set(self.pin_key(user_id), 1, ex=self.pin_seconds)
+        except redis_errors() as e:
+            logger.warning("Could not pin user %s to the primary: %s", user_id, e)
+
+    async def pinned(self, user_id: int) -> bool:
+        """
+        Check whether a user wrote within the last ``pin_seconds``.
+
+        Args:
+            user_id (int): The user who reads.
+
+        Returns:
+            bool: True when the user's reads have to go to the primary.
+        """
+        try:
+            return bool(await self.redis.exists(self.pin_key(user_id)))
+        except redis_errors():
+            return True
+
+    async def _open_replica(self):
+        # Tries each replica once, starting after the one used last
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if replica.down_until > time.monotonic():
+                continue
+            try:
+                return replica, await replica.open()
+            except (DBAPIError, OSError) as e:
+                logger.warning("Read replica %s is unavailable: %s", replica.engine.url.render_as_string(), e)
+                replica.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        return None, None
+
+    async def session(self, user_id: int = None):
+        """
+        Open a session for read-only work, on a replica unless the user's reads are pinned to the primary.
+
+        Args:
+            user_id (int): The user who reads, None for reads not tied to a user.
+
+        Yields:
+            Session | AsyncSession: Database session, closed on exit.
+        """
+        replica, db = None, None
+        if self.replicas and not (user_id is not None and await self.pinned(user_id)):
+            replica, db = await self._open_replica()
+        if replica is None:
+            self.reads["primary"] += 1
+            if self.mode == "async":
+                async with AsyncSessionLocal() as db:
+                    yield db
+                return
+            db = SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+            return
+        self.reads["replica"] += 1
+        try:
+            yield db
+        finally:
+            await replica.close(db)
+
+    def status(self) -> dict:
+        """
+        Count the replicas that are in use.
+
+        Returns:
+            dict: ``total`` replicas and how many are ``up``.
+        """
+        now = time.monotonic()
+        return {"total": len(self.replicas), "up": sum(replica.down_until <= now for replica in self.replicas)}
+
+    async def dispose(self):
+        """
+        Close the connection pools of the replicas. Called from the application lifespan.
+        """
+        for replica in self.replicas:
+            await replica.dispose()
+
+
+read_router = ReplicaRouter()
@@ -0,0 +1,92 @@
+"""
+Create or migrate the database schema, once per deployment before the workers start.
+
+The application doesn't touch the schema itself. An empty database is built
+from the models and stamped with the latest Alembic revision, because the
+migration chain starts from tables that already existed; a database that
+Alembic manages is upgraded to the latest revision. Every contact shard
+of SQLALCHEMY_SHARD_URLS is migrated after the primary, the same way.
+
+Usage:
+    python -m src.database.schema
+    SQLALCHEMY_DATABASE_URL=postgresql+psycopg2://... python -m src.database.schema
+    SQLALCHEMY_SHARD_URLS=s1=postgresql+psycopg2://...,s2=postgresql+psycopg2://... python -m src.database.schema
+"""
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect
+
+from src.database.models import Base
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "migrations")
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(url: str) -> str:
+    """
+    Bring the schema of a database to the latest revision.
+
+    Args:
+        url (str): Sync database URL.
+
+    Returns:
+        str: "created" for an empty database, "upgraded" for one managed by Alembic.
+
+    Raises:
+        RuntimeError: The database has tables but no Alembic revision; it has to be stamped by hand.
+    """
+    engine = create_engine(url)
+    try:
+        with engine.connect() as connection:
+            config = Config()
+            config.set_main_option("script_location", MIGRATIONS_DIR)
+            # migrations/env.py runs on this connection instead of opening its own
+            config.attributes["connection"] = connection
+            tables = set(inspect(connection).get_table_names())
+            # Alembic has to start the transactions itself: the revisions that build indexes concurrently
+            # commit them and step out into an autocommit block, which fails inside a transaction of ours
+            connection.commit()
+            if "alembic_version" in tables:
+                command.upgrade(config, "head")
+                connection.commit()
+                return "upgraded"
+            if tables & set(Base.metadata.tables):
+                raise RuntimeError("The database has tables but no Alembic revision, "
+                                   "stamp the revision it is at with `alembic stamp <revision>`")
+            Base.metadata.create_all(connection)
+            connection.commit()
+            command.stamp(config, "head")
+            connection.commit()
+            return "created"
+    finally:
+        engine.dispose()
+
+
+def migrate_all(url: str, shard_urls: dict) -> dict:
+    """
+    Bring the schema of the primary and of every shard to the latest revision.
+
+    Args:
+        url (str): Sync URL of the primary.
+        shard_urls (dict): Shard name to sync URL.
+
+    Returns:
+        dict: What migrate did to each database, under "primary" and the shard names.
+    """
+    results = {"primary": migrate(url)}
+    for name, shard_url in shard_urls.items():
+        results[name] = migrate(shard_url)
+    return results
+
+
+if __name__ == "__main__":
+    from src.database.db import SQLALCHEMY_DATABASE_URL
+    from src.database.shards import SQLALCHEMY_SHARD_URLS
+
+    logging.basicConfig(level=logging.INFO)
+    for name, result in migrate_all(SQLALCHEMY_DATABASE_URL, SQLALCHEMY_SHARD_URLS).items():
+        logger.info("Schema of %s %s", name, result)
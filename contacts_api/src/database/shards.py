@@ -0,0 +1,330 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import threading
+
+import anyio.from_thread
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.util import await_only
+
+from src.database.db import DB_MODE, engine, instrument_engine, run_db, session_scope, to_async_url
+from src.database.models import Contact, IdBlock, User
+
+logger = logging.getLogger(__name__)
+
+# Sharding configuration
+# Comma-separated name=url pairs of the sync URLs of the contact shards; without any, contacts stay on the primary.
+# The names place the users on the hash ring, so a shard keeps its name when its URL changes
+SQLALCHEMY_SHARD_URLS = dict(pair.strip().split("=", 1) for pair in os.getenv("SQLALCHEMY_SHARD_URLS", "").split(",")
+                             if pair.strip())
+SHARD_RING_VNODES = int(os.getenv("SHARD_RING_VNODES", 100))
+# Contact IDs reserved on the primary at a time by each worker
+CONTACT_ID_BLOCK = int(os.getenv("CONTACT_ID_BLOCK", 1000))
+
+
+class ContactsMoved(Exception):
+    """
+    A write ran against a database the user's contacts were just moved away from; it was rolled back and can be retried.
+    """
+
+
+def ring_hash(key: str) -> int:
+    """
+    Position of a key on the hash ring, the same in every process.
+
+    Args:
+        key (str): The key.
+
+    Returns:
+        int: 64-bit position.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring of shard names.
+
+    Every shard sits at ``vnodes`` points of the ring and a key belongs to the
+    first point at or after its own position, so adding a shard only takes
+    over keys from the others, about 1/N of them, and removing one only moves
+    its own keys.
+    """
+
+    def __init__(self, names, vnodes: int = SHARD_RING_VNODES):
+        self.points = sorted((ring_hash(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        self._positions = [position for position, _ in self.points]
+
+    def lookup(self, key) -> str | None:
+        """
+        Find the shard a key belongs to.
+
+        Args:
+            key (int | str): The key, a user ID.
+
+        Returns:
+            str | None: Name of the shard, None when the ring is empty.
+        """
+        if not self.points:
+            return None
+        index = bisect.bisect_left(self._positions, ring_hash(str(key))) % len(self.points)
+        return self.points[index][1]
+
+
+def shard_user_row(user: User, name: str) -> dict:
+    """
+    Columns of a shard's copy of a user's row: what the contacts' foreign key and ETags need, no credentials.
+
+    Args:
+        user (User): The user.
+        name (str): The shard the copy is written to.
+
+    Returns:
+        dict: Column values of the copy.
+    """
+    return {"id": user.id, "username": user.username, "email": user.email, "password": "",
+            "contacts_version": user.contacts_version or 0, "shard": name}
+
+
+def _merge_user_row(db, row: dict):
+    db.merge(User(**row))
+    db.commit()
+
+
+class Shard:
+    """
+    A database holding the contacts of some of the users: its engine and sessions.
+    """
+
+    def __init__(self, name: str, url: str, mode: str = DB_MODE):
+        self.name = name
+        self.url = url
+        self.mode = mode
+        if mode == "async":
+            self.engine = create_async_engine(to_async_url(url))
+            instrument_engine(self.engine.sync_engine)
+            self.sessions = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        else:
+            self.engine = instrument_engine(create_engine(url))
+            self.sessions = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    async def dispose(self):
+        if self.mode == "async":
+            await self.engine.dispose()
+        else:
+            self.engine.dispose()
+
+
+class ShardRouter:
+    """
+    Sends the contact work of each user to the database holding the user's contacts.
+
+    The primary stays the directory of the users, and ``users.shard`` records
+    where each user's contacts are: None keeps them on the primary, where the
+    users from before sharding stay until they are moved. New users are
+    placed by a consistent-hash ring of the shard names, and the rebalancing
+    tool (src.database.rebalance) moves every user whose placement differs
+    from the ring's.
+
+    Each shard holds a copy of the rows of its users, which their contacts
+    reference and whose ``contacts_version`` is bumped with every change, so
+    a change and its version stay in one transaction of one database.
+    """
+
+    def __init__(self, urls: dict = SQLALCHEMY_SHARD_URLS, mode: str = DB_MODE, vnodes: int = SHARD_RING_VNODES):
+        self.mode = mode
+        self.shards = {name: Shard(name, url, mode) for name, url in urls.items()}
+        self.ring = HashRing(self.shards, vnodes)
+        self.sessions = {"primary": 0, **{name: 0 for name in self.shards}}
+
+    def target(self, user_id: int) -> str | None:
+        """
+        Find the shard the ring places a user on.
+
+        Args:
+            user_id (int): The user.
+
+        Returns:
+            str | None: Name of the shard, None without shards.
+        """
+        return self.ring.lookup(user_id)
+
+    def shard(self, name: str) -> Shard:
+        """
+        Get a configured shard.
+
+        Args:
+            name (str): Name of the shard.
+
+        Returns:
+            Shard: The shard.
+
+        Raises:
+            RuntimeError: SQLALCHEMY_SHARD_URLS has no shard of this name.
+        """
+        try:
+            return self.shards[name]
+        except KeyError:
+            raise RuntimeError(f"Contacts are placed on shard {name!r}, which SQLALCHEMY_SHARD_URLS doesn't name")
+
+    def engine(self, name: str | None):
+        """
+        Get the engine of the database holding contacts placed on ``name``.
+
+        Args:
+            name (str | None): Name of the shard, None for the primary.
+
+        Returns:
+            Engine | AsyncEngine | None: The shard's engine, None for the primary's.
+        """
+        return None if name is None else self.shard(name).engine
+
+    async def session(self, name: str | None = None):
+        """
+        Open a session on the database holding contacts placed on ``name``.
+
+        Args:
+            name (str | None): Name of the shard, None for the primary.
+
+        Yields:
+            Session | AsyncSession: Database session, closed on exit.
+        """
+        if name is None:
+            self.sessions["primary"] += 1
+            async with session_scope() as db:
+                yield db
+            return
+        shard = self.shard(name)
+        self.sessions[name] += 1
+        db = shard.sessions()
+        try:
+            yield db
+        finally:
+            await (db.close() if self.mode == "async" else run_in_threadpool(db.close))
+
+    async def add_user(self, name: str, user: User):
+        """
+        Write a shard's copy of a user's row, before the user's contacts are placed there.
+
+        Args:
+            name (str): Name of the shard.
+            user (User): The user.
+        """
+        async for db in self.session(name):
+            await run_db(db, _merge_user_row, shard_user_row(user, name))
+
+    async def dispose(self):
+        """
+        Close the connection pools of the shards. Called from the application lifespan.
+        """
+        for shard in self.shards.values():
+            await shard.dispose()
+
+
+def _wait_for(fn, *args):
+    # Waits for a coroutine from the sync code of a request without blocking the event loop: through anyio
+    # from a worker thread, through SQLAlchemy's greenlet bridge inside AsyncSession.run_sync
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return anyio.from_thread.run(fn, *args)
+    return await_only(fn(*args))
+
+
+class IdAllocator:
+    """
+    Hands out the IDs of new contacts from blocks reserved on the primary.
+
+    Contacts keep their IDs when they move to another shard, so the IDs
+    can't come from each database's own sequence once there are shards.
+    Blocks of ``block`` IDs are reserved in a short transaction of their
+    own on the primary, in the thread pool, by ``reserve``; the routes
+    reserve what a write needs before it starts, and ``take`` hands the IDs
+    out from memory. IDs left in a block when the worker stops are skipped.
+    """
+
+    def __init__(self, bind=engine, name: str = "contacts", block: int = CONTACT_ID_BLOCK):
+        self.bind = bind
+        self.name = name
+        self.block = block
+        # [next, end) ranges reserved and not handed out yet; the lock is never held while waiting on the primary
+        self._blocks = []
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> int:
+        with self._lock:
+            return sum(end - start for start, end in self._blocks)
+
+    def _reserve(self, size: int) -> int:
+        for _ in range(2):
+            try:
+                with self.bind.begin() as conn:
+                    end = conn.scalar(update(IdBlock).where(IdBlock.name == self.name)
+                                      .values(next_id=IdBlock.next_id + size).returning(IdBlock.next_id))
+                    if end is not None:
+                        return end - size
+                    # Databases built from the models have no counter yet; it starts after the primary's contacts
+                    start = (conn.scalar(select(func.max(Contact.id))) or 0) + 1
+                    conn.execute(insert(IdBlock).values(name=self.name, next_id=start + size))
+                    return start
+            except IntegrityError:
+                # Another worker created the counter first
+                continue
+        raise RuntimeError(f"Could not reserve {self.name} IDs")
+
+    async def reserve(self, count: int):
+        """
+        Make sure ``count`` IDs are on hand, reserving blocks on the primary in the thread pool.
+
+        Args:
+            count (int): Number of IDs the next write needs.
+        """
+        while self.available < count:
+            size = max(self.block, count)
+            start = await run_in_threadpool(self._reserve, size)
+            with self._lock:
+                self._blocks.append([start, start + size])
+
+    def _pop(self, count: int) -> list | None:
+        with self._lock:
+            if sum(end - start for start, end in self._blocks) < count:
+                return None
+            ids = []
+            while len(ids) < count:
+                block = self._blocks[0]
+                taken = min(count - len(ids), block[1] - block[0])
+                ids.extend(range(block[0], block[0] + taken))
+                block[0] += taken
+                if block[0] == block[1]:
+                    self._blocks.pop(0)
+            return ids
+
+    def take(self, count: int) -> list:
+        """
+        Take the next ``count`` IDs from the blocks on hand.
+
+        A write that needs more than was reserved for it waits for ``reserve``
+        on the event loop, without blocking the loop.
+
+        Args:
+            count (int): Number of IDs.
+
+        Returns:
+            list: The IDs, ascending.
+        """
+        while (ids := self._pop(count)) is None:
+            _wait_for(self.reserve, count)
+        return ids
+
+
+shard_router = ShardRouter()
+
+# Contact IDs come from the primary once contacts are spread over shards, without shards from each insert
+contact_ids = IdAllocator() if SQLALCHEMY_SHARD_URLS else None
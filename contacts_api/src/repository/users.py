@@ -1,7 +1,46 @@
-from libgravatar import Gravatar
+import logging
+
+from sqlalchemy import update
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
+from src.database.db import run_db
 from src.database.models import User
+from src.database.shards import shard_router
 from src.schemas import UserModel
+from src.services.cache import token_claims, user_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _get_user_by_email(db: Session, email: str) -> User:
+    return db.query(User).filter(User.email == email).first()
+
+
+def _add_user(db: Session, user: User) -> User:
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def _place_user(db: Session, user: User, shard: str) -> None:
+    user.shard = shard
+    db.commit()
+    db.refresh(user)
+
+
+def _update_token(db: Session, user: User, token: str | None) -> None:
+    user.refresh_token = token
+    db.commit()
+
+
+def _confirm_email(db: Session, token: str) -> bool:
+    user = db.query(User).filter(User.email == token).first()
+    if user:
+        user.email_verified = True
+        db.commit()
+        return True
+    return False
 
 
 async def get_user_by_email(email: str, db: Session) -> User:
@@ -10,12 +49,12 @@ async def get_user_by_email(email: str, db: Session) -> User:
 
     Args:
         email (str): User's email.
-        db (Session): Database session.
+        db (Session | AsyncSession): Database session.
 
     Returns:
         User: User object from the database or None if user not found.
     """
-    return db.query(User).filter(User.email == email).first()
+    return await run_db(db, _get_user_by_email, email)
 
 
 async def create_user(body: UserModel, db: Session) -> User:
@@ -24,11 +63,13 @@ async def create_user(body: UserModel, db: Session) -> User:
 
     Args:
         body (UserModel): New user data.
-        db (Session): Database session.
+        db (Session | AsyncSession): Database session.
 
     Returns:
         User: New user object.
     """
+    from libgravatar import Gravatar
+
     avatar = None
     try:
         g = Gravatar(body.email)
@@ -36,12 +77,35 @@ async def create_user(body: UserModel, db: Session) -> User:
     except Exception as e:
         print(e)
     new_user = User(**body.dict(), avatar=avatar)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    new_user = await run_db(db, _add_user, new_user)
+    await place_user(new_user, db)
+    await user_cache.invalidate(new_user.email)
     return new_user
 
 
+async def place_user(user: User, db: Session) -> None:
+    """
+    Place a new user's contacts on the shard the hash ring picks.
+
+    The shard gets its copy of the user's row first; when it can't be
+    written the contacts stay on the primary, from where the rebalancing
+    tool moves them later.
+
+    Args:
+        user (User): The new user.
+        db (Session | AsyncSession): Database session.
+    """
+    shard = shard_router.target(user.id)
+    if shard is None:
+        return
+    try:
+        await shard_router.add_user(shard, user)
+    except (DBAPIError, OSError) as e:
+        logger.warning("Could not place user %s on shard %s, the contacts stay on the primary: %s", user.id, shard, e)
+        return
+    await run_db(db, _place_user, user, shard)
+
+
 async def update_token(user: User, token: str | None, db: Session) -> None:
     """
     Update the refresh token for a user in the database.
@@ -49,13 +113,15 @@ async def update_token(user: User, token: str | None, db: Session) -> None:
     Args:
         user (User): User object.
         token (str | None): Refresh token. If None, the token is removed.
-        db (Session): Database session.
+        db (Session | AsyncSession): Database session.
 
     Returns:
         None
     """
-    user.refresh_token = token
-    db.commit()
+    # The replaced refresh token is revoked
+    token_claims.invalidate(user.refresh_token)
+    await run_db(db, _update_token, user, token)
+    await user_cache.invalidate(user.email)
 
 
 async def confirm_email(token: str, db: Session):
@@ -64,14 +130,39 @@ async def confirm_email(token: str, db: Session):
 
     Args:
         token (str): Email confirmation token.
-        db (Session): Database session.
+        db (Session | AsyncSession): Database session.
 
     Returns:
         bool: Returns True if confirmation is successful, and False otherwise.
     """
-    user = db.query(User).filter(User.email == token).first()
-    if user:
-        user.email_verified = True
-        db.commit()
-        return True
-    return False
\ No newline at end of file
+    confirmed = await run_db(db, _confirm_email, token)
+    if confirmed:
+        await user_cache.invalidate(token)
+    return confirmed
+
+
+def _update_avatar(db: Session, email: str, url: str) -> User:
+    user = db.scalars(update(User).where(User.email == email).values(avatar=url).returning(User)
+                      .execution_options(synchronize_session=False, populate_existing=True)).one_or_none()
+    # The RETURNING row is complete; detach it so the commit doesn't expire it into a reload
+    if user is not None:
+        db.expunge(user)
+    db.commit()
+    return user
+
+
+async def update_avatar(email: str, url: str, db: Session) -> User:
+    """
+    Update the avatar URL of a user in the database.
+
+    Args:
+        email (str): User's email.
+        url (str): New avatar URL.
+        db (Session | AsyncSession): Database session.
+
+    Returns:
+        User: Updated user object, or None if no user has this email.
+    """
+    user = await run_db(db, _update_avatar, email, url)
+    await user_cache.invalidate(email)
+    return user
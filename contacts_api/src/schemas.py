@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, constr, Field
+from pydantic import BaseModel, EmailStr, constr, Field, TypeAdapter
 from datetime import datetime, date
 from typing import List, Optional
 
@@ -22,6 +22,30 @@ class Contact(ContactBase):
         from_attributes = True
         #orm_mode = True
 
+
+CONTACT_FIELDS = set(Contact.model_fields)
+contact_list_adapter = TypeAdapter(List[Contact])
+
+
+def dump_contacts(contacts) -> bytes:
+    """
+    Serialize contacts read from the database to a JSON array of Contact.
+
+    The rows were validated when they were written, so the models are built
+    with ``model_construct`` instead of being validated again (EmailStr
+    validation alone costs more than the query for a large page).
+
+    Args:
+        contacts (list): Contact rows or any objects with the Contact attributes.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    return contact_list_adapter.dump_json([
+        Contact.model_construct(CONTACT_FIELDS, **{name: getattr(contact, name) for name in CONTACT_FIELDS})
+        for contact in contacts
+    ])
+
 class UserModel(BaseModel):
     username: str = Field(..., min_length=5, max_length=16)
     email: str
@@ -48,4 +72,54 @@ class UserResponse(BaseModel):
 class TokenModel(BaseModel):
     access_token: str
     refresh_token: str
-    token_type: str = "bearer"
\ No newline at end of file
+    token_type: str = "bearer"
+
+
+class SessionModel(BaseModel):
+    id: str
+    device: str
+    created_at: datetime
+    refreshed_at: datetime
+
+class ContactImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class ContactImportResult(BaseModel):
+    total: int
+    imported: int
+    failed: int
+    seconds: float
+    rows_per_second: float
+    errors: List[ContactImportError]
+
+
+class ContactFilter(BaseModel):
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    birthday_from: Optional[date] = None
+    birthday_to: Optional[date] = None
+
+
+class ContactSelection(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=10000)
+    filter: Optional[ContactFilter] = None
+
+
+class ContactChanges(BaseModel):
+    first_name: Optional[constr(max_length=50)] = None
+    last_name: Optional[constr(max_length=50)] = None
+    birthday: Optional[date] = None
+    additional_data: Optional[str] = None
+
+
+class ContactBulkUpdate(ContactSelection):
+    changes: ContactChanges
+
+
+class ContactBulkResult(BaseModel):
+    count: int
+    ids: List[int]
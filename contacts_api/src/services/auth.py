@@ -1,22 +1,22 @@
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from typing import Optional
-from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends, Security
 from fastapi.security import OAuth2PasswordBearer, HTTPAuthorizationCredentials
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from src.database.db import get_db
+from src.database.db import get_session
 from src.repository import users as repository_users
+from src.services.cache import token_claims, user_cache
+from src.services.hashing import hashing_executor, hash_password, verify_password
+from src.services.mail import email_outbox
 
 
 class Auth:
     """
     Class responsible for authentication-related operations.
+
+    jose and passlib are imported on first use, so processes that never
+    handle a token or a password don't load them.
     """
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = "secret_key"
     ALGORITHM = "HS256"
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login") # /api/auth/login
@@ -32,7 +32,7 @@ class Auth:
         Returns:
             bool: True if the passwords match, False otherwise.
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return verify_password(plain_password, hashed_password)
 
     def get_password_hash(self, password: str):
         """
@@ -44,12 +44,37 @@ class Auth:
         Returns:
             str: The hashed password.
         """
-        return self.pwd_context.hash(password)
+        return hash_password(password)
+
+    async def verify_password_async(self, plain_password: str, hashed_password: str):
+        """
+        Verify a password in the hashing process pool without blocking the event loop.
+
+        Args:
+            plain_password (str): The plain password to verify.
+            hashed_password (str): The hashed password to verify against.
+
+        Returns:
+            bool: True if the passwords match, False otherwise.
+        """
+        return await hashing_executor.verify(plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str):
+        """
+        Hash a password in the hashing process pool without blocking the event loop.
+
+        Args:
+            password (str): The password to hash.
+
+        Returns:
+            str: The hashed password.
+        """
+        return await hashing_executor.hash(password)
 
     # Define a function to send an email
     async def send_email(self, email: str, subject: str, message: str):
         """
-        Send an email.
+        Send an email through the outbox without waiting for the SMTP server.
 
         Args:
             email (str): The recipient email address.
@@ -59,26 +84,7 @@ class Auth:
         Returns:
             None
         """
-        # Configure SMTP server
-        smtp_server = "smtp.example.com"
-        smtp_port = 587
-        smtp_username = "your_smtp_username"
-        smtp_password = "your_smtp_password"
-
-        # Create message container
-        msg = MIMEMultipart()
-        msg['From'] = smtp_username
-        msg['To'] = email
-        msg['Subject'] = subject
-
-        # Add message body
-        msg.attach(MIMEText(message, 'plain'))
-
-        # Connect to SMTP server and send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg)
+        email_outbox.enqueue(email, subject, message)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -92,6 +98,8 @@ class Auth:
         Returns:
             str: The encoded access token.
         """
+        from jose import jwt
+
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
@@ -113,6 +121,8 @@ class Auth:
         Returns:
             str: The encoded refresh token.
         """
+        from jose import jwt
+
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
@@ -122,26 +132,68 @@ class Auth:
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
-    async def decode_refresh_token(self, refresh_token: str):
+    def decode_token(self, token: str) -> dict:
         """
-        Decode the provided refresh token and extract the email.
+        Verify a token and return its claims, from the claims cache when it was verified before.
+
+        Args:
+            token (str): The encoded token.
+
+        Returns:
+            dict: The claims of the token.
+
+        Raises:
+            JWTError: The token is invalid or expired.
+        """
+        from jose import jwt
+
+        return token_claims.decode(token, lambda t: jwt.decode(t, self.SECRET_KEY, algorithms=[self.ALGORITHM]))
+
+    def revoke_token(self, token: str):
+        """
+        Drop a revoked token from the claims cache.
+
+        Args:
+            token (str): The encoded token.
+        """
+        token_claims.invalidate(token)
+
+    def decode_refresh_claims(self, refresh_token: str) -> dict:
+        """
+        Verify a refresh token and return its claims.
 
         Args:
             refresh_token (str): The refresh token to decode.
 
         Returns:
-            str: The email extracted from the token.
+            dict: The claims, with the email in ``sub`` and the session family in ``fam``.
+
+        Raises:
+            HTTPException: 401 if the token is invalid, expired or not a refresh token.
         """
+        from jose import JWTError
+
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+            payload = self.decode_token(refresh_token)
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+        if payload['scope'] != 'refresh_token':
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+        return payload
+
+    async def decode_refresh_token(self, refresh_token: str):
+        """
+        Decode the provided refresh token and extract the email.
+
+        Args:
+            refresh_token (str): The refresh token to decode.
+
+        Returns:
+            str: The email extracted from the token.
+        """
+        return self.decode_refresh_claims(refresh_token)['sub']
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_session)):
         """
         Get the current authenticated user.
 
@@ -157,10 +209,11 @@ class Auth:
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+        from jose import JWTError
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
@@ -170,7 +223,7 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
         else:
-            user = await repository_users.get_user_by_email(email, db)
+            user = await user_cache.get_user(email, lambda: repository_users.get_user_by_email(email, db))
             if user is None:
                 raise credentials_exception
             return user
@@ -0,0 +1,335 @@
+import abc
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, UploadFile, status
+
+from src.database.db import session_scope
+from src.database.models import User
+from src.repository import users as repository_users
+from src.services.redis_client import get_redis, redis_errors
+
+logger = logging.getLogger(__name__)
+
+# Avatar pipeline configuration
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", 10 * 1024 * 1024))
+AVATAR_MAX_PIXELS = int(os.getenv("AVATAR_MAX_PIXELS", 40_000_000))
+# Square thumbnail sizes in pixels; User.avatar points to the first one
+AVATAR_SIZES = tuple(int(size) for size in os.getenv("AVATAR_SIZES", "256,64").split(","))
+AVATAR_QUALITY = int(os.getenv("AVATAR_QUALITY", 85))
+AVATAR_WORKERS = int(os.getenv("AVATAR_WORKERS", 2))
+AVATAR_STATUS_EXPIRE_SECONDS = int(os.getenv("AVATAR_STATUS_EXPIRE_SECONDS", 3600))
+AVATAR_STATUS_KEY_PREFIX = "avatar:"
+# "cloudinary", or "local" to write the thumbnails to AVATAR_LOCAL_DIR, served at AVATAR_LOCAL_URL
+AVATAR_STORAGE = os.getenv("AVATAR_STORAGE", "cloudinary")
+AVATAR_LOCAL_DIR = os.getenv("AVATAR_LOCAL_DIR", os.path.join(tempfile.gettempdir(), "contacts_api_avatars"))
+AVATAR_LOCAL_URL = os.getenv("AVATAR_LOCAL_URL", "/static/avatars")
+
+SPOOL_CHUNK_BYTES = 64 * 1024
+
+
+def spool(source, path: str, max_bytes: int) -> int:
+    """
+    Copy an upload to a file, at most ``max_bytes`` of it. Runs in a worker thread.
+
+    Args:
+        source (BinaryIO): The uploaded file.
+        path (str): File to write.
+        max_bytes (int): Largest accepted upload.
+
+    Returns:
+        int: Bytes written, or -1 if the upload is larger than ``max_bytes``.
+    """
+    written = 0
+    with open(path, "wb") as target:
+        while chunk := source.read(SPOOL_CHUNK_BYTES):
+            written += len(chunk)
+            if written > max_bytes:
+                return -1
+            target.write(chunk)
+    return written
+
+
+def resize_avatar(path: str, sizes: tuple = AVATAR_SIZES, quality: int = AVATAR_QUALITY,
+                  max_pixels: int = AVATAR_MAX_PIXELS) -> list:
+    """
+    Downscale an image to square JPEG thumbnails. Runs in a worker thread.
+
+    JPEGs are decoded at the smallest scale still larger than the biggest
+    thumbnail, so a large photo is never decoded at full size.
+
+    Args:
+        path (str): The spooled upload.
+        sizes (tuple): Thumbnail sizes in pixels.
+        quality (int): JPEG quality.
+        max_pixels (int): Largest accepted image, checked before decoding.
+
+    Returns:
+        list: ``(size, JPEG bytes)`` pairs in the order of ``sizes``.
+
+    Raises:
+        ValueError: The file is not an image or is too large.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as image:
+            if image.width * image.height > max_pixels:
+                raise ValueError(f"Image is larger than {max_pixels} pixels")
+            largest = max(sizes)
+            image.draft("RGB", (largest, largest))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            thumbnails = []
+            for size in sizes:
+                thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+                data = io.BytesIO()
+                thumbnail.save(data, "JPEG", quality=quality, optimize=True)
+                thumbnails.append((size, data.getvalue()))
+            return thumbnails
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"Unreadable image: {e}")
+
+
+class AvatarStorage(abc.ABC):
+    """
+    Where avatar thumbnails are stored. ``save`` is blocking and is called from worker threads.
+    """
+
+    @abc.abstractmethod
+    def save(self, key: str, data: bytes) -> str:
+        """
+        Store a JPEG thumbnail.
+
+        Args:
+            key (str): Unique name of the thumbnail, without extension.
+            data (bytes): JPEG data.
+
+        Returns:
+            str: Public URL of the thumbnail.
+        """
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Thumbnails uploaded to Cloudinary, configured by the CLOUDINARY_URL environment variable.
+    """
+
+    def __init__(self, folder: str = "avatars"):
+        self.folder = folder
+
+    def save(self, key: str, data: bytes) -> str:
+        import cloudinary.uploader
+
+        response = cloudinary.uploader.upload(data, public_id=f"{self.folder}/{key}", overwrite=True,
+                                              resource_type="image")
+        return response["secure_url"]
+
+
+class LocalStorage(AvatarStorage):
+    """
+    Thumbnails written to a local directory, for tests and offline use.
+    """
+
+    def __init__(self, directory: str = AVATAR_LOCAL_DIR, base_url: str = AVATAR_LOCAL_URL):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+
+    def save(self, key: str, data: bytes) -> str:
+        path = os.path.join(self.directory, f"{key}.jpg")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        return f"{self.base_url}/{key}.jpg"
+
+
+def create_storage(kind: str = AVATAR_STORAGE) -> AvatarStorage:
+    """
+    Create the storage backend named by AVATAR_STORAGE.
+
+    Args:
+        kind (str): "cloudinary" or "local".
+
+    Returns:
+        AvatarStorage: The backend.
+    """
+    if kind == "local":
+        return LocalStorage()
+    if kind == "cloudinary":
+        return CloudinaryStorage()
+    raise ValueError(f"Unknown avatar storage: {kind}")
+
+
+class AvatarPipeline:
+    """
+    Avatar uploads processed in the background.
+
+    ``submit`` spools the upload and returns at once; the image is resized
+    in a thread pool, the thumbnails are stored and User.avatar is updated
+    when they are. The state of each user's latest job is kept in Redis, so
+    every worker process can report it and a job finishing after a newer one
+    was submitted doesn't overwrite the newer avatar.
+    """
+
+    def __init__(self, storage: AvatarStorage = None, sizes: tuple = AVATAR_SIZES,
+                 max_bytes: int = AVATAR_MAX_BYTES, workers: int = AVATAR_WORKERS):
+        self._storage = storage
+        self.sizes = sizes
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.tasks = set()
+        self._executor = None
+
+    @property
+    def storage(self) -> AvatarStorage:
+        """
+        The storage backend, created from AVATAR_STORAGE unless one was passed in.
+        """
+        if self._storage is None:
+            self._storage = create_storage()
+        return self._storage
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        The resize threads, started on first use.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="avatar")
+        return self._executor
+
+    def key(self, user_id: int) -> str:
+        return AVATAR_STATUS_KEY_PREFIX + str(user_id)
+
+    async def _set_status(self, user_id: int, record: dict):
+        try:
+            await get_redis().set(self.key(user_id), json.dumps(record), ex=AVATAR_STATUS_EXPIRE_SECONDS)
+        except redis_errors() as e:
+            logger.warning("Storing avatar status failed: %s", e)
+
+    async def status(self, user_id: int) -> dict:
+        """
+        State of the user's latest avatar upload.
+
+        Args:
+            user_id (int): The user.
+
+        Returns:
+            dict: ``status`` ("pending", "ready", "failed" or "none") with the job id, the
+            thumbnail URLs when ready and the reason when failed.
+        """
+        try:
+            record = await get_redis().get(self.key(user_id))
+        except redis_errors() as e:
+            logger.warning("Reading avatar status failed: %s", e)
+            record = None
+        return json.loads(record) if record is not None else {"status": "none"}
+
+    async def submit(self, user: User, file: UploadFile) -> dict:
+        """
+        Spool an uploaded avatar and start processing it in the background.
+
+        Args:
+            user (User): Owner of the avatar.
+            file (UploadFile): The uploaded image.
+
+        Returns:
+            dict: The pending status of the job.
+
+        Raises:
+            HTTPException: 415 if the upload is not an image, 413 if it is larger than ``max_bytes``.
+        """
+        if file.content_type and not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Avatar must be an image")
+        if file.size is not None and file.size > self.max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                                detail=f"Avatar is larger than {self.max_bytes} bytes")
+        # The upload is closed with the request, so the job works on a copy of its own
+        fd, path = tempfile.mkstemp(prefix="avatar-")
+        os.close(fd)
+        try:
+            written = await asyncio.to_thread(spool, file.file, path, self.max_bytes)
+        except BaseException:
+            os.remove(path)
+            raise
+        if written < 0:
+            os.remove(path)
+            raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                                detail=f"Avatar is larger than {self.max_bytes} bytes")
+
+        record = {"status": "pending", "job": uuid.uuid4().hex}
+        await self._set_status(user.id, record)
+        task = asyncio.create_task(self.process(user.id, user.email, record["job"], path))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return record
+
+    async def process(self, user_id: int, email: str, job: str, path: str):
+        """
+        Resize a spooled avatar, store the thumbnails and point User.avatar to them.
+
+        Args:
+            user_id (int): Owner of the avatar.
+            email (str): Email of the owner.
+            job (str): Job id returned by ``submit``.
+            path (str): The spooled upload, removed when done.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                thumbnails = await loop.run_in_executor(self.executor, resize_avatar, path, self.sizes)
+            except ValueError as e:
+                await self._set_status(user_id, {"status": "failed", "job": job, "detail": str(e)})
+                return
+            digest = hashlib.sha256(thumbnails[0][1]).hexdigest()[:16]
+            urls = await asyncio.gather(*(
+                asyncio.to_thread(self.storage.save, f"{user_id}/{size}-{digest}", data)
+                for size, data in thumbnails
+            ))
+            if (await self.status(user_id)).get("job", job) != job:
+                logger.info("Avatar job %s of user %s was superseded", job, user_id)
+                return
+            async with session_scope() as db:
+                await repository_users.update_avatar(email, urls[0], db)
+            await self._set_status(user_id, {"status": "ready", "job": job, "avatar": urls[0],
+                                             "sizes": dict(zip(map(str, self.sizes), urls))})
+        except Exception:
+            logger.exception("Avatar job %s of user %s failed", job, user_id)
+            await self._set_status(user_id, {"status": "failed", "job": job, "detail": "Processing failed"})
+        finally:
+            os.remove(path)
+
+    async def join(self):
+        """
+        Wait for the jobs in progress.
+        """
+        while self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def stop(self, timeout: float = 30):
+        """
+        Let the jobs in progress finish within ``timeout`` seconds, then cancel them and stop the threads.
+
+        Args:
+            timeout (float): Seconds to wait for the jobs.
+        """
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Cancelling %d avatar jobs", len(self.tasks))
+            for task in list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+avatar_pipeline = AvatarPipeline()
@@ -0,0 +1,385 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from datetime import datetime
+
+from src.database.models import User
+from src.services.redis_client import get_redis, redis_errors
+
+logger = logging.getLogger(__name__)
+
+# User cache configuration
+USER_CACHE_KEY_PREFIX = "user:"
+USER_CACHE_EXPIRE_SECONDS = int(os.getenv("USER_CACHE_EXPIRE_SECONDS", 3600))
+USER_CACHE_NEGATIVE_EXPIRE_SECONDS = int(os.getenv("USER_CACHE_NEGATIVE_EXPIRE_SECONDS", 60))
+USER_CACHE_LOCAL_SIZE = int(os.getenv("USER_CACHE_LOCAL_SIZE", 1024))
+USER_CACHE_LOCAL_EXPIRE_SECONDS = int(os.getenv("USER_CACHE_LOCAL_EXPIRE_SECONDS", 30))
+# Keys invalidated by any worker are published here, every worker drops them from its local tier
+USER_CACHE_INVALIDATION_CHANNEL = "user-cache:invalidate"
+REDIS_RETRY_SECONDS = 30
+
+# Token claims cache configuration
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+
+# Order of the fields in a serialized user record
+USER_RECORD_FIELDS = ("id", "username", "email", "avatar", "email_verified", "created_at", "shard")
+
+# Marker stored for emails that have no user
+NOT_FOUND = "null"
+
+
+def dump_user(user: User | None) -> str:
+    """
+    Serialize a user into a compact record without the password and refresh token.
+
+    Args:
+        user (User | None): User to serialize, None for an unknown email.
+
+    Returns:
+        str: JSON array of the fields in USER_RECORD_FIELDS, or the not-found marker.
+    """
+    if user is None:
+        return NOT_FOUND
+    created_at = user.created_at.isoformat() if user.created_at else None
+    return json.dumps([user.id, user.username, user.email, user.avatar, user.email_verified, created_at, user.shard],
+                      separators=(",", ":"))
+
+
+def load_user(record: str | bytes) -> User | None:
+    """
+    Build a detached user from a serialized record.
+
+    Args:
+        record (str | bytes): Record produced by dump_user.
+
+    Returns:
+        User | None: Detached user object, or None for the not-found marker.
+    """
+    values = json.loads(record)
+    if values is None:
+        return None
+    fields = dict(zip(USER_RECORD_FIELDS, values))
+    if fields["created_at"]:
+        fields["created_at"] = datetime.fromisoformat(fields["created_at"])
+    return User(**fields)
+
+
+class LRUCache:
+    """
+    Bounded in-process cache with least-recently-used eviction and a per-entry TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """
+        Get a value that has not expired yet.
+
+        Args:
+            key: Cache key.
+
+        Returns:
+            The cached value, or None if it is missing or expired.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        Store a value, evicting the least recently used entry when full.
+
+        Args:
+            key: Cache key.
+            value: Value to store.
+            ttl (float | None): Lifetime in seconds. Defaults to the cache TTL.
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove a value if present.
+
+        Args:
+            key: Cache key.
+        """
+        self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every value.
+        """
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class UserCache:
+    """
+    Two-tier user cache: an in-process LRU in front of Redis.
+
+    Entries are serialized with dump_user. Unknown emails are cached as well
+    so repeated lookups of a missing user don't reach the database.
+
+    Invalidations are published on Redis, and once ``start`` is called each
+    worker drops them from its local tier, so a changed user is not served
+    from another worker's stale copy. While the subscription is down the
+    local tier is bypassed, and it is cleared when the subscription is back,
+    since invalidations may have been missed meanwhile.
+    """
+
+    def __init__(self, local: LRUCache, redis_client=None):
+        self._redis = redis_client
+        self.local = local
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self._redis_down_until = 0.0
+        self.subscribed = False
+        # Bumped on every invalidation received, so a record read before one is not kept locally after it
+        self.generation = 0
+        self._listener = None
+
+    @property
+    def redis(self):
+        """
+        The Redis client, the shared one unless a client was passed in.
+        """
+        return self._redis if self._redis is not None else get_redis()
+
+    def key(self, email: str) -> str:
+        return USER_CACHE_KEY_PREFIX + str(email)
+
+    async def _redis_call(self, method: str, *args):
+        # Redis is optional: while it's unreachable the cache only uses the local tier
+        if self._redis_down_until > time.monotonic():
+            return None
+        try:
+            return await getattr(self.redis, method)(*args)
+        except redis_errors():
+            self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+            return None
+
+    async def get_user(self, email: str, loader) -> User | None:
+        """
+        Get a user from the local tier, then Redis, then the loader.
+
+        Args:
+            email (str): The email of the user.
+            loader (Callable): Coroutine function loading the user from the database.
+
+        Returns:
+            User | None: The user, or None if no user has this email.
+        """
+        key = self.key(email)
+        record = self.local.get(key) if self.local_valid else None
+        if record is not None:
+            self.local_hits += 1
+            return load_user(record)
+
+        generation = self.generation
+        record = await self._redis_call("get", key)
+        if record is not None:
+            self.redis_hits += 1
+            self._set_local(key, record, generation)
+            return load_user(record)
+
+        self.misses += 1
+        user = await loader()
+        await self.set_user(email, user, generation)
+        return user
+
+    async def set_user(self, email: str, user: User | None, generation: int = None):
+        """
+        Store a user, or a negative entry for an unknown email, in both tiers.
+
+        Args:
+            email (str): The email of the user.
+            user (User | None): The user, None if no user has this email.
+            generation (int): Generation the user was read at; not stored locally if an invalidation came since.
+        """
+        key = self.key(email)
+        record = dump_user(user)
+        expire = USER_CACHE_EXPIRE_SECONDS if user is not None else USER_CACHE_NEGATIVE_EXPIRE_SECONDS
+        self._set_local(key, record, self.generation if generation is None else generation)
+        await self._redis_call("setex", key, expire, record)
+
+    async def invalidate(self, email: str):
+        """
+        Remove a user from both tiers, and from the local tier of every other worker.
+
+        Args:
+            email (str): The email of the user.
+        """
+        key = self.key(email)
+        self.local.delete(key)
+        await self._redis_call("delete", key)
+        await self._redis_call("publish", USER_CACHE_INVALIDATION_CHANNEL, key)
+
+    @property
+    def local_valid(self) -> bool:
+        """
+        Whether the local tier can be trusted: the invalidations are received, or were never subscribed to.
+        """
+        return self.subscribed or self._listener is None
+
+    def _set_local(self, key: str, record, generation: int):
+        if generation == self.generation:
+            self.local.set(key, record, self._local_ttl(record))
+
+    def _drop_local(self, key):
+        self.generation += 1
+        self.local.delete(key.decode() if isinstance(key, bytes) else key)
+
+    async def listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(USER_CACHE_INVALIDATION_CHANNEL)
+                self.generation += 1
+                self.local.clear()
+                self.subscribed = True
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._drop_local(message["data"])
+            except (*redis_errors(), OSError) as e:
+                logger.warning("User cache invalidations are not received, the local tier is bypassed: %s", e)
+            finally:
+                self.subscribed = False
+                if pubsub is not None:
+                    with suppress(Exception):
+                        await pubsub.aclose()
+            await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+    async def start(self):
+        """
+        Start receiving the invalidations of the other workers. Called from the application lifespan.
+        """
+        if self._listener is None:
+            self._listener = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        """
+        Stop receiving invalidations.
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _local_ttl(self, record) -> float:
+        if record in (NOT_FOUND, NOT_FOUND.encode()):
+            return min(USER_CACHE_LOCAL_EXPIRE_SECONDS, USER_CACHE_NEGATIVE_EXPIRE_SECONDS)
+        return USER_CACHE_LOCAL_EXPIRE_SECONDS
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the cache.
+
+        Returns:
+            dict: Local hits, Redis hits, misses and the local tier size.
+        """
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "local_size": len(self.local),
+        }
+
+
+user_cache = UserCache(LRUCache(maxsize=USER_CACHE_LOCAL_SIZE, ttl=USER_CACHE_LOCAL_EXPIRE_SECONDS))
+
+
+def token_digest(token: str) -> bytes:
+    """
+    SHA-256 digest of a token, used as its cache key so tokens are not kept in memory.
+
+    Args:
+        token (str): Encoded JWT.
+
+    Returns:
+        bytes: The digest.
+    """
+    return hashlib.sha256(token.encode()).digest()
+
+
+class ClaimsCache:
+    """
+    In-process LRU of verified JWT claims, keyed by the token digest.
+
+    An entry expires exactly at the token's ``exp`` claim, so an expired
+    token always goes back to full verification and fails it. Revoked tokens
+    are removed with invalidate.
+    """
+
+    def __init__(self, local: LRUCache):
+        self.local = local
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, token: str, verify) -> dict:
+        """
+        Get the claims of a token, verifying it only when they are not cached.
+
+        Args:
+            token (str): Encoded JWT.
+            verify (Callable): Function verifying the token and returning its claims; it raises for invalid tokens.
+
+        Returns:
+            dict: The verified claims.
+        """
+        key = token_digest(token)
+        claims = self.local.get(key)
+        if claims is not None and claims["exp"] > time.time():
+            self.hits += 1
+            return claims
+        self.misses += 1
+        claims = verify(token)
+        ttl = claims.get("exp", 0) - time.time()
+        if ttl > 0:
+            self.local.set(key, claims, ttl)
+        return claims
+
+    def invalidate(self, token: str | None):
+        """
+        Forget the claims of a revoked token.
+
+        Args:
+            token (str | None): Encoded JWT; None is ignored.
+        """
+        if token:
+            self.local.delete(token_digest(token))
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the cache.
+
+        Returns:
+            dict: Hits, misses and the number of cached tokens.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.local)}
+
+
+token_claims = ClaimsCache(LRUCache(maxsize=TOKEN_CACHE_SIZE, ttl=0))
@@ -0,0 +1,140 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+
+# Hashing pool configuration
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))
+HASH_MAX_IN_FLIGHT = int(os.getenv("HASH_MAX_IN_FLIGHT", HASH_WORKERS))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", 100))
+
+pwd_context = None
+
+
+def get_pwd_context():
+    """
+    Get the bcrypt CryptContext, created on first use so only processes that hash import passlib.
+
+    Returns:
+        CryptContext: The shared context.
+    """
+    global pwd_context
+    if pwd_context is None:
+        from passlib.context import CryptContext
+
+        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return pwd_context
+
+
+def hash_password(password: str) -> str:
+    """
+    Hash a password with bcrypt. Runs inside the worker processes.
+
+    Args:
+        password (str): The password to hash.
+
+    Returns:
+        str: The hashed password.
+    """
+    return get_pwd_context().hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a password against a bcrypt hash. Runs inside the worker processes.
+
+    Args:
+        plain_password (str): The plain password to verify.
+        hashed_password (str): The hashed password to verify against.
+
+    Returns:
+        bool: True if the passwords match, False otherwise.
+    """
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+class HashingExecutor:
+    """
+    Process pool for bcrypt work with a bounded number of in-flight and queued jobs.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_in_flight: int = HASH_MAX_IN_FLIGHT,
+                 max_queue: int = HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.pending = 0
+        self._executor = None
+        self._slots = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """
+        The process pool, started on first use.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, fn, *args):
+        """
+        Run a hashing function in the process pool.
+
+        Args:
+            fn (Callable): Module-level function to run.
+            *args: Arguments passed to ``fn``.
+
+        Returns:
+            Any: Whatever ``fn`` returns.
+
+        Raises:
+            HTTPException: 503 if the queue of waiting jobs is full.
+        """
+        if self.pending >= self.max_in_flight + self.max_queue:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Server is busy, try again later", headers={"Retry-After": "1"})
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        self.pending += 1
+        try:
+            async with self._slots:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password in the process pool.
+
+        Args:
+            password (str): The password to hash.
+
+        Returns:
+            str: The hashed password.
+        """
+        return await self.run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verify a password in the process pool.
+
+        Args:
+            plain_password (str): The plain password to verify.
+            hashed_password (str): The hashed password to verify against.
+
+        Returns:
+            bool: True if the passwords match, False otherwise.
+        """
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        """
+        Stop the worker processes once the jobs in progress are done. Blocking; call it from a thread.
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+hashing_executor = HashingExecutor()
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import os
+from typing import TYPE_CHECKING
+
+# smtplib and email.mime are imported when the first message is built or sent
+if TYPE_CHECKING:
+    import smtplib
+    from email.mime.multipart import MIMEMultipart
+
+logger = logging.getLogger(__name__)
+
+# SMTP configuration
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME", "your_email@example.com")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "your_email_password")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_SENDER = os.getenv("SMTP_SENDER", SMTP_USERNAME)
+
+# Outbox configuration
+OUTBOX_MAX_SIZE = int(os.getenv("OUTBOX_MAX_SIZE", 10000))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_SECONDS = float(os.getenv("OUTBOX_RETRY_SECONDS", 1))
+OUTBOX_MAX_RETRY_SECONDS = float(os.getenv("OUTBOX_MAX_RETRY_SECONDS", 300))
+
+
+def build_message(sender: str, email: str, subject: str, message: str) -> "MIMEMultipart":
+    """
+    Build a plain text email message.
+
+    Args:
+        sender (str): The sender email address.
+        email (str): The recipient email address.
+        subject (str): The subject of the email.
+        message (str): The content of the email.
+
+    Returns:
+        MIMEMultipart: The email message.
+    """
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(message, 'plain'))
+    return msg
+
+
+class OutboxMessage:
+    """
+    A queued email with the number of delivery attempts made so far.
+    """
+
+    def __init__(self, msg: "MIMEMultipart"):
+        self.msg = msg
+        self.attempts = 0
+
+
+class EmailOutbox:
+    """
+    Queue of outgoing emails delivered in batches by a background worker.
+
+    The worker keeps one SMTP connection open and reuses it for every batch,
+    reconnecting only when the server drops it. Failed messages are retried
+    with exponential backoff; on stop the ones waiting for a retry are sent
+    at once with the rest of the queue.
+    """
+
+    def __init__(self, host: str = SMTP_SERVER, port: int = SMTP_PORT, username: str | None = SMTP_USERNAME,
+                 password: str | None = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS, sender: str = SMTP_SENDER,
+                 max_size: int = OUTBOX_MAX_SIZE, batch_size: int = OUTBOX_BATCH_SIZE,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, retry_seconds: float = OUTBOX_RETRY_SECONDS,
+                 max_retry_seconds: float = OUTBOX_MAX_RETRY_SECONDS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.queue = asyncio.Queue(maxsize=max_size)
+        # Messages waiting for a retry, with the handle of their scheduled requeue
+        self._retries = {}
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.connections = 0
+        self._connection = None
+        self._worker = None
+
+    def enqueue(self, email: str, subject: str, message: str) -> bool:
+        """
+        Queue an email for delivery without waiting for the SMTP server.
+
+        Args:
+            email (str): The recipient email address.
+            subject (str): The subject of the email.
+            message (str): The content of the email.
+
+        Returns:
+            bool: True if the email was queued, False if the outbox is full.
+        """
+        try:
+            self.queue.put_nowait(OutboxMessage(build_message(self.sender, email, subject, message)))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error("Email outbox is full, dropping message to %s", email)
+            return False
+
+    def depth(self) -> int:
+        """
+        Number of emails waiting to be delivered, including the ones waiting for a retry.
+
+        Returns:
+            int: Queue depth.
+        """
+        return self.queue.qsize() + len(self._retries)
+
+    def stats(self) -> dict:
+        """
+        Counters of the outbox.
+
+        Returns:
+            dict: Queue depth, emails waiting for a retry, sent, failed and dropped emails and SMTP connections opened.
+        """
+        return {
+            "depth": self.depth(),
+            "retrying": len(self._retries),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "connections": self.connections,
+        }
+
+    def _connect(self) -> "smtplib.SMTP":
+        import smtplib
+
+        # Reuse the open connection while the server still answers NOOP
+        if self._connection is not None:
+            try:
+                if self._connection.noop()[0] == 250:
+                    return self._connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close()
+        connection = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            connection.starttls()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        self._connection = connection
+        self.connections += 1
+        return connection
+
+    def _close(self):
+        import smtplib
+
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except (smtplib.SMTPException, OSError):
+                self._connection.close()
+            self._connection = None
+
+    def _deliver(self, batch: list) -> tuple[list, list]:
+        # Runs in a worker thread. Returns the messages to retry and the ones that failed for good.
+        import smtplib
+
+        retry, rejected = [], []
+        try:
+            connection = self._connect()
+        except (smtplib.SMTPException, OSError) as e:
+            logger.warning("SMTP connection failed: %s", e)
+            return batch, rejected
+        for index, item in enumerate(batch):
+            try:
+                connection.send_message(item.msg)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                logger.error("SMTP server refused message to %s: %s", item.msg['To'], e)
+                rejected.append(item)
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning("SMTP delivery failed: %s", e)
+                self._close()
+                retry.extend(batch[index:])
+                break
+        return retry, rejected
+
+    async def send_batch(self, batch: list):
+        """
+        Deliver a batch of messages over the shared connection and schedule retries.
+
+        Args:
+            batch (list): Messages taken from the queue.
+        """
+        retry, rejected = await asyncio.to_thread(self._deliver, batch)
+        self.sent += len(batch) - len(retry) - len(rejected)
+        self.failed += len(rejected)
+        for item in retry:
+            item.attempts += 1
+            if item.attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error("Giving up on message to %s after %d attempts", item.msg['To'], item.attempts)
+                continue
+            delay = min(self.retry_seconds * 2 ** (item.attempts - 1), self.max_retry_seconds)
+            self._retries[item] = asyncio.get_running_loop().call_later(delay, self._requeue, item)
+
+    def _requeue(self, item: OutboxMessage):
+        self._retries.pop(item, None)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error("Email outbox is full, dropping message to %s", item.msg['To'])
+
+    def _requeue_retries(self):
+        # Queue the messages waiting for a retry now rather than after their backoff
+        for item, handle in list(self._retries.items()):
+            handle.cancel()
+            self._requeue(item)
+
+    async def run(self):
+        """
+        Worker loop: wait for a message, then drain up to a batch and deliver it.
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.send_batch(batch)
+            except Exception:
+                logger.exception("Email outbox worker failed")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def start(self):
+        """
+        Start the background worker. Called from the application lifespan.
+        """
+        if self._worker is None:
+            self._worker = asyncio.create_task(self.run())
+
+    async def stop(self, timeout: float = 5):
+        """
+        Deliver what is queued within ``timeout`` seconds, then stop the worker and close the connection.
+
+        Messages waiting for a retry are queued again at once instead of
+        after their backoff. What is still undelivered at the timeout stays
+        queued, for the outbox to be started again.
+
+        Args:
+            timeout (float): Seconds to wait for the queue to drain.
+        """
+        if self._worker is not None:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            try:
+                # Each pass delivers the queue; the messages that failed again are retried in the next one
+                while True:
+                    self._requeue_retries()
+                    await asyncio.wait_for(self.queue.join(), deadline - loop.time())
+                    if not self._retries:
+                        break
+            except asyncio.TimeoutError:
+                logger.warning("Stopping email outbox with %d messages queued", self.depth())
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._requeue_retries()
+            # asyncio.Queue binds to the loop that first waits on it; carry what is left over to a
+            # fresh queue so the outbox can be started again on another loop
+            pending = asyncio.Queue(maxsize=self.queue.maxsize)
+            while not self.queue.empty():
+                pending.put_nowait(self.queue.get_nowait())
+            self.queue = pending
+        await asyncio.to_thread(self._close)
+
+
+class DebuggingSMTPServer:
+    """
+    Minimal local SMTP server that keeps received messages in memory.
+
+    Stand-in for a real server in tests and local debugging: it accepts any
+    sender and recipient and does not support STARTTLS or AUTH.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.messages = []
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        writer.write(b"220 localhost debugging SMTP server\r\n")
+        envelope = {"from": None, "to": []}
+        try:
+            while line := await reader.readline():
+                command = line.decode().strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    writer.write(b"250 localhost\r\n")
+                elif verb == "MAIL":
+                    envelope = {"from": command.split(":", 1)[1].strip(" <>"), "to": []}
+                    writer.write(b"250 OK\r\n")
+                elif verb == "RCPT":
+                    envelope["to"].append(command.split(":", 1)[1].strip(" <>"))
+                    writer.write(b"250 OK\r\n")
+                elif verb == "DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    data = []
+                    while (data_line := await reader.readline()) not in (b".\r\n", b""):
+                        data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    self.messages.append({**envelope, "data": b"".join(data).decode()})
+                    writer.write(b"250 OK\r\n")
+                elif verb == "QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                elif verb in ("NOOP", "RSET"):
+                    writer.write(b"250 OK\r\n")
+                else:
+                    writer.write(b"502 Command not implemented\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+email_outbox = EmailOutbox()
@@ -0,0 +1,367 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from contextlib import suppress
+
+logger = logging.getLogger(__name__)
+
+# Metrics configuration
+# Each worker process writes its metrics to this directory, /metrics sums the files of the live workers.
+# Workers started by the same uvicorn process share the default directory.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"contacts_api_metrics_{os.getppid()}"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# Counters and histograms of the exited workers, kept so the totals never go down
+DEAD_WORKERS_FILE = "dead.json"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# name: (type, help, label names, histogram buckets)
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by route and status class.", ("method", "route", "status"), None),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency.", ("method", "route"), LATENCY_BUCKETS),
+    "http_request_size_bytes": ("histogram", "HTTP request body size.", ("method", "route"), SIZE_BUCKETS),
+    "http_response_size_bytes": ("histogram", "HTTP response body size.", ("method", "route"), SIZE_BUCKETS),
+    "http_requests_in_progress": ("gauge", "HTTP requests being served.", (), None),
+    "db_pool_size": ("gauge", "Connections kept open by the database pool.", (), None),
+    "db_pool_checked_out": ("gauge", "Database connections in use.", (), None),
+    "db_pool_overflow": ("gauge", "Database connections open beyond the pool size.", (), None),
+    "user_cache_requests_total": ("counter", "User cache lookups by result.", ("result",), None),
+    "user_cache_size": ("gauge", "Users held in the local user cache.", (), None),
+    "rate_limit_rejections_total": ("counter", "Requests refused by the rate limiter.", (), None),
+    "db_read_sessions_total": ("counter", "Sessions of the read-only routes by target.", ("target",), None),
+    "db_shard_sessions_total": ("counter", "Contact sessions by the shard they were opened on.", ("shard",), None),
+    "email_outbox_depth": ("gauge", "Emails waiting to be delivered, including retries.", (), None),
+    "email_outbox_retrying": ("gauge", "Emails waiting for a retry.", (), None),
+    "email_outbox_messages_total": ("counter", "Emails leaving the outbox by result.", ("result",), None),
+    "email_outbox_connections_total": ("counter", "SMTP connections opened by the outbox.", (), None),
+}
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def merge_samples(merged: dict, snapshot: dict, kinds=("counter", "gauge", "histogram")):
+    """
+    Add the samples of a snapshot to merged values, summing histograms bucket by bucket.
+
+    Args:
+        merged (dict): Metric name to a dict of label values to the summed value, updated in place.
+        snapshot (dict): Metric name to a list of [label values, value] pairs.
+        kinds (tuple): Types of the metrics to add, the others are skipped.
+    """
+    for name, samples in snapshot.items():
+        if name not in METRICS or METRICS[name][0] not in kinds:
+            continue
+        series = merged.setdefault(name, {})
+        for labels, value in samples:
+            labels = tuple(labels)
+            current = series.get(labels)
+            if current is None:
+                series[labels] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                series[labels] = [a + b for a, b in zip(current, value)]
+            else:
+                series[labels] = current + value
+
+
+class MetricsRegistry:
+    """
+    Request metrics of one worker process, merged with the other workers' on collection.
+
+    Counters and histograms are kept in plain dicts and written to
+    ``<directory>/<pid>.json`` in the background, so recording a request
+    costs a few dict updates. Gauges are read from the registered
+    collectors when the snapshot is taken.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR, flush_seconds: float = METRICS_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.values = {name: {} for name in METRICS}
+        self.in_progress = 0
+        self.collectors = []
+        self._worker = None
+
+    def add_collector(self, collector):
+        """
+        Register a function returning ``(name, label values, value)`` samples, called on every snapshot.
+
+        Args:
+            collector (Callable): Function returning an iterable of samples of the gauges and counters in METRICS.
+        """
+        self.collectors.append(collector)
+
+    def observe(self, name: str, labels: tuple, value: float):
+        buckets = METRICS[name][3]
+        series = self.values[name].get(labels)
+        if series is None:
+            # Bucket counts, then sum and count
+            series = self.values[name][labels] = [0] * (len(buckets) + 3)
+        series[bisect_left(buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, request_bytes: int,
+                        response_bytes: int):
+        """
+        Record a served request.
+
+        Args:
+            method (str): HTTP method.
+            route (str): Route template, e.g. ``/contacts/{contact_id}``.
+            status (int): Response status code.
+            seconds (float): Time to serve the request.
+            request_bytes (int): Size of the request body.
+            response_bytes (int): Size of the response body.
+        """
+        counter = self.values["http_requests_total"]
+        key = (method, route, f"{status // 100}xx")
+        counter[key] = counter.get(key, 0) + 1
+        self.observe("http_request_duration_seconds", (method, route), seconds)
+        self.observe("http_request_size_bytes", (method, route), request_bytes)
+        self.observe("http_response_size_bytes", (method, route), response_bytes)
+
+    def snapshot(self) -> dict:
+        """
+        Take the current values of this worker, including the collected gauges.
+
+        Returns:
+            dict: Metric name to a list of [label values, value] pairs.
+        """
+        values = {name: [[list(labels), value] for labels, value in series.items()]
+                  for name, series in self.values.items()}
+        values["http_requests_in_progress"] = [[[], self.in_progress]]
+        for collector in self.collectors:
+            try:
+                for name, labels, value in collector():
+                    values[name].append([list(labels), value])
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", getattr(collector, "__name__", collector), e)
+        return values
+
+    def flush(self, snapshot: dict = None):
+        """
+        Write the snapshot of this worker to the metrics directory.
+
+        Args:
+            snapshot (dict): Snapshot to write. Taken now when not given.
+        """
+        data = json.dumps(snapshot or self.snapshot())
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def retire(self, path: str):
+        """
+        Add the counters and histograms of an exited worker's file to the dead workers' file, then remove it.
+
+        Its gauges are dropped. The files are changed under a lock, so workers
+        retiring the same file at once add it only once.
+
+        Args:
+            path (str): File of the exited worker.
+        """
+        dead_path = os.path.join(self.directory, DEAD_WORKERS_FILE)
+        with open(os.path.join(self.directory, "dead.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except FileNotFoundError:
+                return
+            except ValueError:
+                snapshot = {}
+            merged = {}
+            with suppress(FileNotFoundError):
+                with open(dead_path) as f:
+                    merge_samples(merged, json.load(f))
+            merge_samples(merged, snapshot, ("counter", "histogram"))
+            data = json.dumps({name: [[list(labels), value] for labels, value in series.items()]
+                               for name, series in merged.items()})
+            with open(dead_path + ".tmp", "w") as f:
+                f.write(data)
+            os.replace(dead_path + ".tmp", dead_path)
+            os.remove(path)
+
+    def worker_snapshots(self) -> list:
+        """
+        Read the snapshots of the other live workers and the totals of the exited ones.
+
+        Files of exited workers are retired into the dead workers' file first.
+
+        Returns:
+            list: The snapshots.
+        """
+        snapshots = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return snapshots
+        for file_name in names:
+            pid = file_name.removesuffix(".json")
+            if pid == file_name or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                try:
+                    self.retire(path)
+                except OSError as e:
+                    logger.warning("Retiring metrics of worker %s failed: %s", pid, e)
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        try:
+            with open(os.path.join(self.directory, DEAD_WORKERS_FILE)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return snapshots
+
+    def collect(self, snapshot: dict = None) -> dict:
+        """
+        Sum the snapshots of all live workers and the totals of the exited ones.
+
+        Args:
+            snapshot (dict): Snapshot of this worker. Taken now when not given.
+
+        Returns:
+            dict: Metric name to a dict of label values to the summed value.
+        """
+        merged = {name: {} for name in METRICS}
+        for snapshot in [snapshot or self.snapshot(), *self.worker_snapshots()]:
+            merge_samples(merged, snapshot)
+        return merged
+
+    def render(self, snapshot: dict = None) -> str:
+        """
+        Render the metrics of all workers in the Prometheus text format.
+
+        Args:
+            snapshot (dict): Snapshot of this worker. Taken now when not given.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for name, series in self.collect(snapshot).items():
+            kind, description, label_names, buckets = METRICS[name]
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(label_names, labels)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, "+Inf"), value):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{format_labels(label_names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(label_names, labels)} {format_value(value[-2])}")
+                lines.append(f"{name}_count{format_labels(label_names, labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await asyncio.to_thread(self.flush, self.snapshot())
+            except OSError as e:
+                logger.warning("Writing metrics failed: %s", e)
+
+    async def start(self):
+        """
+        Start writing this worker's metrics in the background. Called from the application lifespan.
+        """
+        if self._worker is None:
+            self._worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop the background writer and add this worker's final counters to the dead workers' file.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        try:
+            await asyncio.to_thread(self.flush, self.snapshot())
+            await asyncio.to_thread(self.retire, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except OSError as e:
+            logger.warning("Retiring metrics of this worker failed: %s", e)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency, sizes and status of every HTTP request.
+
+    Requests are labelled with the template of the matched route, so
+    ``/contacts/1`` and ``/contacts/2`` are both ``/contacts/{contact_id}``.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = None):
+        self.app = app
+        self.registry = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        start = time.perf_counter()
+        sizes = [0, 0]
+        status = [500]
+
+        async def receive_counted():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes[0] += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes[1] += len(message.get("body", b""))
+            await send(message)
+
+        registry.in_progress += 1
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            registry.in_progress -= 1
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            registry.observe_request(scope["method"], route, status[0], time.perf_counter() - start, *sizes)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,320 @@
+import ipaddress
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+
+from src.services.redis_client import REDIS_BACKEND, get_redis, redis_errors
+
+logger = logging.getLogger(__name__)
+
+# Rate limit configuration
+# "redis" shares the buckets between all workers, "local" keeps them in each process
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "redis" if REDIS_BACKEND == "redis" else "local")
+RATE_LIMIT_KEY_PREFIX = "ratelimit:"
+RATE_LIMIT_LOCAL_SIZE = int(os.getenv("RATE_LIMIT_LOCAL_SIZE", 100_000))
+REDIS_RETRY_SECONDS = 30
+# Comma-separated addresses or networks of the proxies in front of the workers, e.g. "10.0.0.0/8,127.0.0.1".
+# The client IP is taken from X-Forwarded-For only when the request comes through them.
+RATE_LIMIT_TRUSTED_PROXIES = os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "")
+
+# Token buckets per route and scope as "<burst>/<seconds>": up to <burst> requests at once,
+# refilled at <burst> per <seconds>. Each can be overridden with RATE_LIMIT_<ROUTE>_<SCOPE>, "off" disables it.
+DEFAULT_RATE_LIMITS = {
+    "login": {"ip": "20/60", "account": "5/60"},
+    "signup": {"ip": "5/60", "account": "3/3600"},
+    "refresh_token": {"ip": "60/60"},
+}
+
+# Takes one token from every bucket of a request, or none when one of them is empty.
+# KEYS are the buckets, ARGV their capacity and refill rate in tokens per millisecond, in pairs.
+# Returns 0 when the request is allowed, otherwise the milliseconds until it would be.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'at')
+    local tokens = tonumber(state[1]) or capacity
+    local at = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - at, 0) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, math.ceil((1 - tokens) / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local tokens = levels[i] - 1
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'at', now)
+    redis.call('PEXPIRE', key, math.ceil((capacity - tokens) / rate) + 1000)
+end
+return 0
+"""
+
+
+def parse_limit(spec: str | None) -> tuple | None:
+    """
+    Parse a "<burst>/<seconds>" limit.
+
+    Args:
+        spec (str | None): The limit, or "off", "0" or None for no limit.
+
+    Returns:
+        tuple | None: Bucket capacity and refill rate in tokens per second, None for no limit.
+
+    Raises:
+        ValueError: The spec is malformed.
+    """
+    if spec is None or spec.strip().lower() in ("", "off", "0"):
+        return None
+    burst, seconds = spec.split("/")
+    capacity = int(burst)
+    return capacity, capacity / float(seconds)
+
+
+def load_limits(defaults: dict = DEFAULT_RATE_LIMITS) -> dict:
+    """
+    Read the limits of every route, with the RATE_LIMIT_<ROUTE>_<SCOPE> overrides applied.
+
+    Args:
+        defaults (dict): Route to scope to limit spec.
+
+    Returns:
+        dict: Route to scope to ``(capacity, tokens per second)``; disabled limits are left out.
+    """
+    limits = {}
+    for route, scopes in defaults.items():
+        for scope, spec in scopes.items():
+            limit = parse_limit(os.getenv(f"RATE_LIMIT_{route.upper()}_{scope.upper()}", spec))
+            if limit is not None:
+                limits.setdefault(route, {})[scope] = limit
+    return limits
+
+
+def parse_networks(spec: str) -> tuple:
+    """
+    Parse a comma-separated list of addresses and networks.
+
+    Args:
+        spec (str): The list, e.g. "10.0.0.0/8,::1".
+
+    Returns:
+        tuple: The networks, a single address as a network of one.
+
+    Raises:
+        ValueError: An entry is not an address or network.
+    """
+    return tuple(ipaddress.ip_network(entry.strip(), strict=False) for entry in spec.split(",") if entry.strip())
+
+
+def _trusted(address: str, proxies: tuple) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def client_ip(request: Request, proxies: tuple = None) -> str:
+    """
+    The address of the client, seen through the trusted proxies.
+
+    X-Forwarded-For is read from the right, as each proxy appends the
+    address it got the request from: the first address not of a trusted
+    proxy is the client. Anything to its left was sent by the client and
+    is ignored, so a client can't pick the bucket it is counted in.
+
+    Args:
+        request (Request): The request.
+        proxies (tuple): Networks of the trusted proxies, RATE_LIMIT_TRUSTED_PROXIES when not given.
+
+    Returns:
+        str: The client IP, or "unknown".
+    """
+    proxies = TRUSTED_PROXIES if proxies is None else proxies
+    address = request.client.host if request.client else "unknown"
+    if not _trusted(address, proxies):
+        return address
+    forwarded = [hop.strip() for header in request.headers.getlist("x-forwarded-for") for hop in header.split(",")]
+    for hop in reversed(forwarded):
+        if not hop:
+            continue
+        address = hop
+        if not _trusted(address, proxies):
+            break
+    return address
+
+
+class LocalBuckets:
+    """
+    Token buckets of one process, the least recently used dropped past ``maxsize``.
+    """
+
+    def __init__(self, maxsize: int = RATE_LIMIT_LOCAL_SIZE):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    def take(self, buckets: list) -> float:
+        """
+        Take one token from every bucket, or none when one of them is empty.
+
+        Args:
+            buckets (list): ``(key, capacity, tokens per second)`` of each bucket.
+
+        Returns:
+            float: 0 when allowed, otherwise seconds until the request would be.
+        """
+        now = time.monotonic()
+        levels, wait = [], 0.0
+        for key, capacity, rate in buckets:
+            tokens, at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - at) * rate)
+            levels.append(tokens)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+        if wait:
+            return wait
+        for (key, _, _), tokens in zip(buckets, levels):
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return 0.0
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limits per route, for each client IP and each account.
+
+    With the Redis backend the buckets of a request are checked and taken
+    by one Lua script, so every worker sees the same buckets and
+    concurrent requests can't both take the last token. While Redis is
+    unreachable, and with the local backend, the buckets are kept in the
+    process.
+    """
+
+    def __init__(self, limits: dict = None, backend: str = RATE_LIMIT_BACKEND, redis_client=None):
+        self.limits = load_limits() if limits is None else limits
+        self.backend = backend
+        self.local = LocalBuckets()
+        self.rejected = 0
+        self._redis = redis_client
+        self._script = None
+        self._redis_down_until = 0.0
+
+    @property
+    def redis(self):
+        """
+        The Redis client, the shared one unless a client was passed in.
+        """
+        return self._redis if self._redis is not None else get_redis()
+
+    def key(self, route: str, scope: str, value: str) -> str:
+        return f"{RATE_LIMIT_KEY_PREFIX}{route}:{scope}:{value}"
+
+    async def _take_redis(self, buckets: list) -> float | None:
+        if self._redis_down_until > time.monotonic():
+            return None
+        redis_client = self.redis
+        if self._script is None or self._script.registered_client is not redis_client:
+            self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        args = []
+        for _, capacity, rate in buckets:
+            args += [capacity, rate / 1000]
+        try:
+            wait_ms = await self._script(keys=[key for key, _, _ in buckets], args=args)
+        except redis_errors() as e:
+            logger.warning("Rate limiting falls back to local buckets: %s", e)
+            self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+            return None
+        return int(wait_ms) / 1000
+
+    async def hit(self, route: str, identities: dict) -> float:
+        """
+        Count a request against the route's buckets.
+
+        Args:
+            route (str): Name of the route in the limits.
+            identities (dict): Scope to the client's value, e.g. ``{"ip": "10.0.0.1", "account": "a@b.c"}``.
+
+        Returns:
+            float: 0 when the request is allowed, otherwise seconds until it would be.
+        """
+        limits = self.limits.get(route, {})
+        buckets = [(self.key(route, scope, value), *limits[scope])
+                   for scope, value in identities.items() if scope in limits and value]
+        if not buckets:
+            return 0.0
+        wait = await self._take_redis(buckets) if self.backend == "redis" else None
+        if wait is None:
+            wait = self.local.take(buckets)
+        return wait
+
+    async def check(self, route: str, identities: dict):
+        """
+        Count a request and refuse it when it is over a limit.
+
+        Args:
+            route (str): Name of the route in the limits.
+            identities (dict): Scope to the client's value.
+
+        Raises:
+            HTTPException: 429 with a Retry-After header.
+        """
+        wait = await self.hit(route, identities)
+        if wait:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                                headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+
+async def _account(request: Request, field: str) -> str | None:
+    # The body was already read and parsed by FastAPI, so this costs no extra I/O
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        value = body.get(field) if isinstance(body, dict) else None
+    else:
+        value = (await request.form()).get(field)
+    return value.strip().lower() if isinstance(value, str) else None
+
+
+def rate_limited(route: str, account_field: str = None):
+    """
+    Build a route dependency enforcing the route's limits.
+
+    Used in the route's ``dependencies`` so it runs before the database
+    session and the endpoint's own work.
+
+    Args:
+        route (str): Name of the route in the limits.
+        account_field (str): Body field naming the account, e.g. "username" of the login form.
+
+    Returns:
+        Callable: The dependency.
+    """
+    async def check_rate_limit(request: Request):
+        identities = {"ip": client_ip(request)}
+        if account_field:
+            identities["account"] = await _account(request, account_field)
+        await rate_limiter.check(route, identities)
+
+    return check_rate_limit
+
+
+TRUSTED_PROXIES = parse_networks(RATE_LIMIT_TRUSTED_PROXIES)
+rate_limiter = RateLimiter()
@@ -0,0 +1,295 @@
+import asyncio
+import os
+import sys
+import time
+
+# Redis configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", 20))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_POOL_MIN = int(os.getenv("REDIS_POOL_MIN", 2))
+REDIS_CHECK_TIMEOUT = float(os.getenv("REDIS_CHECK_TIMEOUT", 2))
+# "redis" for a Redis server, "memory" for the in-process stand-in used by tests and benchmarks
+REDIS_BACKEND = os.getenv("REDIS_BACKEND", "redis")
+
+redis_client = None
+
+
+def redis_errors():
+    """
+    The exception classes of failed Redis commands, for ``except`` clauses.
+
+    redis is only imported with the first real client, and until then no
+    command can raise its errors, so an empty tuple, matching nothing, is
+    returned instead. It is always a tuple, so it can be combined with
+    other classes: ``except (*redis_errors(), OSError)``.
+
+    Returns:
+        tuple: ``(redis.exceptions.RedisError,)``, or ``()`` while redis is not imported.
+    """
+    exceptions = sys.modules.get("redis.exceptions")
+    return (exceptions.RedisError,) if exceptions is not None else ()
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class InMemoryPipeline:
+    """
+    Pipeline of the in-memory stand-in: commands are queued and run on execute.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        commands, self._commands = self._commands, []
+        return [await getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._commands = []
+
+
+class InMemoryPubSub:
+    """
+    Subscription of the in-memory stand-in, receiving what is published on the same client.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._messages = asyncio.Queue()
+        self.channels = set()
+
+    async def subscribe(self, *channels):
+        for channel in map(_encode, channels):
+            self.channels.add(channel)
+            self._client._subscribers.setdefault(channel, set()).add(self)
+            self._messages.put_nowait({"type": "subscribe", "channel": channel, "data": len(self.channels)})
+
+    async def unsubscribe(self, *channels):
+        for channel in map(_encode, channels or list(self.channels)):
+            self.channels.discard(channel)
+            self._client._subscribers.get(channel, set()).discard(self)
+
+    async def listen(self):
+        while self.channels:
+            yield await self._messages.get()
+
+    async def aclose(self):
+        await self.unsubscribe()
+
+
+class InMemoryRedis:
+    """
+    In-process stand-in for the subset of the Redis API used by the application.
+
+    Values are returned as bytes and keys expire like they do on a Redis server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._subscribers = {}
+
+    def _alive(self, key) -> bool:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    async def ping(self):
+        return True
+
+    async def get(self, key):
+        return self._data[key] if self._alive(key) else None
+
+    async def mget(self, *keys):
+        if len(keys) == 1 and isinstance(keys[0], (list, tuple)):
+            keys = keys[0]
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False, xx=False, get=False):
+        alive = self._alive(key)
+        old = self._data.get(key) if alive else None
+        if (nx and alive) or (xx and not alive):
+            return None
+        self._data[key] = _encode(value)
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expires[key] = time.monotonic() + ex
+        return old if get else True
+
+    async def setex(self, key, time_seconds, value):
+        return await self.set(key, value, ex=time_seconds)
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                del self._data[key]
+                self._expires.pop(key, None)
+                deleted += 1
+        return deleted
+
+    async def exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    async def incr(self, key, amount=1):
+        value = int(self._data[key]) + amount if self._alive(key) else amount
+        self._data[key] = _encode(value)
+        return value
+
+    async def expire(self, key, time_seconds):
+        if not self._alive(key):
+            return False
+        self._expires[key] = time.monotonic() + time_seconds
+        return True
+
+    async def ttl(self, key):
+        if not self._alive(key):
+            return -2
+        expires_at = self._expires.get(key)
+        return -1 if expires_at is None else max(int(expires_at - time.monotonic()), 0)
+
+    async def sadd(self, key, *members):
+        members = {_encode(member) for member in members}
+        current = self._data.get(key) if self._alive(key) else None
+        if current is None:
+            current = self._data[key] = set()
+        added = len(members - current)
+        current.update(members)
+        return added
+
+    async def srem(self, key, *members):
+        if not self._alive(key):
+            return 0
+        current = self._data[key]
+        members = {_encode(member) for member in members} & current
+        current.difference_update(members)
+        if not current:
+            await self.delete(key)
+        return len(members)
+
+    async def smembers(self, key):
+        return set(self._data[key]) if self._alive(key) else set()
+
+    async def flushdb(self):
+        self._data.clear()
+        self._expires.clear()
+        return True
+
+    async def publish(self, channel, message):
+        subscribers = self._subscribers.get(_encode(channel), set())
+        for subscriber in subscribers:
+            subscriber._messages.put_nowait({"type": "message", "channel": _encode(channel),
+                                             "data": _encode(message)})
+        return len(subscribers)
+
+    def pubsub(self):
+        return InMemoryPubSub(self)
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+    async def aclose(self):
+        pass
+
+
+def create_redis():
+    """
+    Create a Redis client with a sized connection pool, or the in-memory stand-in.
+
+    Returns:
+        redis.Redis | InMemoryRedis: The client.
+    """
+    if REDIS_BACKEND == "memory":
+        return InMemoryRedis()
+    import redis.asyncio as redis
+
+    pool = redis.BlockingConnectionPool.from_url(REDIS_URL, max_connections=REDIS_POOL_SIZE,
+                                                 timeout=REDIS_POOL_TIMEOUT)
+    return redis.Redis(connection_pool=pool)
+
+
+async def init_redis():
+    """
+    Create the shared client. Called from the application lifespan.
+
+    Returns:
+        redis.Redis | InMemoryRedis: The shared client.
+    """
+    global redis_client
+    if redis_client is None:
+        redis_client = create_redis()
+    return redis_client
+
+
+async def close_redis():
+    """
+    Close the shared client and its connection pool. Called from the application lifespan.
+    """
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+
+async def warm_redis(size: int = REDIS_POOL_MIN) -> int:
+    """
+    Open pool connections up front, so the first requests of a worker don't wait for connecting.
+
+    Each concurrent PING takes a connection of its own, and the pool keeps them open.
+
+    Args:
+        size (int): Connections to open, at most REDIS_POOL_SIZE.
+
+    Returns:
+        int: The number of connections opened, 0 for the in-memory stand-in.
+    """
+    client = await init_redis()
+    if REDIS_BACKEND == "memory":
+        return 0
+    size = min(size, REDIS_POOL_SIZE)
+    await asyncio.gather(*(client.ping() for _ in range(size)))
+    return size
+
+
+async def ping_redis(timeout: float = REDIS_CHECK_TIMEOUT):
+    """
+    Check Redis answers.
+
+    Args:
+        timeout (float): Seconds to wait for the answer.
+
+    Raises:
+        Exception: Redis can't be reached, or TimeoutError when it doesn't answer in time.
+    """
+    await asyncio.wait_for(get_redis().ping(), timeout)
+
+
+def get_redis():
+    """
+    Get the shared client, creating it on first use outside the application lifespan.
+
+    Returns:
+        redis.Redis | InMemoryRedis: The shared client.
+    """
+    global redis_client
+    if redis_client is None:
+        redis_client = create_redis()
+    return redis_client
+
@@ -0,0 +1,155 @@
+import json
+import os
+import secrets
+from datetime import datetime, timezone
+
+from fastapi import HTTPException, status
+
+from src.services.redis_client import get_redis, redis_errors
+
+# Refresh token configuration
+REFRESH_TOKEN_EXPIRE_SECONDS = int(os.getenv("REFRESH_TOKEN_EXPIRE_SECONDS", 7 * 24 * 3600))
+REFRESH_FAMILY_KEY_PREFIX = "refresh:family:"
+REFRESH_USER_KEY_PREFIX = "refresh:user:"
+DEVICE_MAX_LENGTH = 200
+
+
+class RefreshTokenStore:
+    """
+    Refresh token sessions in Redis, one token family per login.
+
+    A login starts a family; every refresh rotates it to a new token and
+    the family record keeps the id (``jti``) of the only token that may be
+    used next. The swap is a single ``SET ... XX GET``, so of two requests
+    presenting the same token only one can win. Presenting a token that is
+    not the current one means it was copied, and the whole family is
+    revoked. Each family expires with its latest token, and the families of
+    a user are indexed so they can be listed and revoked per device.
+    """
+
+    def __init__(self, redis_client=None, expire_seconds: int = REFRESH_TOKEN_EXPIRE_SECONDS):
+        self._redis = redis_client
+        self.expire_seconds = expire_seconds
+
+    @property
+    def redis(self):
+        """
+        The Redis client, the shared one unless a client was passed in.
+        """
+        return self._redis if self._redis is not None else get_redis()
+
+    def family_key(self, family: str) -> str:
+        return REFRESH_FAMILY_KEY_PREFIX + family
+
+    def user_key(self, email: str) -> str:
+        return REFRESH_USER_KEY_PREFIX + email
+
+    async def _call(self, coroutine):
+        # Sessions can't be checked without Redis, so its failures are reported as unavailability
+        try:
+            return await coroutine
+        except redis_errors():
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Sessions are unavailable, try again later", headers={"Retry-After": "5"})
+
+    async def start(self, email: str, device: str | None) -> dict:
+        """
+        Start a session family for a new login.
+
+        Args:
+            email (str): The user's email.
+            device (str | None): Label of the device, e.g. its user agent.
+
+        Returns:
+            dict: Claims to put in the first refresh token of the family: ``fam`` and ``jti``.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        family, jti = secrets.token_urlsafe(16), secrets.token_urlsafe(16)
+        record = {"jti": jti, "sub": email, "device": (device or "unknown")[:DEVICE_MAX_LENGTH],
+                  "created_at": now, "refreshed_at": now}
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.set(self.family_key(family), json.dumps(record), ex=self.expire_seconds)
+        pipe.sadd(self.user_key(email), family)
+        pipe.expire(self.user_key(email), self.expire_seconds)
+        await self._call(pipe.execute())
+        return {"fam": family, "jti": jti}
+
+    async def rotate(self, claims: dict) -> dict | None:
+        """
+        Replace the current token of a family with a new one.
+
+        Args:
+            claims (dict): Claims of the presented refresh token.
+
+        Returns:
+            dict | None: Claims for the next refresh token, or None if the family is unknown,
+            expired or revoked, or the token was already used; in the last case the family is revoked.
+        """
+        family, jti, email = claims.get("fam"), claims.get("jti"), claims.get("sub")
+        if not family or not jti:
+            return None
+        key = self.family_key(family)
+        record = json.loads(await self._call(self.redis.get(key)) or "null")
+        if record is None or record["sub"] != email:
+            return None
+        next_jti = secrets.token_urlsafe(16)
+        record.update(jti=next_jti, refreshed_at=datetime.now(timezone.utc).isoformat())
+        # Only swaps an existing family, and returns what it replaced
+        previous = await self._call(self.redis.set(key, json.dumps(record), ex=self.expire_seconds, xx=True,
+                                                   get=True))
+        if previous is None:
+            return None
+        if json.loads(previous)["jti"] != jti:
+            # A used token came back: whoever holds the family's tokens can't be trusted any more
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.srem(self.user_key(email), family)
+            await self._call(pipe.execute())
+            return None
+        await self._call(self.redis.expire(self.user_key(email), self.expire_seconds))
+        return {"fam": family, "jti": next_jti}
+
+    async def sessions(self, email: str) -> list:
+        """
+        List the live sessions of a user; index entries of expired families are dropped.
+
+        Args:
+            email (str): The user's email.
+
+        Returns:
+            list: Dicts with the family ``id``, ``device``, ``created_at`` and ``refreshed_at``.
+        """
+        families = sorted(member.decode() if isinstance(member, bytes) else member
+                          for member in await self._call(self.redis.smembers(self.user_key(email))))
+        records = await self._call(self.redis.mget([self.family_key(family) for family in families])) \
+            if families else []
+        sessions, expired = [], []
+        for family, record in zip(families, records):
+            if record is None:
+                expired.append(family)
+                continue
+            record = json.loads(record)
+            sessions.append({"id": family, "device": record["device"], "created_at": record["created_at"],
+                             "refreshed_at": record["refreshed_at"]})
+        if expired:
+            await self._call(self.redis.srem(self.user_key(email), *expired))
+        return sorted(sessions, key=lambda session: session["created_at"])
+
+    async def revoke(self, email: str, family: str) -> bool:
+        """
+        End a session: the family's refresh tokens stop working.
+
+        Args:
+            email (str): The user's email.
+            family (str): Id of the family.
+
+        Returns:
+            bool: True if the user had this session.
+        """
+        removed = await self._call(self.redis.srem(self.user_key(email), family))
+        if removed:
+            await self._call(self.redis.delete(self.family_key(family)))
+        return bool(removed)
+
+
+refresh_tokens = RefreshTokenStore()
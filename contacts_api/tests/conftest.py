@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Run the suite against a throwaway SQLite database unless a database URL is given explicitly
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "contacts_test.db")
+)
+
+# Use the in-memory Redis stand-in so the suite runs without a Redis server
+os.environ.setdefault("REDIS_BACKEND", "memory")
+
+# The application leaves the schema to Alembic, so the database is set up the way a deployment does it
+from src.database.schema import migrate
+
+migrate(os.environ["SQLALCHEMY_DATABASE_URL"])
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+from datetime import date
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from src.database.db import run_db, to_async_url
+from src.database.models import Base, User
+from src.schemas import ContactCreate, UserModel
+from src.repository import users as repository_users
+from crud import add_contact, get_contact, get_contacts
+
+
+class TestAsyncDatabase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(bind=self.engine, expire_on_commit=False)()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    def test_to_async_url(self):
+        # Test sync URLs are mapped to their async drivers
+        self.assertEqual(to_async_url("postgresql+psycopg2://u:p@localhost:5433/contacts"),
+                         "postgresql+asyncpg://u:p@localhost:5433/contacts")
+        self.assertEqual(to_async_url("sqlite:///./contacts.db"), "sqlite+aiosqlite:///./contacts.db")
+
+    async def test_run_db_with_sync_session(self):
+        # Test a sync session is handed to the function as-is
+        session = MagicMock(spec=Session)
+        result = await run_db(session, lambda db, value: (db, value), 42)
+        self.assertEqual(result, (session, 42))
+
+    async def test_user_repository_with_async_session(self):
+        # Test the repository functions run on an AsyncSession
+        self.assertIsInstance(self.session, AsyncSession)
+        body = UserModel(username="test_user", email="test@example.com", password="test_password")
+        new_user = await repository_users.create_user(body=body, db=self.session)
+        self.assertIsNotNone(new_user.id)
+
+        user = await repository_users.get_user_by_email(email="test@example.com", db=self.session)
+        self.assertEqual(user.id, new_user.id)
+
+        await repository_users.update_token(user=user, token="test_token", db=self.session)
+        self.assertTrue(await repository_users.confirm_email(token="test@example.com", db=self.session))
+        user = await repository_users.update_avatar("test@example.com", "http://example.com/a.jpg", self.session)
+        self.assertEqual(user.refresh_token, "test_token")
+        self.assertTrue(user.email_verified)
+        self.assertEqual(user.avatar, "http://example.com/a.jpg")
+
+    async def test_contacts_with_async_session(self):
+        # Test the contact functions run on an AsyncSession
+        user = User(username="test_user", email="test@example.com", password="test_password")
+        self.session.add(user)
+        await self.session.commit()
+        contact = ContactCreate(first_name="John", last_name="Doe", email="john@example.com",
+                                phone_number="123456789", birthday=date(1990, 1, 1), additional_data=None)
+        created = await run_db(self.session, add_contact, contact=contact, user=user)
+        found = await run_db(self.session, get_contact, contact_id=created.id, user=user)
+        self.assertEqual(found.email, "john@example.com")
+        contacts = await run_db(self.session, get_contacts, user=user)
+        self.assertEqual([c.id for c in contacts], [created.id])
+
+
+if __name__ == '__main__':
+    unittest.main()
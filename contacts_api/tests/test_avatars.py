@@ -0,0 +1,141 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from PIL import Image
+from main import app
+from src.database import db as database
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.avatars import avatar_pipeline, resize_avatar, spool, AvatarStorage, LocalStorage
+
+
+def image_bytes(size=(1200, 800), image_format="JPEG") -> bytes:
+    data = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(data, image_format)
+    return data.getvalue()
+
+
+class TestResize(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "upload")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, data: bytes):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def test_thumbnails(self):
+        # Test every size is a square JPEG, from JPEG and PNG uploads
+        for image_format in ("JPEG", "PNG"):
+            self.write(image_bytes(image_format=image_format))
+            thumbnails = resize_avatar(self.path, sizes=(256, 64))
+            self.assertEqual([size for size, _ in thumbnails], [256, 64])
+            for size, data in thumbnails:
+                with Image.open(io.BytesIO(data)) as thumbnail:
+                    self.assertEqual(thumbnail.format, "JPEG")
+                    self.assertEqual(thumbnail.size, (size, size))
+
+    def test_rejected_images(self):
+        # Test files that are not images, or are too large, raise ValueError
+        self.write(b"not an image")
+        with self.assertRaises(ValueError):
+            resize_avatar(self.path)
+        self.write(image_bytes((100, 100)))
+        with self.assertRaises(ValueError):
+            resize_avatar(self.path, max_pixels=5000)
+
+    def test_spool_cap(self):
+        # Test the spool copies up to the cap and gives up past it
+        self.assertEqual(spool(io.BytesIO(b"x" * 100), self.path, 100), 100)
+        self.assertEqual(spool(io.BytesIO(b"x" * 101), self.path, 100), -1)
+
+    def test_incomplete_storage(self):
+        # Test a storage without save can't be created
+        class Incomplete(AvatarStorage):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+class TestAvatarRoute(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage, self.max_bytes = avatar_pipeline._storage, avatar_pipeline.max_bytes
+        avatar_pipeline._storage = LocalStorage(self.directory.name, "/static/avatars")
+        self.client = TestClient(app)
+        self.client.__enter__()
+        with database.SessionLocal() as db:
+            db.query(User).filter(User.email == "avatar.user@example.com").delete(synchronize_session=False)
+            user = User(username="avatar_user", email="avatar.user@example.com", password="x")
+            db.add(user)
+            db.commit()
+            self.user_id = user.id
+        token = await auth_service.create_access_token(data={"sub": "avatar.user@example.com"})
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def asyncTearDown(self):
+        self.client.__exit__(None, None, None)
+        avatar_pipeline._storage, avatar_pipeline.max_bytes = self.storage, self.max_bytes
+        self.directory.cleanup()
+
+    def upload(self, data: bytes, content_type="image/jpeg"):
+        return self.client.put("/avatar", files={"file": ("me.jpg", data, content_type)}, headers=self.headers)
+
+    def wait_for_job(self, job: str) -> dict:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            state = self.client.get("/avatar/status", headers=self.headers).json()
+            if state["job"] == job and state["status"] != "pending":
+                return state
+            time.sleep(0.02)
+        self.fail("avatar job did not finish")
+
+    def avatar(self) -> str:
+        with database.SessionLocal() as db:
+            return db.get(User, self.user_id).avatar
+
+    def test_upload(self):
+        # Test the upload returns pending at once and the avatar changes when the thumbnails are stored
+        response = self.upload(image_bytes())
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "pending")
+        state = self.wait_for_job(response.json()["job"])
+        self.assertEqual(state["status"], "ready")
+        self.assertEqual(self.avatar(), state["avatar"])
+        self.assertEqual(set(state["sizes"]), {str(size) for size in avatar_pipeline.sizes})
+        for url in state["sizes"].values():
+            path = os.path.join(self.directory.name, url.removeprefix("/static/avatars/"))
+            self.assertTrue(os.path.exists(path), path)
+
+    def test_failed_upload(self):
+        # Test an unreadable image fails the job and keeps the avatar
+        before = self.avatar()
+        response = self.upload(b"not an image")
+        self.assertEqual(response.status_code, 202)
+        state = self.wait_for_job(response.json()["job"])
+        self.assertEqual(state["status"], "failed")
+        self.assertEqual(self.avatar(), before)
+
+    def test_rejected_uploads(self):
+        # Test uploads that are not images or are too large are refused before any processing
+        self.assertEqual(self.upload(b"text", content_type="text/plain").status_code, 415)
+        avatar_pipeline.max_bytes = 1000
+        self.assertEqual(self.upload(image_bytes()).status_code, 413)
+        self.assertEqual(self.client.get("/avatar/status", headers=self.headers).json()["status"], "none")
+
+
+if __name__ == '__main__':
+    unittest.main()
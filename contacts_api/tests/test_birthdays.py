@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User, birthday_key
+from crud import get_upcoming_birthdays
+
+
+class TestUpcomingBirthdays(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.user = User(username="test_user", email="test@example.com", password="test_password")
+        self.other = User(username="other_user", email="other@example.com", password="test_password")
+        self.session.add_all([self.user, self.other])
+        self.session.commit()
+        birthdays = {
+            "Dec30": date(1980, 12, 30),
+            "Jan02": date(1985, 1, 2),
+            "Jan30": date(1990, 1, 30),
+            "Feb03": date(1991, 2, 3),
+            "Feb29": date(1992, 2, 29),
+            "Mar05": date(1993, 3, 5),
+        }
+        for i, (name, birthday) in enumerate(birthdays.items()):
+            self.add_contact(name, birthday, self.user, i)
+        self.add_contact("Other", date(1990, 1, 31), self.other, 99)
+        self.session.commit()
+
+    def add_contact(self, name, birthday, owner, i):
+        self.session.add(Contact(first_name=name, last_name="Test", email=f"{name}{i}@example.com",
+                                 phone_number=str(1000 + i), birthday=birthday, user_id=owner.id))
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def upcoming(self, today, days=7):
+        return [c.first_name for c in get_upcoming_birthdays(self.session, self.user, days=days, today=today)]
+
+    def test_birthday_key_is_kept_in_sync(self):
+        # Test the key follows the birthday on create and update
+        self.assertEqual(birthday_key(date(2000, 12, 31)), 1231)
+        contact = self.session.query(Contact).filter(Contact.first_name == "Mar05").one()
+        self.assertEqual(contact.birthday_key, 305)
+        contact.birthday = date(1993, 7, 14)
+        self.session.commit()
+        self.session.refresh(contact)
+        self.assertEqual(contact.birthday_key, 714)
+
+    def test_window_crosses_month(self):
+        # Test a window from January into February, scoped to the user
+        self.assertEqual(self.upcoming(date(2026, 1, 28)), ["Jan30", "Feb03"])
+
+    def test_window_wraps_year(self):
+        # Test a window from December into January is ordered by the upcoming date
+        self.assertEqual(self.upcoming(date(2026, 12, 28)), ["Dec30", "Jan02"])
+
+    def test_days_parameter(self):
+        # Test the window length
+        self.assertEqual(self.upcoming(date(2026, 1, 30), days=0), ["Jan30"])
+        self.assertEqual(self.upcoming(date(2026, 1, 1), days=40), ["Jan02", "Jan30", "Feb03"])
+        self.assertEqual(len(self.upcoming(date(2026, 6, 1), days=366)), 6)
+
+    def test_february_29(self):
+        # Test February 29 birthdays are celebrated on March 1 in common years
+        self.assertEqual(self.upcoming(date(2027, 3, 1)), ["Feb29", "Mar05"])
+        self.assertEqual(self.upcoming(date(2027, 2, 21)), [])
+        self.assertEqual(self.upcoming(date(2027, 2, 22)), ["Feb29"])
+        self.assertEqual(self.upcoming(date(2028, 2, 29)), ["Feb29", "Mar05"])
+        self.assertEqual(self.upcoming(date(2028, 3, 1)), ["Mar05"])
+
+
+if __name__ == '__main__':
+    unittest.main()
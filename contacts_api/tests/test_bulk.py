@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from src.schemas import ContactFilter
+from crud import bulk_delete_contacts, bulk_update_contacts, get_upcoming_birthdays, search_contacts
+
+
+class TestBulkContacts(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.user = User(username="test_user", email="test@example.com", password="test_password")
+        self.other = User(username="other_user", email="other@example.com", password="test_password")
+        self.session.add_all([self.user, self.other])
+        self.session.commit()
+        for i in range(20):
+            owner = self.user if i < 10 else self.other
+            self.session.add(Contact(first_name=f"First{i}", last_name="Even" if i % 2 == 0 else "Odd",
+                                     email=f"c{i}@example.com", phone_number=str(1000 + i),
+                                     birthday=date(1990, 1 + i % 12, 1), user_id=owner.id))
+        self.session.commit()
+        self.own_ids = [c.id for c in self.session.query(Contact).filter(Contact.user_id == self.user.id)]
+        self.other_ids = [c.id for c in self.session.query(Contact).filter(Contact.user_id == self.other.id)]
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def contact(self, contact_id):
+        return self.session.get(Contact, contact_id)
+
+    def test_update_by_ids(self):
+        # Test only the user's contacts are updated, with the birthday key and search index kept in sync
+        ids = self.own_ids[:3] + self.other_ids[:2]
+        result = bulk_update_contacts(self.session, self.user, {"last_name": "Renamed", "birthday": date(1985, 7, 14)},
+                                      ids=ids)
+        self.assertEqual(result, {"count": 3, "ids": self.own_ids[:3]})
+        self.assertEqual({self.contact(i).last_name for i in self.own_ids[:3]}, {"Renamed"})
+        self.assertEqual({self.contact(i).birthday_key for i in self.own_ids[:3]}, {714})
+        self.assertEqual({self.contact(i).last_name for i in self.other_ids[:2]}, {"Even", "Odd"})
+        self.assertEqual(len(search_contacts(self.session, self.user, "renamed")), 3)
+        self.assertEqual(len(get_upcoming_birthdays(self.session, self.user, today=date(2026, 7, 10))), 3)
+
+    def test_update_by_filter(self):
+        # Test a filter combined with ids narrows the selection
+        result = bulk_update_contacts(self.session, self.user, {"additional_data": "note"},
+                                      contact_filter=ContactFilter(last_name="Even"))
+        self.assertEqual(result["ids"], self.own_ids[0::2])
+        result = bulk_update_contacts(self.session, self.user, {"additional_data": "again"}, ids=self.own_ids[:4],
+                                      contact_filter=ContactFilter(last_name="Odd"))
+        self.assertEqual(result["ids"], [self.own_ids[1], self.own_ids[3]])
+
+    def test_update_without_changes(self):
+        # Test an empty change set only reports the selected contacts
+        result = bulk_update_contacts(self.session, self.user, {}, ids=self.own_ids[:2])
+        self.assertEqual(result, {"count": 2, "ids": self.own_ids[:2]})
+
+    def test_delete_by_filter(self):
+        # Test a birthday range filter deletes only the user's matching contacts
+        result = bulk_delete_contacts(self.session, self.user, contact_filter=ContactFilter(
+            birthday_from=date(1990, 3, 1), birthday_to=date(1990, 5, 1)))
+        self.assertEqual(result, {"count": 3, "ids": self.own_ids[2:5]})
+        self.assertEqual(self.session.query(Contact).count(), 17)
+        self.assertEqual(search_contacts(self.session, self.user, "First3"), [])
+
+    def test_delete_by_ids(self):
+        # Test ids of other users' contacts and unknown ids are ignored
+        result = bulk_delete_contacts(self.session, self.user, ids=self.own_ids[:2] + self.other_ids + [9999])
+        self.assertEqual(result, {"count": 2, "ids": self.own_ids[:2]})
+        self.assertEqual(self.session.query(Contact).filter(Contact.user_id == self.other.id).count(), 10)
+
+    def test_selection_is_required(self):
+        # Test an empty selection is rejected instead of touching every contact
+        with self.assertRaises(ValueError):
+            bulk_delete_contacts(self.session, self.user)
+        with self.assertRaises(ValueError):
+            bulk_update_contacts(self.session, self.user, {"last_name": "X"}, contact_filter=ContactFilter())
+        self.assertEqual(bulk_delete_contacts(self.session, self.user, ids=[]), {"count": 0, "ids": []})
+
+
+if __name__ == '__main__':
+    unittest.main()
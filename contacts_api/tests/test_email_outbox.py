@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.services.mail import DebuggingSMTPServer, EmailOutbox
+
+
+class TestEmailOutbox(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = DebuggingSMTPServer()
+        await self.server.start()
+        self.outbox = EmailOutbox(host=self.server.host, port=self.server.port, username=None, password=None,
+                                  starttls=False, sender="noreply@example.com", batch_size=10,
+                                  max_attempts=2, retry_seconds=0.01)
+
+    async def asyncTearDown(self):
+        await self.outbox.stop()
+        await self.server.stop()
+
+    async def test_enqueue_does_not_send(self):
+        # Test enqueueing only queues the message
+        self.assertTrue(self.outbox.enqueue("test@example.com", "Subject", "Body"))
+        self.assertEqual(self.outbox.depth(), 1)
+        self.assertEqual(self.server.messages, [])
+
+    async def test_batches_reuse_connection(self):
+        # Test every batch goes over the same SMTP connection
+        for i in range(15):
+            self.outbox.enqueue(f"user{i}@example.com", "Confirmation Email", f"Body {i}")
+        await self.outbox.start()
+        await self.outbox.queue.join()
+        self.outbox.enqueue("late@example.com", "Confirmation Email", "Body")
+        await self.outbox.queue.join()
+
+        self.assertEqual(len(self.server.messages), 16)
+        self.assertEqual(self.server.messages[0]["to"], ["user0@example.com"])
+        self.assertIn("Body 0", self.server.messages[0]["data"])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.outbox.stats(),
+                         {"depth": 0, "retrying": 0, "sent": 16, "failed": 0, "dropped": 0, "connections": 1})
+
+    async def test_retry_then_give_up(self):
+        # Test an unreachable server is retried with backoff and the message is given up after max attempts
+        await self.server.stop()
+        self.outbox.enqueue("test@example.com", "Subject", "Body")
+        await self.outbox.start()
+        for _ in range(100):
+            if self.outbox.failed:
+                break
+            await asyncio.sleep(0.02)
+        await self.server.start()
+        self.assertEqual(self.outbox.failed, 1)
+        self.assertEqual(self.outbox.depth(), 0)
+
+    async def wait_for_retry(self, outbox: EmailOutbox):
+        for _ in range(100):
+            if outbox.stats()["retrying"]:
+                return
+            await asyncio.sleep(0.02)
+        self.fail("No message is waiting for a retry")
+
+    async def test_stop_flushes_retries(self):
+        # Test stopping sends the messages waiting for a retry instead of dropping them
+        await self.server.stop()
+        outbox = EmailOutbox(host=self.server.host, port=self.server.port, username=None, password=None,
+                             starttls=False, sender="noreply@example.com", max_attempts=5, retry_seconds=60)
+        outbox.enqueue("test@example.com", "Subject", "Body")
+        await outbox.start()
+        await self.wait_for_retry(outbox)
+        self.assertEqual(outbox.stats()["depth"], 1)
+        await self.server.start()
+        await outbox.stop()
+        self.assertEqual([message["to"] for message in self.server.messages], [["test@example.com"]])
+        self.assertEqual(outbox.stats()["sent"], 1)
+        self.assertEqual(outbox.depth(), 0)
+
+    async def test_stop_keeps_undelivered_retries(self):
+        # Test a message that still can't be sent at the stop timeout stays queued
+        await self.server.stop()
+        outbox = EmailOutbox(host=self.server.host, port=self.server.port, username=None, password=None,
+                             starttls=False, sender="noreply@example.com", max_attempts=1000, retry_seconds=60)
+        outbox.enqueue("test@example.com", "Subject", "Body")
+        await outbox.start()
+        await self.wait_for_retry(outbox)
+        with self.assertLogs("src.services.mail", "WARNING"):
+            await outbox.stop(timeout=0.2)
+        self.assertEqual(outbox.stats()["retrying"], 0)
+        self.assertEqual(outbox.queue.qsize(), 1)
+        self.assertEqual(outbox.failed, 0)
+        await self.server.start()
+
+    async def test_full_outbox(self):
+        # Test a full outbox drops the message instead of failing the request
+        outbox = EmailOutbox(max_size=1)
+        self.assertTrue(outbox.enqueue("a@example.com", "Subject", "Body"))
+        self.assertFalse(outbox.enqueue("b@example.com", "Subject", "Body"))
+        self.assertEqual(outbox.stats()["dropped"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
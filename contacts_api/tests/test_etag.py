@@ -0,0 +1,116 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from main import app, etag_matches
+from src.database import db as database
+from src.database.models import Contact, User
+from src.services.auth import auth_service
+from test_statement_counts import count_statements
+
+
+def contact_body(n):
+    return {"first_name": "Etag", "last_name": f"Test{n}", "email": f"etag.{n}@example.com",
+            "phone_number": str(555100000 + n), "birthday": "1990-01-01", "additional_data": None}
+
+
+class TestContactETags(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = TestClient(app)
+        self.client.__enter__()
+        with database.SessionLocal() as db:
+            db.query(Contact).filter(Contact.email.like("etag.%")).delete(synchronize_session=False)
+            db.query(User).filter(User.email.like("etag.%")).delete(synchronize_session=False)
+            db.add_all([User(username="etag_user", email="etag.user@example.com", password="x"),
+                        User(username="etag_other", email="etag.other@example.com", password="x")])
+            db.commit()
+        self.headers = {"Authorization": "Bearer " + await auth_service.create_access_token(
+            data={"sub": "etag.user@example.com"})}
+        self.other_headers = {"Authorization": "Bearer " + await auth_service.create_access_token(
+            data={"sub": "etag.other@example.com"})}
+        self.contact_id = self.client.post("/contacts/", json=contact_body(0), headers=self.headers).json()["id"]
+
+    async def asyncTearDown(self):
+        self.client.__exit__(None, None, None)
+
+    def get(self, url, etag=None, headers=None):
+        headers = {**(headers or self.headers), **({"If-None-Match": etag} if etag else {})}
+        return self.client.get(url, headers=headers)
+
+    def test_not_modified(self):
+        # Test a current ETag is answered with an empty 304 without reading any contact
+        for url in ("/contacts/", f"/contacts/{self.contact_id}"):
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+            self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+            self.assertEqual(response.headers["Cache-Control"], "private, no-cache")
+            with count_statements() as statements:
+                response = self.get(url, etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response.headers["ETag"], etag)
+            self.assertFalse([s for s in statements if "FROM contacts" in s], statements)
+
+    def test_etag_depends_on_request(self):
+        # Test pages, searches, contacts and users have their own tags
+        etags = {self.get(url).headers["ETag"] for url in (
+            "/contacts/", "/contacts/?limit=5", "/contacts/?skip=1", "/contacts/?query=etag",
+            f"/contacts/{self.contact_id}")}
+        self.assertEqual(len(etags), 5)
+        etag = self.get("/contacts/").headers["ETag"]
+        self.assertEqual(self.get("/contacts/", etag, headers=self.other_headers).status_code, 200)
+
+    def test_writes_change_the_etag(self):
+        # Test every write path bumps the version, so an old copy is downloaded again
+        contact_url = f"/contacts/{self.contact_id}"
+        writes = [
+            lambda: self.client.post("/contacts/", json=contact_body(1), headers=self.headers),
+            lambda: self.client.put(contact_url, json={**contact_body(0), "first_name": "Changed"},
+                                    headers=self.headers),
+            lambda: self.client.patch("/contacts/bulk", json={"ids": [self.contact_id],
+                                                              "changes": {"last_name": "Bulk"}}, headers=self.headers),
+            lambda: self.client.post("/contacts/import", headers=self.headers,
+                                     files={"file": ("c.csv", "first_name,last_name,email,phone_number,birthday,"
+                                                              "additional_data\nEtag,Import,etag.2@example.com,"
+                                                              "555100002,1990-01-01,\n")}),
+            lambda: self.client.request("DELETE", "/contacts/bulk", json={"ids": [self.contact_id]},
+                                        headers=self.headers),
+        ]
+        for n, write in enumerate(writes):
+            etag = self.get("/contacts/").headers["ETag"]
+            response = write()
+            self.assertLess(response.status_code, 300, response.text)
+            response = self.get("/contacts/", etag)
+            self.assertEqual(response.status_code, 200, n)
+            self.assertNotEqual(response.headers["ETag"], etag)
+
+        contact_id = self.client.post("/contacts/", json=contact_body(3), headers=self.headers).json()["id"]
+        etag = self.get(f"/contacts/{contact_id}").headers["ETag"]
+        self.assertEqual(self.client.delete(f"/contacts/{contact_id}", headers=self.headers).status_code, 200)
+        self.assertEqual(self.get(f"/contacts/{contact_id}", etag).status_code, 404)
+
+    def test_failed_writes_keep_the_etag(self):
+        # Test writes that change nothing, or another user's writes, leave the version alone
+        etag = self.get("/contacts/").headers["ETag"]
+        self.assertEqual(self.client.put("/contacts/999999", json=contact_body(0), headers=self.headers).status_code,
+                         404)
+        self.assertEqual(self.client.delete("/contacts/999999", headers=self.headers).status_code, 404)
+        self.client.post("/contacts/", json=contact_body(4), headers=self.other_headers)
+        self.assertEqual(self.get("/contacts/", etag).status_code, 304)
+
+    def test_etag_matches(self):
+        # Test If-None-Match parsing: lists, weak tags and the wildcard
+        self.assertTrue(etag_matches('"a"', '"a"'))
+        self.assertTrue(etag_matches('"b", W/"a"', '"a"'))
+        self.assertTrue(etag_matches("*", '"a"'))
+        self.assertFalse(etag_matches('"b"', '"a"'))
+        self.assertFalse(etag_matches(None, '"a"'))
+
+
+if __name__ == '__main__':
+    unittest.main()
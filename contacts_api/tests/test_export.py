@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+import io
+import csv
+import json
+import tempfile
+from datetime import date
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from src.database import db as database
+from src.database.models import Base, Contact, User
+from crud import export_contacts, import_contacts
+
+# Rows of the memory test and the RSS growth it may cause
+EXPORT_TEST_CONTACTS = int(os.getenv("EXPORT_TEST_CONTACTS", "500000"))
+EXPORT_RSS_BUDGET = 64 * 1024 * 1024
+
+
+def current_rss() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class TestContactExport(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_engine("sqlite:///" + os.path.join(self.directory.name, "export.db"))
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.user = User(username="test_user", email="test@example.com", password="test_password")
+        self.other = User(username="other_user", email="other@example.com", password="test_password")
+        self.session.add_all([self.user, self.other])
+        self.session.commit()
+        # Stream from the test database with the sync engine
+        self.patches = [patch.object(database, "engine", self.engine), patch.object(database, "DB_MODE", "sync")]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.session.close()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def add_contacts(self, count, owner):
+        for i in range(count):
+            self.session.add(Contact(first_name=f"First{i}", last_name=f"Last{i}", email=f"c{owner.id}.{i}@example.com",
+                                     phone_number=str(owner.id * 1000 + i), birthday=date(1990, 1, 1 + i % 28),
+                                     additional_data="a, \"quoted\"\nnote" if i == 0 else None, user_id=owner.id))
+        self.session.commit()
+
+    async def export(self, file_format, chunk_size=1000):
+        return b"".join([chunk async for chunk in export_contacts(self.user, file_format, chunk_size)]).decode()
+
+    async def test_export_csv(self):
+        # Test the CSV has a header and every contact of the user, in id order
+        self.add_contacts(25, self.user)
+        self.add_contacts(5, self.other)
+        rows = list(csv.DictReader(io.StringIO(await self.export("csv", chunk_size=10))))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual([row["email"] for row in rows], [f"c{self.user.id}.{i}@example.com" for i in range(25)])
+        self.assertEqual(rows[0]["additional_data"], "a, \"quoted\"\nnote")
+        self.assertEqual(rows[1]["birthday"], "1990-01-02")
+
+    async def test_export_ndjson(self):
+        # Test one JSON object per line
+        self.add_contacts(3, self.user)
+        records = [json.loads(line) for line in (await self.export("ndjson")).splitlines()]
+        self.assertEqual([record["first_name"] for record in records], ["First0", "First1", "First2"])
+        self.assertEqual(records[2]["birthday"], "1990-01-03")
+        self.assertIsNone(records[2]["additional_data"])
+
+    async def test_export_without_contacts(self):
+        # Test an empty export is just the header
+        self.assertEqual((await self.export("csv")).splitlines(), [
+            "id,first_name,last_name,email,phone_number,birthday,additional_data"
+        ])
+        self.assertEqual(await self.export("ndjson"), "")
+
+    async def test_export_can_be_imported(self):
+        # Test the CSV export round-trips through the import
+        self.add_contacts(10, self.user)
+        data = (await self.export("csv")).replace(f"c{self.user.id}.", "copy.").encode()
+        result = import_contacts(self.session, self.other, io.BytesIO(data), "csv")
+        self.assertEqual((result["imported"], result["failed"]), (0, 10))
+        self.session.query(Contact).filter(Contact.user_id == self.user.id).delete()
+        self.session.commit()
+        result = import_contacts(self.session, self.other, io.BytesIO(data), "csv")
+        self.assertEqual((result["imported"], result["failed"]), (10, 0))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs /proc to read the RSS")
+    async def test_export_memory_is_bounded(self):
+        # Test exporting a large address book does not grow the RSS with the number of contacts
+        with self.engine.begin() as conn:
+            # Seed in SQL without the search trigger, the export does not use it
+            conn.execute(text("DROP TRIGGER contacts_fts_ai"))
+            conn.execute(text(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count) "
+                "INSERT INTO contacts (first_name, last_name, email, phone_number, birthday, birthday_key, user_id) "
+                "SELECT 'First' || i, 'Last' || i, 'contact' || i || '@example.com', CAST(10000000 + i AS TEXT), "
+                "'1990-01-01', 101, :user_id FROM n"
+            ), {"count": EXPORT_TEST_CONTACTS, "user_id": self.user.id})
+        baseline = peak = current_rss()
+        size = lines = 0
+        async for chunk in export_contacts(self.user, "csv"):
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+            peak = max(peak, current_rss())
+        self.assertEqual(lines, EXPORT_TEST_CONTACTS + 1)
+        self.assertLess(peak - baseline, EXPORT_RSS_BUDGET, f"RSS grew by {(peak - baseline) >> 20} MiB "
+                                                            f"exporting {size >> 20} MiB")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import HTTPException
+from src.services.auth import Auth
+from src.services.hashing import HashingExecutor, get_pwd_context
+
+
+class TestHashingExecutor(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.executor = HashingExecutor(workers=1, max_in_flight=1, max_queue=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def test_hash_and_verify(self):
+        # Test passwords hashed in the pool verify both in the pool and inline
+        hashed = await self.executor.hash("password")
+        self.assertTrue(get_pwd_context().verify("password", hashed))
+        self.assertTrue(await self.executor.verify("password", hashed))
+        self.assertFalse(await self.executor.verify("wrong_password", hashed))
+
+    async def test_queue_full(self):
+        # Test jobs beyond the in-flight and queue limits are rejected with 503
+        results = await asyncio.gather(*(self.executor.hash("password") for _ in range(3)),
+                                       return_exceptions=True)
+        errors = [r for r in results if isinstance(r, HTTPException)]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].status_code, 503)
+        self.assertEqual(self.executor.pending, 0)
+
+    async def test_auth_async_methods(self):
+        # Test Auth exposes awaitable hash and verify methods
+        auth_service = Auth()
+        hashed = await auth_service.get_password_hash_async("password")
+        self.assertTrue(await auth_service.verify_password_async("password", hashed))
+        self.assertTrue(auth_service.verify_password("password", hashed))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import unittest
+import sys
+import os
+import subprocess
+import threading
+import tempfile
+from unittest.mock import AsyncMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from alembic.script import ScriptDirectory
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from main import app, lifespan
+from src.database import db as database
+from src.database.schema import migrate, MIGRATIONS_DIR
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# The schema of a deployment at the baseline revision 99bbca48fb6d, from before the application's own revisions
+BASELINE_SCHEMA = (
+    "CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(50), email VARCHAR(250) NOT NULL UNIQUE, "
+    "password VARCHAR(255) NOT NULL, created_at DATETIME, avatar VARCHAR(255), refresh_token VARCHAR(255), "
+    "email_verified BOOLEAN)",
+    "CREATE TABLE contacts (id INTEGER NOT NULL PRIMARY KEY, first_name VARCHAR, last_name VARCHAR, email VARCHAR, "
+    "phone_number VARCHAR, birthday DATE, additional_data VARCHAR, "
+    "user_id INTEGER REFERENCES users (id) ON DELETE CASCADE)",
+    "CREATE UNIQUE INDEX ix_contacts_email ON contacts (email)",
+    "CREATE UNIQUE INDEX ix_contacts_phone_number ON contacts (phone_number)",
+    "CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL PRIMARY KEY)",
+    "INSERT INTO alembic_version (version_num) VALUES ('99bbca48fb6d')",
+    "INSERT INTO users (id, username, email, password) VALUES (1, 'baseline', 'baseline@example.com', 'x')",
+    "INSERT INTO contacts (id, first_name, last_name, email, phone_number, birthday, user_id) "
+    "VALUES (7, 'Old', 'Contact', 'old.contact@example.com', '555000007', '1990-12-31', 1)",
+)
+
+
+def baseline_database(url: str):
+    """
+    Build a SQLite database holding one user and one contact at the baseline revision.
+
+    Args:
+        url (str): Sync database URL.
+    """
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+    engine.dispose()
+
+
+class TestProbes(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+
+    def test_healthz(self):
+        # Test the liveness probe answers without touching the backends
+        with patch("main.ping_db") as ping:
+            response = self.client.get("/healthz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+        ping.assert_not_called()
+
+    def test_readyz(self):
+        # Test the readiness probe checks the database and Redis and reports the pool
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["checks"], {"database": "ok", "redis": "ok"})
+        self.assertEqual(set(body["pool"]), {"size", "checked_out", "overflow"})
+
+    def test_readyz_unavailable(self):
+        # Test a backend that doesn't answer makes the worker not ready
+        with patch("main.ping_db", AsyncMock(side_effect=TimeoutError())):
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["checks"], {"database": "unavailable: TimeoutError", "redis": "ok"})
+
+
+class TestWarmPool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_connections_kept(self):
+        # Test the warm-up leaves open connections in the pool
+        if database.async_engine is not None:
+            await database.async_engine.dispose()
+            pool = database.async_engine.sync_engine.pool
+        else:
+            database.engine.dispose()
+            pool = database.engine.pool
+        self.assertEqual(await database.warm_pool(3), 3)
+        self.assertEqual(pool.checkedin(), 3)
+        self.assertEqual(pool.checkedout(), 0)
+
+
+class TestLifespan(unittest.TestCase):
+
+    def test_shutdown_without_redis(self):
+        # Test the whole lifespan runs with the in-memory Redis, without redis ever imported
+        script = (
+            "import asyncio, sys\n"
+            "from main import app, lifespan\n"
+            "from src.services import redis_client\n"
+            "async def run():\n"
+            "    async with lifespan(app):\n"
+            "        pass\n"
+            "    print(redis_client.redis_client is None, 'redis' in sys.modules)\n"
+            "asyncio.run(run())\n"
+        )
+        env = {**os.environ, "SQLALCHEMY_DATABASE_URL": "sqlite://", "REDIS_BACKEND": "memory"}
+        result = subprocess.run([sys.executable, "-c", script], cwd=APP_DIR, env=env, capture_output=True, text=True,
+                                timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ["True", "False"])
+
+
+class TestShutdown(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hashing_pool_stopped_off_the_loop(self):
+        # Test waiting for the hashing jobs in progress on shutdown doesn't block the event loop
+        threads = []
+        with patch("main.hashing_executor.shutdown", lambda: threads.append(threading.get_ident())):
+            async with lifespan(app):
+                pass
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = "sqlite:///" + os.path.join(self.directory.name, "schema.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_create_then_upgrade(self):
+        # Test an empty database is built and stamped, and is upgraded from then on
+        self.assertEqual(migrate(self.url), "created")
+        self.assertEqual(migrate(self.url), "upgraded")
+        engine = create_engine(self.url)
+        with engine.connect() as conn:
+            self.assertIn("contacts", inspect(conn).get_table_names())
+            self.assertEqual(conn.execute(text("SELECT version_num FROM alembic_version")).scalar(),
+                             ScriptDirectory(MIGRATIONS_DIR).get_current_head())
+        engine.dispose()
+
+    def test_upgrade_from_baseline(self):
+        # Test a deployment at the baseline revision is upgraded through every revision, keeping its rows
+        baseline_database(self.url)
+        self.assertEqual(migrate(self.url), "upgraded")
+        engine = create_engine(self.url)
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT version_num FROM alembic_version")).scalar(),
+                             ScriptDirectory(MIGRATIONS_DIR).get_current_head())
+            self.assertEqual(conn.execute(text("SELECT birthday_key FROM contacts WHERE id = 7")).scalar(), 1231)
+            self.assertEqual(conn.execute(text("SELECT contacts_version FROM users WHERE id = 1")).scalar(), 0)
+            self.assertEqual(conn.execute(text("SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH 'Contact'"))
+                             .scalars().all(), [7])
+            self.assertIn("ix_contacts_user_id_id", {index["name"] for index in inspect(conn).get_indexes("contacts")})
+        engine.dispose()
+
+    def test_unmanaged_database(self):
+        # Test a database with tables but no revision is refused rather than guessed
+        engine = create_engine(self.url)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY)"))
+        engine.dispose()
+        with self.assertRaises(RuntimeError):
+            migrate(self.url)
+
+
+if __name__ == '__main__':
+    unittest.main()
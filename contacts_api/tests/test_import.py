@@ -0,0 +1,109 @@
+import unittest
+import sys
+import os
+import io
+import json
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from crud import import_contacts, search_contacts
+
+CSV_HEADER = "first_name,last_name,email,phone_number,birthday,additional_data\n"
+
+
+class TestContactImport(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.user = User(username="test_user", email="test@example.com", password="test_password")
+        self.other = User(username="other_user", email="other@example.com", password="test_password")
+        self.session.add_all([self.user, self.other])
+        self.session.commit()
+        self.session.add(Contact(first_name="Taken", last_name="Other", email="taken@example.com",
+                                 phone_number="5550000", birthday=date(1990, 1, 1), user_id=self.other.id))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def import_csv(self, rows, batch_size=1000):
+        return import_contacts(self.session, self.user, io.BytesIO((CSV_HEADER + rows).encode()), "csv", batch_size)
+
+    def contacts(self):
+        return self.session.query(Contact).filter(Contact.user_id == self.user.id).order_by(Contact.email).all()
+
+    def test_import_csv(self):
+        # Test rows are inserted with their birthday key and found by search
+        result = self.import_csv("John,Smith,js@example.com,1001,1990-03-05,\n"
+                                 "Ann,Lee,ann@example.com,1002,1985-12-30,friend\n")
+        self.assertEqual((result["total"], result["imported"], result["failed"]), (2, 2, 0))
+        self.assertEqual(result["errors"], [])
+        contacts = self.contacts()
+        self.assertEqual([c.email for c in contacts], ["ann@example.com", "js@example.com"])
+        self.assertEqual([c.birthday_key for c in contacts], [1230, 305])
+        self.assertEqual(contacts[0].additional_data, "friend")
+        self.assertIsNone(contacts[1].additional_data)
+        self.assertEqual([c.first_name for c in search_contacts(self.session, self.user, "smith")], ["John"])
+
+    def test_import_ndjson(self):
+        # Test NDJSON lines, including blank and malformed ones
+        lines = [json.dumps({"first_name": "John", "last_name": "Smith", "email": "js@example.com",
+                             "phone_number": "1001", "birthday": "1990-03-05", "additional_data": None}),
+                 "", "{not json", "[1, 2]"]
+        result = import_contacts(self.session, self.user, io.BytesIO("\n".join(lines).encode()), "ndjson")
+        self.assertEqual((result["total"], result["imported"], result["failed"]), (3, 1, 2))
+        self.assertEqual([error["row"] for error in result["errors"]], [3, 4])
+        self.assertIn("expected a JSON object", result["errors"][1]["errors"])
+
+    def test_validation_errors_are_reported_per_row(self):
+        # Test invalid rows are skipped and the valid ones imported
+        result = self.import_csv("John,Smith,js@example.com,1001,1990-03-05,\n"
+                                 "Bad,Email,not-an-email,1002,1990-03-05,\n"
+                                 "No,Birthday,nb@example.com,1003,,\n")
+        self.assertEqual((result["imported"], result["failed"]), (1, 2))
+        self.assertEqual([error["row"] for error in result["errors"]], [3, 4])
+        self.assertTrue(result["errors"][0]["errors"][0].startswith("email"))
+        self.assertTrue(result["errors"][1]["errors"][0].startswith("birthday"))
+
+    def test_upsert_by_email(self):
+        # Test an existing contact of the user is updated, another user's one is not touched
+        self.import_csv("John,Smith,js@example.com,1001,1990-03-05,\n")
+        result = self.import_csv("Johnny,Smith,js@example.com,1001,1990-07-14,updated\n"
+                                 "Stolen,Row,taken@example.com,1005,1990-03-05,\n")
+        self.assertEqual((result["imported"], result["failed"]), (1, 1))
+        self.assertEqual(result["errors"][0]["row"], 3)
+        contact = self.contacts()[0]
+        self.session.refresh(contact)
+        self.assertEqual((contact.first_name, contact.birthday_key, contact.additional_data), ("Johnny", 714, "updated"))
+        taken = self.session.query(Contact).filter(Contact.email == "taken@example.com").one()
+        self.assertEqual((taken.first_name, taken.user_id), ("Taken", self.other.id))
+
+    def test_phone_conflict_only_rejects_its_row(self):
+        # Test a duplicate phone number fails its row, not the whole batch
+        result = self.import_csv("John,Smith,js@example.com,1001,1990-03-05,\n"
+                                 "Dup,Phone,dup@example.com,5550000,1990-03-05,\n"
+                                 "Ann,Lee,ann@example.com,1002,1985-12-30,\n")
+        self.assertEqual((result["imported"], result["failed"]), (2, 1))
+        self.assertEqual(result["errors"][0]["row"], 3)
+        self.assertIn("phone_number", result["errors"][0]["errors"][0])
+        self.assertEqual(len(self.contacts()), 2)
+
+    def test_batches(self):
+        # Test rows spanning several batches, with a repeated email keeping the last row
+        rows = "".join(f"First{i},Last{i},c{i}@example.com,{2000 + i},1990-01-01,\n" for i in range(25))
+        rows += "Again,Last,c3@example.com,2003,1990-01-01,\n"
+        result = self.import_csv(rows, batch_size=10)
+        self.assertEqual((result["total"], result["imported"], result["failed"]), (26, 26, 0))
+        self.assertEqual(len(self.contacts()), 25)
+        self.assertEqual(self.session.query(Contact).filter(Contact.email == "c3@example.com").one().first_name, "Again")
+
+
+if __name__ == '__main__':
+    unittest.main()
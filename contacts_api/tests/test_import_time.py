@@ -0,0 +1,58 @@
+import unittest
+import sys
+import os
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import time configuration
+# Cumulative time of `import main` under -X importtime, best of IMPORT_TIME_RUNS; raise it for slow CI machines
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", 1500))
+IMPORT_TIME_RUNS = int(os.getenv("IMPORT_TIME_RUNS", 3))
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Integrations loaded on first use only
+LAZY_MODULES = ("cloudinary", "PIL", "redis", "jose", "passlib", "bcrypt", "libgravatar", "smtplib", "email.mime",
+                "sqlalchemy.dialects.postgresql")
+
+
+def import_main() -> dict:
+    """
+    Import main in a fresh interpreter and read the -X importtime report.
+
+    Returns:
+        dict: Module name to (self, cumulative) import time in microseconds.
+    """
+    env = {**os.environ, "SQLALCHEMY_DATABASE_URL": "sqlite://", "REDIS_BACKEND": "memory"}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(own), int(cumulative))
+    return modules
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_lazy_dependencies(self):
+        # Test importing the application doesn't load the integrations it only needs on first use
+        loaded = [name for name in import_main()
+                  if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)]
+        self.assertEqual(loaded, [])
+
+    def test_budget(self):
+        # Test importing the application stays within the startup budget
+        runs = [import_main() for _ in range(IMPORT_TIME_RUNS)]
+        best = min(runs, key=lambda modules: modules["main"][1])
+        slowest = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:10]
+        self.assertLessEqual(best["main"][1] / 1000, IMPORT_TIME_BUDGET_MS,
+                             "slowest modules (self ms): " +
+                             ", ".join(f"{name} {own / 1000:.1f}" for name, (own, _) in slowest))
+
+
+if __name__ == '__main__':
+    unittest.main()
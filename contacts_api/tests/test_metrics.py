@@ -0,0 +1,141 @@
+import unittest
+import sys
+import os
+import multiprocessing
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.services.metrics import MetricsMiddleware, MetricsRegistry
+
+
+def run_worker(directory, ready, done):
+    # A second worker process: serve two requests, publish them and stay alive until told to exit
+    registry = MetricsRegistry(directory)
+    registry.add_collector(lambda: [("db_pool_checked_out", (), 4)])
+    registry.observe_request("GET", "/contacts/{contact_id}", 200, 0.2, 0, 100)
+    registry.observe_request("GET", "/contacts/{contact_id}", 404, 0.02, 0, 30)
+    registry.flush()
+    ready.set()
+    done.wait(10)
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = MetricsRegistry(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def samples(self, text=None):
+        text = text or self.registry.render()
+        return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+    def test_histogram_buckets(self):
+        # Test latencies land in cumulative buckets with the sum and count
+        for seconds in (0.003, 0.005, 0.04, 20):
+            self.registry.observe_request("GET", "/contacts/", 200, seconds, 10, 2000)
+        samples = self.samples()
+        labels = 'method="GET",route="/contacts/"'
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{labels},le="0.005"}}'], "2")
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{labels},le="0.05"}}'], "3")
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{labels},le="10.0"}}'], "3")
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], "4")
+        self.assertEqual(samples[f'http_request_duration_seconds_count{{{labels}}}'], "4")
+        self.assertEqual(samples[f'http_response_size_bytes_sum{{{labels}}}'], "8000")
+        self.assertEqual(samples[f'http_requests_total{{{labels},status="2xx"}}'], "4")
+
+    def test_collectors(self):
+        # Test gauges come from the registered collectors, and a failing collector is skipped
+        self.registry.add_collector(lambda: [("db_pool_checked_out", (), 3), ("user_cache_size", (), 7)])
+        self.registry.add_collector(lambda: 1 / 0)
+        with self.assertLogs("src.services.metrics", "WARNING"):
+            samples = self.samples()
+        self.assertEqual(samples["db_pool_checked_out"], "3")
+        self.assertEqual(samples["user_cache_size"], "7")
+        self.assertEqual(samples["http_requests_in_progress"], "0")
+
+    def test_middleware_labels_by_route_template(self):
+        # Test requests are labelled with the route template and status class
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware, registry=self.registry)
+
+        @app.post("/contacts/{contact_id}")
+        async def echo(contact_id: int, body: dict):
+            return body
+
+        with TestClient(app) as client:
+            client.post("/contacts/1", json={"a": 1})
+            client.post("/contacts/2", json={"a": 22})
+            client.post("/contacts/x", json={})
+            client.get("/missing/path")
+        samples = self.samples()
+        labels = 'method="POST",route="/contacts/{contact_id}"'
+        self.assertEqual(samples[f'http_requests_total{{{labels},status="2xx"}}'], "2")
+        self.assertEqual(samples[f'http_requests_total{{{labels},status="4xx"}}'], "1")
+        self.assertEqual(samples[f'http_request_size_bytes_sum{{{labels}}}'], str(len('{"a":1}') * 2 + 1 + 2))
+        self.assertEqual(samples['http_requests_total{method="GET",route="unmatched",status="4xx"}'], "1")
+        self.assertFalse(any("/contacts/1" in key for key in samples))
+
+    def test_workers_are_aggregated(self):
+        # Test the metrics of another live worker process are added, and only its gauges dropped once it exits
+        context = multiprocessing.get_context("spawn")
+        ready, done = context.Event(), context.Event()
+        worker = context.Process(target=run_worker, args=(self.directory.name, ready, done))
+        worker.start()
+        try:
+            self.assertTrue(ready.wait(30))
+            self.registry.observe_request("GET", "/contacts/{contact_id}", 200, 0.2, 0, 100)
+            samples = self.samples()
+        finally:
+            done.set()
+            worker.join(10)
+        labels = 'method="GET",route="/contacts/{contact_id}"'
+        self.assertEqual(samples[f'http_requests_total{{{labels},status="2xx"}}'], "2")
+        self.assertEqual(samples[f'http_requests_total{{{labels},status="4xx"}}'], "1")
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{labels},le="0.025"}}'], "1")
+        self.assertEqual(samples[f'http_request_duration_seconds_count{{{labels}}}'], "3")
+        self.assertEqual(samples[f'http_response_size_bytes_sum{{{labels}}}'], "230")
+        self.assertEqual(samples["db_pool_checked_out"], "4")
+
+        for _ in range(2):
+            samples = self.samples()
+            self.assertEqual(samples[f'http_requests_total{{{labels},status="2xx"}}'], "2")
+            self.assertEqual(samples[f'http_requests_total{{{labels},status="4xx"}}'], "1")
+            self.assertEqual(samples[f'http_request_duration_seconds_count{{{labels}}}'], "3")
+            self.assertNotIn("db_pool_checked_out", samples)
+        self.assertEqual(sorted(name for name in os.listdir(self.directory.name) if name.endswith(".json")),
+                         ["dead.json"])
+
+    async def test_stop_keeps_counters(self):
+        # Test a worker that stops leaves its counters to the others
+        self.registry.observe_request("GET", "/contacts/", 200, 0.01, 0, 10)
+        await self.registry.stop()
+        other = MetricsRegistry(self.directory.name)
+        samples = self.samples(other.render())
+        self.assertEqual(samples['http_requests_total{method="GET",route="/contacts/",status="2xx"}'], "1")
+        self.assertEqual(samples["http_requests_in_progress"], "0")
+
+
+
+class TestMetricsRoute(unittest.TestCase):
+
+    def test_operational_counters(self):
+        # Test the user cache and email outbox counters are served with the scraped metrics only
+        from main import app
+        with TestClient(app) as client:
+            text = client.get("/metrics").text
+            self.assertEqual(client.get("/cache/stats").status_code, 404)
+            self.assertEqual(client.get("/outbox/stats").status_code, 404)
+        for name in ("user_cache_requests_total{result=\"miss\"}", "user_cache_size", "email_outbox_depth",
+                     "email_outbox_retrying", "email_outbox_messages_total{result=\"sent\"}",
+                     "email_outbox_connections_total"):
+            self.assertIn(name, text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import sys
+import os
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from crud import decode_cursor, encode_cursor, get_contacts
+
+
+class TestKeysetPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.user = User(username="test_user", email="test@example.com", password="test_password")
+        self.other = User(username="other_user", email="other@example.com", password="test_password")
+        self.session.add_all([self.user, self.other])
+        self.session.commit()
+        for i in range(25):
+            owner = self.user if i % 5 else self.other
+            self.session.add(Contact(first_name=f"First{i}", last_name=f"Last{i}", email=f"c{i}@example.com",
+                                     phone_number=str(1000 + i), birthday=date(1990, 1, 1), user_id=owner.id))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_cursor_round_trip(self):
+        # Test a cursor decodes back to the contact id for its owner only
+        cursor = encode_cursor(self.user.id, 42)
+        self.assertEqual(decode_cursor(cursor, self.user), 42)
+        with self.assertRaises(ValueError):
+            decode_cursor(cursor, self.other)
+        for cursor in ("not-a-cursor", "", "W10"):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor, self.user)
+
+    def test_keyset_pages_match_offset_pages(self):
+        # Test following cursors returns the same pages as offsets
+        offset_pages, keyset_pages, cursor = [], [], None
+        for page in range(3):
+            offset_pages.append([c.id for c in get_contacts(self.session, self.user, skip=page * 8, limit=8)])
+            contacts = get_contacts(self.session, self.user, limit=8, cursor=cursor)
+            keyset_pages.append([c.id for c in contacts])
+            if contacts:
+                cursor = encode_cursor(self.user.id, contacts[-1].id)
+        self.assertEqual(keyset_pages, offset_pages)
+        self.assertEqual([len(page) for page in keyset_pages], [8, 8, 4])
+        self.assertTrue(all(c.user_id == self.user.id for c in self.session.query(Contact).filter(
+            Contact.id.in_(sum(keyset_pages, []))
+        )))
+
+
+if __name__ == '__main__':
+    unittest.main()
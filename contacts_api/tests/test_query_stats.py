@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+from src.database import db as database
+from src.database.db import (QueryStatsMiddleware, instrument_engine, redact_parameters, statement_shape,
+                             track_queries)
+
+
+class TestQueryStats(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = instrument_engine(create_engine("sqlite://"))
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def run_queries(self, count):
+        with self.engine.connect() as conn:
+            for i in range(count):
+                conn.execute(text("SELECT :value"), {"value": i})
+
+    def test_statements_are_counted_in_context(self):
+        # Test only the statements inside the block are recorded
+        self.run_queries(2)
+        with track_queries() as stats:
+            self.run_queries(3)
+        self.run_queries(2)
+        self.assertEqual(stats.count, 3)
+        self.assertGreater(stats.seconds, 0)
+        self.assertRegex(stats.server_timing(), r'^db;dur=\d+\.\d\d;desc="3 queries"$')
+
+    def test_repeated_statements(self):
+        # Test statements differing only in parameters are one shape
+        with track_queries() as stats:
+            self.run_queries(4)
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1 WHERE 1 IN (:a, :b)"), {"a": 1, "b": 2})
+                conn.execute(text("SELECT 1 WHERE 1 IN (:a, :b, :c)"), {"a": 1, "b": 2, "c": 3})
+        self.assertEqual(stats.repeated(threshold=3), [("SELECT ?", 4)])
+        self.assertEqual(stats.repeated(threshold=1)[1], ("SELECT 1 WHERE 1 IN (?, ...)", 2))
+        self.assertEqual(statement_shape("SELECT  *\n FROM t WHERE id IN ($1, $2, $3)"),
+                         "SELECT * FROM t WHERE id IN ($1, ...)")
+
+    def test_failed_statements(self):
+        # Test failed statements are counted and leave nothing behind on the connection
+        with track_queries() as stats, self.engine.connect() as conn:
+            for _ in range(3):
+                with self.assertRaises(DBAPIError):
+                    conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+            info = dict(conn.info)
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(info, {})
+
+    def test_slow_query_log_is_redacted(self):
+        # Test slow statements are logged without their parameter values
+        with patch.object(database, "SLOW_QUERY_MS", 0), self.assertLogs("src.database.db", "WARNING") as logs:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT :password"), {"password": "hunter22"})
+        self.assertIn("Slow query", logs.output[0])
+        self.assertIn("SELECT ?", logs.output[0])
+        self.assertNotIn("hunter22", logs.output[0])
+        self.assertEqual(redact_parameters({"password": "hunter22"}), "{password: ?}")
+        self.assertEqual(redact_parameters([("a",), ("b",)]), "[2 parameter sets]")
+
+    def test_middleware(self):
+        # Test the Server-Timing header and the N+1 warning of a request
+        app = FastAPI()
+        app.add_middleware(QueryStatsMiddleware)
+
+        @app.get("/items/{count}")
+        def items(count: int):
+            self.run_queries(count)
+            return {}
+
+        with TestClient(app) as client:
+            response = client.get("/items/2")
+            self.assertEqual(response.headers["server-timing"].split(";")[2], 'desc="2 queries"')
+            with self.assertLogs("src.database.db", "WARNING") as logs:
+                response = client.get(f"/items/{database.N_PLUS_ONE_THRESHOLD + 1}")
+        self.assertIn(f'desc="{database.N_PLUS_ONE_THRESHOLD + 1} queries"', response.headers["server-timing"])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Possible N+1 query in GET /items/", logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
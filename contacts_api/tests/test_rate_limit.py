@@ -0,0 +1,162 @@
+import unittest
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from redis.exceptions import ConnectionError as RedisConnectionError
+from main import app
+from src.services import ratelimit
+from src.services.ratelimit import (LocalBuckets, RateLimiter, client_ip, load_limits, parse_limit, parse_networks,
+                                   rate_limiter)
+from test_statement_counts import count_statements
+
+
+class TestLimits(unittest.TestCase):
+
+    def test_parse_limit(self):
+        # Test limits are a burst and a refill rate, or disabled
+        self.assertEqual(parse_limit("5/60"), (5, 5 / 60))
+        self.assertEqual(parse_limit("10/1"), (10, 10.0))
+        for spec in ("off", "0", "", None):
+            self.assertIsNone(parse_limit(spec))
+        with self.assertRaises(ValueError):
+            parse_limit("five")
+
+    def test_overrides(self):
+        # Test each route and scope can be changed or turned off from the environment
+        with patch.dict(os.environ, {"RATE_LIMIT_LOGIN_IP": "100/10", "RATE_LIMIT_LOGIN_ACCOUNT": "off"}):
+            limits = load_limits({"login": {"ip": "1/1", "account": "1/1"}, "signup": {"ip": "2/1"}})
+        self.assertEqual(limits, {"login": {"ip": (100, 10.0)}, "signup": {"ip": (2, 2.0)}})
+
+
+class TestClientIp(unittest.TestCase):
+
+    def request(self, peer: str, *forwarded: str) -> Request:
+        headers = [(b"x-forwarded-for", value.encode()) for value in forwarded]
+        return Request({"type": "http", "client": (peer, 50000), "headers": headers})
+
+    def test_trusted_proxies(self):
+        # Test the client is the first forwarded address from the right that is not a trusted proxy
+        proxies = parse_networks("10.0.0.0/8, 192.0.2.1")
+        self.assertEqual(client_ip(self.request("10.0.0.1", "203.0.113.7, 192.0.2.1"), proxies), "203.0.113.7")
+        self.assertEqual(client_ip(self.request("10.0.0.1", "198.51.100.9, 203.0.113.7"), proxies), "203.0.113.7")
+        self.assertEqual(client_ip(self.request("10.0.0.1", "198.51.100.9", "203.0.113.7"), proxies), "203.0.113.7")
+        self.assertEqual(client_ip(self.request("10.0.0.1", "10.0.0.2"), proxies), "10.0.0.2")
+        self.assertEqual(client_ip(self.request("10.0.0.1"), proxies), "10.0.0.1")
+
+    def test_untrusted_peer(self):
+        # Test X-Forwarded-For is ignored unless the request comes from a trusted proxy
+        self.assertEqual(client_ip(self.request("203.0.113.7", "198.51.100.9"), parse_networks("10.0.0.0/8")),
+                         "203.0.113.7")
+        self.assertEqual(client_ip(self.request("10.0.0.1", "198.51.100.9"), ()), "10.0.0.1")
+        with self.assertRaises(ValueError):
+            parse_networks("10.0.0.0/8,proxy")
+
+
+class TestLocalBuckets(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch.object(ratelimit.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buckets = LocalBuckets(maxsize=3)
+
+    def test_burst_and_refill(self):
+        # Test a bucket allows its burst, then one request per refill interval
+        bucket = [("a", 3, 0.5)]
+        self.assertEqual([self.buckets.take(bucket) for _ in range(4)], [0, 0, 0, 2.0])
+        self.now += 1
+        self.assertEqual(self.buckets.take(bucket), 1.0)
+        self.now += 1
+        self.assertEqual(self.buckets.take(bucket), 0)
+
+    def test_all_or_nothing(self):
+        # Test a refused request takes no token from the buckets that still had some
+        self.buckets.take([("ip", 2, 1.0), ("account", 1, 1.0)])
+        self.assertGreater(self.buckets.take([("ip", 2, 1.0), ("account", 1, 1.0)]), 0)
+        self.assertEqual(self.buckets.take([("ip", 2, 1.0), ("other", 1, 1.0)]), 0)
+
+    def test_size_bound(self):
+        # Test the least recently used buckets are dropped past maxsize
+        for key in "abcd":
+            self.buckets.take([(key, 1, 1.0)])
+        self.assertEqual(len(self.buckets), 3)
+        self.assertEqual(self.buckets.take([("a", 1, 1.0)]), 0)
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_redis_failure_falls_back_to_local_buckets(self):
+        # Test limits still hold while Redis is unreachable
+        redis_client = MagicMock()
+        script = MagicMock(side_effect=RedisConnectionError("down"))
+        script.registered_client = redis_client
+        redis_client.register_script.return_value = script
+        limiter = RateLimiter(limits={"login": {"ip": (1, 0.1)}}, backend="redis", redis_client=redis_client)
+        self.assertEqual(await limiter.hit("login", {"ip": "10.0.0.1"}), 0)
+        self.assertGreater(await limiter.hit("login", {"ip": "10.0.0.1"}), 0)
+        self.assertEqual(script.call_count, 1)
+
+    async def test_unlimited(self):
+        # Test routes and scopes without limits, and missing identities, are not counted
+        limiter = RateLimiter(limits={"login": {"ip": (1, 0.1)}}, backend="local")
+        for _ in range(3):
+            self.assertEqual(await limiter.hit("signup", {"ip": "10.0.0.1"}), 0)
+            self.assertEqual(await limiter.hit("login", {"ip": None, "account": "a@example.com"}), 0)
+
+
+class TestRateLimitedRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.limits, self.local = rate_limiter.limits, rate_limiter.local
+        rate_limiter.limits = {"login": {"ip": (20, 0.01), "account": (3, 0.01)}, "signup": {"ip": (2, 0.01)}}
+        rate_limiter.local = LocalBuckets()
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        rate_limiter.limits, rate_limiter.local = self.limits, self.local
+
+    def login(self, username: str):
+        return self.client.post("/login", data={"username": username, "password": "wrong-password"})
+
+    def test_login_limited_per_account(self):
+        # Test a refused login gets 429 with Retry-After without touching the database or bcrypt
+        for _ in range(3):
+            self.assertEqual(self.login("limited@example.com").status_code, 401)
+        with count_statements() as statements, patch("main.auth_service.verify_password_async") as verify:
+            response = self.login("Limited@Example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertEqual(statements, [])
+        verify.assert_not_called()
+        self.assertEqual(self.login("other@example.com").status_code, 401)
+
+    def test_signup_limited_per_ip(self):
+        # Test the signup limit counts every request from the client
+        body = {"username": "limited", "email": "limited@example.com"}
+        responses = [self.client.post("/signup", json=body).status_code for _ in range(3)]
+        self.assertEqual(responses, [422, 422, 429])
+
+    def test_signup_limited_per_forwarded_ip(self):
+        # Test clients behind a trusted proxy are counted by their forwarded address
+        body = {"username": "limited", "email": "limited@example.com"}
+        # The application is already started by the client of setUp
+        client = TestClient(app, client=("10.0.0.1", 50000))
+        with patch.object(ratelimit, "TRUSTED_PROXIES", parse_networks("10.0.0.0/8")):
+            def signup(forwarded: str) -> int:
+                return client.post("/signup", json=body, headers={"X-Forwarded-For": forwarded}).status_code
+
+            self.assertEqual([signup("203.0.113.7"), signup("203.0.113.8")], [422, 422])
+            self.assertEqual([signup("198.51.100.9, 203.0.113.7"), signup("203.0.113.7")], [422, 429])
+            self.assertEqual(signup("203.0.113.8"), 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
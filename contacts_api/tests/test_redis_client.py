@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.services import redis_client
+from src.services.redis_client import InMemoryRedis
+
+
+class TestInMemoryRedis(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.client = InMemoryRedis()
+
+    async def test_get_set_delete(self):
+        # Test values come back as bytes and can be deleted
+        await self.client.set("key", "value")
+        self.assertEqual(await self.client.get("key"), b"value")
+        self.assertEqual(await self.client.delete("key", "missing"), 1)
+        self.assertIsNone(await self.client.get("key"))
+
+    async def test_expiry(self):
+        # Test keys expire and report their TTL
+        await self.client.setex("key", 60, "value")
+        self.assertEqual(await self.client.ttl("key"), 59)
+        await self.client.set("key", "value", ex=0)
+        self.assertIsNone(await self.client.get("key"))
+        self.assertEqual(await self.client.ttl("key"), -2)
+
+    async def test_set_options(self):
+        # Test SET with XX only replaces existing keys and GET returns the replaced value
+        self.assertIsNone(await self.client.set("key", "a", xx=True, get=True))
+        self.assertIsNone(await self.client.get("key"))
+        await self.client.set("key", "a")
+        self.assertEqual(await self.client.set("key", "b", xx=True, get=True), b"a")
+        self.assertEqual(await self.client.get("key"), b"b")
+
+    async def test_sets(self):
+        # Test set members are added once and the key goes away with the last member
+        self.assertEqual(await self.client.sadd("set", "a", "b", "a"), 2)
+        self.assertEqual(await self.client.smembers("set"), {b"a", b"b"})
+        self.assertEqual(await self.client.srem("set", "a", "missing"), 1)
+        self.assertEqual(await self.client.srem("set", "b"), 1)
+        self.assertEqual(await self.client.exists("set"), 0)
+        self.assertEqual(await self.client.smembers("set"), set())
+
+    async def test_pipeline(self):
+        # Test queued commands run in order on execute
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set("a", 1)
+        pipe.incr("a")
+        pipe.get("a")
+        self.assertEqual(await pipe.execute(), [True, 2, b"2"])
+
+
+class TestSharedClient(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        await redis_client.close_redis()
+        self.client = await redis_client.init_redis()
+
+    async def asyncTearDown(self):
+        await redis_client.close_redis()
+
+    async def test_shared_client(self):
+        # Test the stand-in is used as the shared client in the test suite
+        self.assertIsInstance(self.client, InMemoryRedis)
+        self.assertIs(redis_client.get_redis(), self.client)
+
+
+
+class TestRedisErrors(unittest.TestCase):
+
+    def test_combinable(self):
+        # Test the error classes are a tuple that can be unpacked in an except clause, with or without redis
+        from redis.exceptions import ConnectionError, RedisError
+        self.assertEqual(redis_client.redis_errors(), (RedisError,))
+        with patch.dict(sys.modules, {"redis.exceptions": None}):
+            self.assertEqual(redis_client.redis_errors(), ())
+            with self.assertRaises(ConnectionError):
+                try:
+                    raise ConnectionError()
+                except (*redis_client.redis_errors(), OSError):
+                    self.fail("Redis errors are not caught while redis is not imported")
+        for error in (ConnectionError(), OSError()):
+            try:
+                raise error
+            except (*redis_client.redis_errors(), OSError) as e:
+                self.assertIs(e, error)
+
+
+if __name__ == '__main__':
+    unittest.main()
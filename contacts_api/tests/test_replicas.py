@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+import tempfile
+from datetime import date
+from unittest.mock import MagicMock, AsyncMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from main import app
+from src.database import db as database
+from src.database.models import Contact, User
+from src.database.replicas import ReplicaRouter
+from src.database.schema import migrate
+from src.services.auth import auth_service
+from src.services.redis_client import get_redis
+
+
+def contact_body(n):
+    return {"first_name": "Primary", "last_name": f"Write{n}", "email": f"replica.{n}@example.com",
+            "phone_number": str(555300000 + n), "birthday": "1990-01-01", "additional_data": None}
+
+
+class TestReadReplicas(unittest.IsolatedAsyncioTestCase):
+    """
+    The replicas are two SQLite files holding their own contact, so each read shows which database served it.
+    """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with database.SessionLocal() as db:
+            db.query(Contact).filter(Contact.email.like("replica.%")).delete(synchronize_session=False)
+            db.query(User).filter(User.email == "replica.user@example.com").delete(synchronize_session=False)
+            user = User(username="replica_user", email="replica.user@example.com", password="x")
+            db.add(user)
+            db.commit()
+            self.user_id = user.id
+        self.urls = [self.replica(name) for name in ("A", "B")]
+        self.headers = {"Authorization": "Bearer " + await auth_service.create_access_token(
+            data={"sub": "replica.user@example.com"})}
+        self.client = TestClient(app)
+        self.client.__enter__()
+        self.routers = []
+
+    async def asyncTearDown(self):
+        self.client.__exit__(None, None, None)
+        for router in self.routers:
+            await router.dispose()
+        await get_redis().delete(ReplicaRouter([]).pin_key(self.user_id))
+        self.directory.cleanup()
+
+    def replica(self, name: str) -> str:
+        url = "sqlite:///" + os.path.join(self.directory.name, f"replica_{name}.db")
+        migrate(url)
+        engine = create_engine(url)
+        with Session(engine) as db:
+            db.add(User(id=self.user_id, username="replica_user", email="replica.user@example.com", password="x"))
+            db.add(Contact(first_name="Replica", last_name=name, email=f"replica.{name}@example.com",
+                           phone_number=name, birthday=date(1990, 1, 1), user_id=self.user_id))
+            db.commit()
+        engine.dispose()
+        return url
+
+    def router(self, urls: list, **kwargs) -> ReplicaRouter:
+        router = ReplicaRouter(urls, **kwargs)
+        self.routers.append(router)
+        patcher = patch("main.read_router", router)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return router
+
+    def served_by(self) -> list:
+        response = self.client.get("/contacts/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return sorted(f"{contact['first_name']} {contact['last_name']}" for contact in response.json())
+
+    def test_round_robin(self):
+        # Test reads alternate between the replicas and never touch the primary
+        router = self.router(self.urls)
+        self.assertEqual([self.served_by() for _ in range(4)],
+                         [["Replica A"], ["Replica B"], ["Replica A"], ["Replica B"]])
+        self.assertEqual(router.reads, {"primary": 0, "replica": 4})
+
+    async def test_read_your_writes(self):
+        # Test a user's reads go to the primary after the user writes, until the pin expires
+        router = self.router(self.urls, pin_seconds=7)
+        response = self.client.post("/contacts/", json=contact_body(0), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.served_by(), ["Primary Write0"])
+        self.assertEqual(await get_redis().ttl(router.pin_key(self.user_id)), 6)
+        await get_redis().delete(router.pin_key(self.user_id))
+        self.assertEqual(self.served_by(), ["Replica A"])
+
+    def test_unavailable_replica(self):
+        # Test a replica that can't be reached is skipped, and the primary serves when none is left
+        missing = "sqlite:///" + os.path.join(self.directory.name, "missing", "replica.db")
+        router = self.router([missing, self.urls[0]])
+        self.assertEqual([self.served_by() for _ in range(3)], [["Replica A"]] * 3)
+        self.assertEqual(router.status(), {"total": 2, "up": 1})
+        router = self.router([missing])
+        self.assertEqual(self.served_by(), [])
+        self.assertEqual(router.reads, {"primary": 1, "replica": 0})
+
+    async def test_redis_failure_reads_primary(self):
+        # Test the primary serves when the pins can't be checked
+        redis_client = MagicMock()
+        redis_client.exists = AsyncMock(side_effect=RedisConnectionError("down"))
+        router = ReplicaRouter(self.urls, redis_client=redis_client)
+        self.routers.append(router)
+        self.assertTrue(await router.pinned(self.user_id))
+
+    async def test_without_replicas(self):
+        # Test without replicas reads use the primary and writes don't pin anything
+        router = self.router([])
+        self.client.post("/contacts/", json=contact_body(1), headers=self.headers)
+        self.assertEqual(self.served_by(), ["Primary Write1"])
+        self.assertFalse(await get_redis().exists(router.pin_key(self.user_id)))
+        self.assertEqual(router.reads, {"primary": 1, "replica": 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Contact, User
+from crud import get_contacts, search_contacts
+
+
+class TestContactSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.user = User(username="test_user", email="test@example.com", password="test_password")
+        self.other = User(username="other_user", email="other@example.com", password="test_password")
+        self.session.add_all([self.user, self.other])
+        self.session.commit()
+        rows = [
+            ("John", "Smith", "js@example.com", self.user),
+            ("Johnny", "Walker", "walker@example.com", self.user),
+            ("Ann", "Johnson", "ann@example.com", self.user),
+            ("Mary", "Jones", "mary.john@example.com", self.user),
+            ("Peter", "Parker", "peter@example.com", self.user),
+            ("John", "Other", "john.other@example.com", self.other),
+        ]
+        for i, (first_name, last_name, email, owner) in enumerate(rows):
+            self.session.add(Contact(first_name=first_name, last_name=last_name, email=email,
+                                     phone_number=str(1000 + i), birthday=date(1990, 1, 1), user_id=owner.id))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def names(self, contacts):
+        return sorted(c.first_name for c in contacts)
+
+    def test_fts_table_created(self):
+        # Test create_all builds the FTS5 table on SQLite
+        self.assertIn("contacts_fts", inspect(self.engine).get_table_names())
+
+    def test_search_is_scoped_to_user(self):
+        # Test every field is searched and other users' contacts are excluded
+        contacts = search_contacts(self.session, self.user, "john")
+        self.assertEqual(self.names(contacts), ["Ann", "John", "Johnny", "Mary"])
+        self.assertTrue(all(c.user_id == self.user.id for c in contacts))
+
+    def test_search_is_ranked(self):
+        # Test the closest match comes first
+        contacts = search_contacts(self.session, self.user, "Parker")
+        self.assertEqual(self.names(contacts), ["Peter"])
+        contacts = search_contacts(self.session, self.user, "walker")
+        self.assertEqual(contacts[0].first_name, "Johnny")
+
+    def test_index_follows_updates_and_deletes(self):
+        # Test the FTS table is kept in sync by the triggers
+        peter = self.session.query(Contact).filter(Contact.first_name == "Peter").one()
+        peter.last_name = "Quill"
+        self.session.commit()
+        self.assertEqual(search_contacts(self.session, self.user, "Parker"), [])
+        self.assertEqual(self.names(search_contacts(self.session, self.user, "quill")), ["Peter"])
+        self.session.delete(peter)
+        self.session.commit()
+        self.assertEqual(search_contacts(self.session, self.user, "quill"), [])
+
+    def test_short_and_quoted_queries(self):
+        # Test queries shorter than a trigram and queries with quotes
+        self.assertEqual(self.names(search_contacts(self.session, self.user, "jo")),
+                         ["Ann", "John", "Johnny", "Mary"])
+        self.assertEqual(search_contacts(self.session, self.user, 'jo"hn'), [])
+
+    def test_get_contacts_query(self):
+        # Test get_contacts delegates to the search and rejects cursors
+        self.assertEqual(len(get_contacts(self.session, self.user, query="john", limit=2)), 2)
+        with self.assertRaises(ValueError):
+            get_contacts(self.session, self.user, query="john", cursor="WzEsMl0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from main import app
+from src.database import db as database
+from src.database.models import Contact, User
+from src.schemas import Contact as ContactSchema, contact_list_adapter, dump_contacts
+from src.services.auth import auth_service
+
+
+class TestDumpContacts(unittest.TestCase):
+
+    def test_matches_validated_output(self):
+        # Test the fast path writes exactly what validating the rows would
+        contacts = [
+            Contact(id=1, first_name="John", last_name="Doe", email="john@example.com", phone_number="1",
+                    birthday=date(1990, 1, 2), additional_data=None, user_id=1),
+            Contact(id=2, first_name="Олена", last_name='Quote"d', email="olena@example.com", phone_number="2",
+                    birthday=date(2000, 2, 29), additional_data="notes\nline", user_id=1),
+        ]
+        validated = contact_list_adapter.validate_python(contacts, from_attributes=True)
+        self.assertEqual(dump_contacts(contacts), contact_list_adapter.dump_json(validated))
+        self.assertEqual(dump_contacts([]), b"[]")
+
+    def test_skips_validation(self):
+        # Test trusted rows are not validated again
+        contact = Contact(id=1, first_name="John", last_name="Doe", email="not-an-email", phone_number="1",
+                          birthday=date(1990, 1, 2), additional_data=None)
+        self.assertIn(b'"email":"not-an-email"', dump_contacts([contact]))
+
+
+class TestListResponses(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = TestClient(app)
+        self.client.__enter__()
+        with database.SessionLocal() as db:
+            db.query(Contact).filter(Contact.email.like("serial.%")).delete(synchronize_session=False)
+            db.query(User).filter(User.email.like("serial.%")).delete(synchronize_session=False)
+            db.add(User(username="serial_user", email="serial.user@example.com", password="x"))
+            db.commit()
+        token = await auth_service.create_access_token(data={"sub": "serial.user@example.com"})
+        self.headers = {"Authorization": f"Bearer {token}"}
+        today = date.today()
+        for i in range(3):
+            body = {"first_name": "Serial", "last_name": f"Test{i}", "email": f"serial.{i}@example.com",
+                    "phone_number": str(555200000 + i), "birthday": today.replace(year=1990).isoformat(),
+                    "additional_data": None}
+            self.assertEqual(self.client.post("/contacts/", json=body, headers=self.headers).status_code, 201)
+
+    async def asyncTearDown(self):
+        self.client.__exit__(None, None, None)
+
+    def test_list_routes(self):
+        # Test the list routes return valid Contact lists with their headers
+        for url in ("/contacts/?limit=2", "/contacts/upcoming_birthdays/?days=0"):
+            response = self.client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["content-type"], "application/json")
+            contacts = contact_list_adapter.validate_json(response.content)
+            self.assertTrue(all(isinstance(contact, ContactSchema) for contact in contacts))
+        self.assertEqual(len(contacts), 3)
+        response = self.client.get("/contacts/?limit=2", headers=self.headers)
+        self.assertEqual(len(response.json()), 2)
+        self.assertIn("X-Next-Cursor", response.headers)
+        self.assertIn("ETag", response.headers)
+
+    def test_openapi_schema(self):
+        # Test the list routes still document a list of Contact
+        paths = app.openapi()["paths"]
+        for path in ("/contacts/", "/contacts/upcoming_birthdays/"):
+            schema = paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+            self.assertEqual(schema["type"], "array")
+            self.assertEqual(schema["items"], {"$ref": "#/components/schemas/Contact"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from main import app
+from src.database import db as database
+from src.database.models import User
+from src.services.hashing import hash_password
+from src.services.redis_client import InMemoryRedis
+from src.services.sessions import RefreshTokenStore
+from test_statement_counts import count_statements
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = InMemoryRedis()
+        self.store = RefreshTokenStore(self.redis, expire_seconds=600)
+
+    async def test_rotation(self):
+        # Test each token of a family can be used once and the family follows the latest token
+        first = await self.store.start("a@example.com", "phone")
+        second = await self.store.rotate({"sub": "a@example.com", **first})
+        self.assertEqual(second["fam"], first["fam"])
+        self.assertNotEqual(second["jti"], first["jti"])
+        third = await self.store.rotate({"sub": "a@example.com", **second})
+        self.assertIsNotNone(third)
+        self.assertEqual(await self.redis.ttl(self.store.family_key(first["fam"])), 599)
+
+    async def test_reuse_revokes_family(self):
+        # Test presenting a used token ends the family for every holder
+        first = await self.store.start("a@example.com", "phone")
+        second = await self.store.rotate({"sub": "a@example.com", **first})
+        self.assertIsNone(await self.store.rotate({"sub": "a@example.com", **first}))
+        self.assertIsNone(await self.store.rotate({"sub": "a@example.com", **second}))
+        self.assertEqual(await self.store.sessions("a@example.com"), [])
+
+    async def test_unknown_tokens(self):
+        # Test tokens without a family, of an unknown family or of another user are refused
+        first = await self.store.start("a@example.com", "phone")
+        self.assertIsNone(await self.store.rotate({"sub": "a@example.com"}))
+        self.assertIsNone(await self.store.rotate({"sub": "a@example.com", "fam": "missing", "jti": "x"}))
+        self.assertIsNone(await self.store.rotate({"sub": "b@example.com", **first}))
+        self.assertIsNotNone(await self.store.rotate({"sub": "a@example.com", **first}))
+
+    async def test_sessions_per_device(self):
+        # Test every login is a session of its own that can be listed and revoked
+        phone = await self.store.start("a@example.com", "phone")
+        laptop = await self.store.start("a@example.com", "laptop")
+        await self.store.start("b@example.com", "tablet")
+        sessions = await self.store.sessions("a@example.com")
+        self.assertEqual([session["device"] for session in sessions], ["phone", "laptop"])
+        self.assertFalse(await self.store.revoke("b@example.com", phone["fam"]))
+        self.assertTrue(await self.store.revoke("a@example.com", phone["fam"]))
+        self.assertIsNone(await self.store.rotate({"sub": "a@example.com", **phone}))
+        self.assertIsNotNone(await self.store.rotate({"sub": "a@example.com", **laptop}))
+        # An expired family drops out of the index
+        await self.redis.delete(self.store.family_key(laptop["fam"]))
+        self.assertEqual(await self.store.sessions("a@example.com"), [])
+        self.assertEqual(await self.redis.smembers(self.store.user_key("a@example.com")), set())
+
+
+class TestSessionRoutes(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with database.SessionLocal() as db:
+            db.query(User).filter(User.email == "session.user@example.com").delete(synchronize_session=False)
+            db.add(User(username="session_user", email="session.user@example.com",
+                        password=hash_password("secret1"), email_verified=True))
+            db.commit()
+
+    def setUp(self):
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+
+    def login(self, device: str) -> dict:
+        response = self.client.post("/login", data={"username": "session.user@example.com", "password": "secret1"},
+                                    headers={"User-Agent": device})
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def refresh(self, tokens: dict):
+        return self.client.get("/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+
+    def test_devices(self):
+        # Test two devices stay logged in side by side and can be logged out one by one
+        phone, laptop = self.login("phone"), self.login("laptop")
+        headers = {"Authorization": f"Bearer {phone['access_token']}"}
+        sessions = self.client.get("/sessions", headers=headers).json()
+        self.assertEqual([session["device"] for session in sessions], ["phone", "laptop"])
+        self.assertEqual(self.client.delete(f"/sessions/{sessions[0]['id']}", headers=headers).status_code, 204)
+        self.assertEqual(self.client.delete(f"/sessions/{sessions[0]['id']}", headers=headers).status_code, 404)
+        self.assertEqual(self.refresh(phone).status_code, 401)
+        self.assertEqual(self.refresh(laptop).status_code, 200)
+
+    def test_refresh_writes_nothing(self):
+        # Test rotation and reuse detection work without any SQL write
+        tokens = self.login("phone")
+        with count_statements() as statements:
+            response = self.refresh(tokens)
+            self.assertEqual(response.status_code, 200)
+            rotated = response.json()
+            self.assertEqual(self.refresh(tokens).status_code, 401)
+        self.assertFalse([s for s in statements if not s.lstrip().upper().startswith("SELECT")], statements)
+        # The reuse ended the family, so the rotated token is refused too
+        self.assertEqual(self.refresh(rotated).status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
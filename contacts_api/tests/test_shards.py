@@ -0,0 +1,265 @@
+import unittest
+import sys
+import os
+import subprocess
+import tempfile
+import threading
+from collections import Counter
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from alembic.script import ScriptDirectory
+from fastapi.concurrency import run_in_threadpool
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.util import greenlet_spawn
+from main import app
+from src.database import db as database
+from src.database.models import Contact, User
+from src.database.rebalance import Rebalancer
+from src.database.schema import migrate, migrate_all, MIGRATIONS_DIR
+from src.database.shards import HashRing, IdAllocator, ShardRouter
+from src.services.auth import auth_service
+from src.services.ratelimit import rate_limiter
+from test_health import baseline_database
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def contact_body(n):
+    return {"first_name": "Shard", "last_name": f"Contact{n}", "email": f"shard.{n}@example.com",
+            "phone_number": str(555400000 + n), "birthday": "1990-01-01", "additional_data": None}
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_spread_and_growth(self):
+        # Test users spread over the shards, and a new shard only takes users from the others
+        before = HashRing(["s1", "s2", "s3"])
+        after = HashRing(["s1", "s2", "s3", "s4"])
+        placements = {user_id: before.lookup(user_id) for user_id in range(3000)}
+        for count in Counter(placements.values()).values():
+            self.assertTrue(600 < count < 1400, count)
+        moved = {user_id for user_id, shard in placements.items() if after.lookup(user_id) != shard}
+        self.assertEqual({after.lookup(user_id) for user_id in moved}, {"s4"})
+        self.assertTrue(450 < len(moved) < 1050, len(moved))
+        self.assertIsNone(HashRing([]).lookup(1))
+
+
+class TestIdAllocator(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reserved_off_the_event_loop(self):
+        # Test blocks are reserved in the thread pool, also when a write outruns what was reserved for it
+        allocator = IdAllocator(database.engine, block=2)
+        reserve = allocator._reserve
+        threads = []
+
+        def record(size):
+            threads.append(threading.get_ident())
+            return reserve(size)
+
+        with patch.object(allocator, "_reserve", record):
+            await allocator.reserve(3)
+            reserved = len(threads)
+            ids = allocator.take(3)
+            self.assertEqual(len(threads), reserved)
+            ids += await run_in_threadpool(allocator.take, 5)
+            ids += await greenlet_spawn(allocator.take, 4)
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(len(ids), 12)
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+class TestShards(unittest.IsolatedAsyncioTestCase):
+    """
+    The primary is the suite's database and the shards are two SQLite files.
+    """
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.urls = {name: "sqlite:///" + os.path.join(self.directory.name, f"shard_{name}.db")
+                     for name in ("s1", "s2")}
+        for url in self.urls.values():
+            migrate(url)
+        with database.SessionLocal() as db:
+            db.query(Contact).filter(Contact.email.like("shard.%")).delete(synchronize_session=False)
+            db.query(User).filter(User.email.like("shard.%")).delete(synchronize_session=False)
+            db.commit()
+        self.router = ShardRouter(self.urls)
+        for target in ("main.shard_router", "src.repository.users.shard_router"):
+            patcher = patch(target, self.router)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("crud.contact_ids", IdAllocator(database.engine))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    async def asyncTearDown(self):
+        self.client.__exit__(None, None, None)
+        await self.router.dispose()
+        self.directory.cleanup()
+
+    async def user(self, name: str, shard: str = None) -> tuple:
+        with database.SessionLocal() as db:
+            user = User(username=name, email=f"shard.{name}@example.com", password="x", shard=shard)
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+            db.expunge(user)
+        if shard is not None:
+            await self.router.add_user(shard, user)
+        token = await auth_service.create_access_token(data={"sub": user.email})
+        return user, {"Authorization": f"Bearer {token}"}
+
+    def contacts_on(self, name: str | None, user_id: int) -> list:
+        engine = database.engine if name is None else create_engine(self.urls[name])
+        with Session(engine) as db:
+            ids = db.scalars(select(Contact.id).where(Contact.user_id == user_id).order_by(Contact.id)).all()
+        if name is not None:
+            engine.dispose()
+        return ids
+
+    def shard_row(self, name: str, user_id: int):
+        engine = create_engine(self.urls[name])
+        with Session(engine) as db:
+            row = db.get(User, user_id)
+        engine.dispose()
+        return row
+
+    def test_signup_places_user(self):
+        # Test a new user is placed on the ring's shard, which gets a copy of the row without the password
+        body = {"username": "shard_signup", "email": "shard.signup@example.com", "password": "secret123"}
+        with patch.object(rate_limiter, "limits", {}):
+            response = self.client.post("/signup", json=body)
+        self.assertEqual(response.status_code, 201)
+        with database.SessionLocal() as db:
+            user = db.query(User).filter(User.email == body["email"]).one()
+        self.assertEqual(user.shard, self.router.target(user.id))
+        copy = self.shard_row(user.shard, user.id)
+        self.assertEqual((copy.email, copy.password, copy.shard), (body["email"], "", user.shard))
+
+    async def test_contacts_on_shard(self):
+        # Test the contact routes of a user placed on a shard only touch that shard
+        user, headers = await self.user("routed", "s2")
+        created = [self.client.post("/contacts/", json=contact_body(n), headers=headers).json() for n in range(3)]
+        ids = [contact["id"] for contact in created]
+        self.assertEqual(self.contacts_on("s2", user.id), ids)
+        self.assertEqual(self.contacts_on(None, user.id), [])
+        self.assertEqual(self.contacts_on("s1", user.id), [])
+
+        response = self.client.get("/contacts/", headers=headers)
+        self.assertEqual([contact["id"] for contact in response.json()], ids)
+        self.assertEqual(self.client.get(f"/contacts/{ids[1]}", headers=headers).json()["last_name"], "Contact1")
+        export = self.client.get("/contacts/export", params={"format": "ndjson"}, headers=headers)
+        self.assertEqual(len(export.text.splitlines()), 3)
+        self.assertEqual(self.client.delete(f"/contacts/{ids[0]}", headers=headers).status_code, 200)
+        self.assertEqual(self.contacts_on("s2", user.id), ids[1:])
+        self.assertEqual(self.router.sessions["primary"], 0)
+
+    async def test_rebalance_moves_user(self):
+        # Test a user's contacts move from the primary to the ring's shard with their IDs and ETag
+        user, headers = await self.user("moved")
+        ids = [self.client.post("/contacts/", json=contact_body(n), headers=headers).json()["id"] for n in range(5)]
+        before = self.client.get("/contacts/", headers=headers)
+
+        rebalancer = Rebalancer(database.SQLALCHEMY_DATABASE_URL, self.urls, batch_size=2)
+        self.addCleanup(rebalancer.dispose)
+        target = rebalancer.ring.lookup(user.id)
+        self.assertEqual(await rebalancer.run([user.id], dry_run=True),
+                         [{"user_id": user.id, "email": user.email, "source": None, "target": target}])
+        [result] = await rebalancer.run([user.id], settle_seconds=0)
+        self.assertEqual((result["status"], result["contacts"]), ("moved", 5))
+        self.assertEqual(self.contacts_on(target, user.id), ids)
+        self.assertEqual(self.contacts_on(None, user.id), [])
+
+        after = self.client.get("/contacts/", headers=headers)
+        self.assertEqual(after.json(), before.json())
+        self.assertEqual(after.headers["ETag"], before.headers["ETag"])
+        created = self.client.post("/contacts/", json=contact_body(5), headers=headers).json()
+        self.assertEqual(self.contacts_on(target, user.id), ids + [created["id"]])
+        self.assertEqual(await rebalancer.run([user.id]), [])
+
+    async def test_rebalance_retries_changed_contacts(self):
+        # Test a change made while the contacts are copied is copied again before the user is switched
+        user, headers = await self.user("busy", "s1")
+        rebalancer = Rebalancer(database.SQLALCHEMY_DATABASE_URL, self.urls)
+        self.addCleanup(rebalancer.dispose)
+        rebalancer.ring = HashRing(["s2"])
+        copy = rebalancer._copy
+        copies = []
+
+        def copy_and_write(move):
+            copies.append(copy(move))
+            if len(copies) == 1:
+                self.client.post("/contacts/", json=contact_body(10), headers=headers)
+            return copies[-1]
+
+        with patch.object(rebalancer, "_copy", copy_and_write):
+            [result] = await rebalancer.run([user.id], settle_seconds=0)
+        self.assertEqual([count for _, count in copies], [0, 1])
+        self.assertEqual(result["status"], "moved")
+        self.assertEqual(len(self.contacts_on("s2", user.id)), 1)
+        self.assertIsNone(self.shard_row("s1", user.id))
+
+    async def test_write_after_switch_is_rolled_back(self):
+        # Test a write that reaches the source after the switch changes nothing and asks to retry
+        user, headers = await self.user("raced", "s1")
+        engine = create_engine(self.urls["s1"])
+        with engine.begin() as conn:
+            conn.execute(update(User).where(User.id == user.id).values(shard="s2"))
+        engine.dispose()
+        response = self.client.post("/contacts/", json=contact_body(20), headers=headers)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual(self.contacts_on("s1", user.id), [])
+
+    async def test_rebalance_conflict(self):
+        # Test a user whose contact email is taken on the target shard stays where they are
+        other, other_headers = await self.user("other", "s2")
+        user, headers = await self.user("conflict", "s1")
+        self.client.post("/contacts/", json=contact_body(30), headers=other_headers)
+        self.client.post("/contacts/", json=contact_body(30), headers=headers)
+        rebalancer = Rebalancer(database.SQLALCHEMY_DATABASE_URL, self.urls)
+        self.addCleanup(rebalancer.dispose)
+        rebalancer.ring = HashRing(["s2"])
+        [result] = await rebalancer.run([user.id], settle_seconds=0)
+        self.assertEqual(result["status"], "conflict")
+        self.assertEqual(len(self.contacts_on("s1", user.id)), 1)
+        self.assertEqual(self.client.get("/contacts/", headers=headers).json()[0]["email"], "shard.30@example.com")
+
+    def revision(self, url: str) -> str:
+        engine = create_engine(url)
+        with engine.connect() as conn:
+            revision = conn.scalar(text("SELECT version_num FROM alembic_version"))
+        engine.dispose()
+        return revision
+
+    def test_migrations_across_shards(self):
+        # Test the schema tool upgrades shards from an older revision and builds new ones
+        old = {name: "sqlite:///" + os.path.join(self.directory.name, f"old_{name}.db") for name in ("s3", "s4")}
+        for url in old.values():
+            baseline_database(url)
+        new = "sqlite:///" + os.path.join(self.directory.name, "new_s5.db")
+        self.assertEqual(migrate_all(database.SQLALCHEMY_DATABASE_URL, {**old, "s5": new}),
+                         {"primary": "upgraded", "s3": "upgraded", "s4": "upgraded", "s5": "created"})
+        head = ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+        self.assertEqual({self.revision(url) for url in (*old.values(), new)}, {head})
+
+    def test_alembic_across_shards(self):
+        # Test `alembic -x shard=all` upgrades the primary and every shard from an older revision
+        old = {name: "sqlite:///" + os.path.join(self.directory.name, f"old_{name}.db") for name in ("s3", "s4")}
+        for url in old.values():
+            baseline_database(url)
+        env = {**os.environ, "SQLALCHEMY_SHARD_URLS": ",".join(f"{name}={url}" for name, url in old.items())}
+        result = subprocess.run([sys.executable, "-m", "alembic", "-x", "shard=all", "upgrade", "head"],
+                                cwd=APP_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        head = ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+        self.assertEqual({self.revision(url) for url in (database.SQLALCHEMY_DATABASE_URL, *old.values())}, {head})
+
+if __name__ == '__main__':
+    unittest.main()
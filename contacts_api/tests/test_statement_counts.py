@@ -0,0 +1,113 @@
+import unittest
+import sys
+import os
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from main import app
+from src.database import db as database
+from src.database.models import Contact, User
+from src.services.auth import auth_service
+
+CONTACT = {"first_name": "John", "last_name": "Doe", "email": "count.john@example.com",
+           "phone_number": "555000111", "birthday": "1990-01-01", "additional_data": None}
+
+
+@contextmanager
+def count_statements():
+    """
+    Count the SQL statements sent to the database inside the block.
+
+    Yields:
+        list: The statements, filled in as they are executed.
+    """
+    statements = []
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine else [])
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+
+
+class TestStatementCounts(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = TestClient(app)
+        self.client.__enter__()
+        with database.SessionLocal() as db:
+            db.query(Contact).filter(Contact.email.like("count.%")).delete(synchronize_session=False)
+            db.query(User).filter(User.email.like("count.%")).delete(synchronize_session=False)
+            db.add(User(username="count_user", email="count.user@example.com", password="x"))
+            db.commit()
+        token = await auth_service.create_access_token(data={"sub": "count.user@example.com"})
+        self.headers = {"Authorization": f"Bearer {token}"}
+        # Load the user into the user cache so only the endpoint's own statements are counted
+        self.assertEqual(self.client.get("/contacts/", headers=self.headers).status_code, 200)
+
+    async def asyncTearDown(self):
+        self.client.__exit__(None, None, None)
+
+    def request(self, method, url, expected_status, extra_headers=None, **kwargs):
+        with count_statements() as statements:
+            response = self.client.request(method, url, headers={**self.headers, **(extra_headers or {})}, **kwargs)
+        self.assertEqual(response.status_code, expected_status, response.text)
+        return response, statements
+
+    def test_contact_endpoints(self):
+        # Test every contact write is one statement plus the version bump, and every read the
+        # version lookup plus one statement
+        response, statements = self.request("POST", "/contacts/", 201, json=CONTACT)
+        self.assertEqual(len(statements), 2, statements)
+        self.assertTrue(statements[0].startswith("INSERT"))
+        contact_id = response.json()["id"]
+
+        response, statements = self.request("GET", f"/contacts/{contact_id}", 200)
+        self.assertEqual(len(statements), 2, statements)
+
+        # A current ETag is answered from the version alone
+        _, statements = self.request("GET", f"/contacts/{contact_id}", 304,
+                                     extra_headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(len(statements), 1, statements)
+
+        _, statements = self.request("GET", "/contacts/", 200)
+        self.assertEqual(len(statements), 2, statements)
+
+        response, statements = self.request("PUT", f"/contacts/{contact_id}", 200,
+                                            json={**CONTACT, "first_name": "Johnny"})
+        self.assertEqual(len(statements), 2, statements)
+        self.assertTrue(statements[0].startswith("UPDATE"))
+        self.assertEqual(response.json()["first_name"], "Johnny")
+
+        _, statements = self.request("PATCH", "/contacts/bulk", 200,
+                                     json={"ids": [contact_id], "changes": {"last_name": "Roe"}})
+        self.assertEqual(len(statements), 2, statements)
+
+        response, statements = self.request("DELETE", f"/contacts/{contact_id}", 200)
+        self.assertEqual(len(statements), 2, statements)
+        self.assertTrue(statements[0].startswith("DELETE"))
+        self.assertEqual(response.json()["last_name"], "Roe")
+
+        # Nothing left to delete, so the version is not bumped
+        _, statements = self.request("DELETE", "/contacts/bulk", 200, json={"ids": [contact_id]})
+        self.assertEqual(len(statements), 1, statements)
+
+    def test_missing_contact(self):
+        # Test updating or deleting a missing contact is one statement and a 404
+        _, statements = self.request("PUT", "/contacts/999999", 404, json=CONTACT)
+        self.assertEqual(len(statements), 1, statements)
+        _, statements = self.request("DELETE", "/contacts/999999", 404)
+        self.assertEqual(len(statements), 1, statements)
+
+
+if __name__ == '__main__':
+    unittest.main()
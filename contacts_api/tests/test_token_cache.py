@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+import asyncio
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import HTTPException
+from jose import JWTError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.database.models import Base, User
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+from src.services.cache import ClaimsCache, LRUCache, token_claims, token_digest
+
+
+class TestClaimsCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.verified = []
+        self.cache = ClaimsCache(LRUCache(maxsize=2, ttl=0))
+
+    def verify(self, token):
+        self.verified.append(token)
+        if token == "bad":
+            raise JWTError("Signature verification failed")
+        return {"sub": token, "exp": time.time() + 60}
+
+    def test_claims_are_cached_by_digest(self):
+        # Test a token is verified once and stored under its digest only
+        for _ in range(3):
+            self.assertEqual(self.cache.decode("token-a", self.verify)["sub"], "token-a")
+        self.assertEqual(self.verified, ["token-a"])
+        self.assertEqual(self.cache.stats(), {"hits": 2, "misses": 1, "size": 1})
+        self.assertIsNotNone(self.cache.local.get(token_digest("token-a")))
+        self.assertIsNone(self.cache.local.get("token-a"))
+
+    def test_invalid_tokens_are_not_cached(self):
+        # Test a failed verification raises every time
+        for _ in range(2):
+            with self.assertRaises(JWTError):
+                self.cache.decode("bad", self.verify)
+        self.assertEqual(self.verified, ["bad", "bad"])
+        self.assertEqual(len(self.cache.local), 0)
+
+    def test_cache_is_bounded(self):
+        # Test the least recently used token is evicted
+        for token in ("a", "b", "a", "c", "a", "b"):
+            self.cache.decode(token, self.verify)
+        self.assertEqual(self.verified, ["a", "b", "c", "b"])
+
+    def test_invalidate(self):
+        # Test a revoked token is verified again
+        self.cache.decode("a", self.verify)
+        self.cache.invalidate("a")
+        self.cache.invalidate(None)
+        self.cache.decode("a", self.verify)
+        self.assertEqual(self.verified, ["a", "a"])
+
+
+class TestAuthTokenCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        token_claims.local._data.clear()
+
+    async def test_expired_token_is_rejected_at_exp(self):
+        # Test a cached token stops being accepted once its exp has passed
+        token = await auth_service.create_access_token(data={"sub": "test@example.com"}, expires_delta=1)
+        claims = auth_service.decode_token(token)
+        self.assertEqual(auth_service.decode_token(token), claims)
+        await asyncio.sleep(max(0.0, claims["exp"] - time.time()) + 0.05)
+        self.assertIsNone(token_claims.local.get(token_digest(token)))
+        # jose compares exp in whole seconds, so the token is rejected after the second of exp has passed
+        await asyncio.sleep(1)
+        with self.assertRaises(JWTError):
+            auth_service.decode_token(token)
+        with self.assertRaises(HTTPException):
+            await auth_service.get_current_user(token=token, db=None)
+
+    async def test_scope_is_checked_on_cached_claims(self):
+        # Test tokens cached by one check are still rejected by the other
+        refresh_token = await auth_service.create_refresh_token(data={"sub": "test@example.com"})
+        access_token = await auth_service.create_access_token(data={"sub": "test@example.com"})
+        self.assertEqual(await auth_service.decode_refresh_token(refresh_token), "test@example.com")
+        with self.assertRaises(HTTPException) as e:
+            await auth_service.get_current_user(token=refresh_token, db=None)
+        self.assertEqual(e.exception.status_code, 401)
+        auth_service.decode_token(access_token)
+        with self.assertRaises(HTTPException) as e:
+            await auth_service.decode_refresh_token(access_token)
+        self.assertEqual(e.exception.detail, "Invalid scope for token")
+
+    async def test_replaced_refresh_token_is_evicted(self):
+        # Test storing a new refresh token drops the old one from the cache
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        old_token = await auth_service.create_refresh_token(data={"sub": "token@example.com"})
+        user = User(username="token_user", email="token@example.com", password="x", refresh_token=old_token)
+        db.add(user)
+        db.commit()
+        await auth_service.decode_refresh_token(old_token)
+        self.assertIsNotNone(token_claims.local.get(token_digest(old_token)))
+        await repository_users.update_token(user, None, db)
+        self.assertIsNone(token_claims.local.get(token_digest(old_token)))
+        db.close()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
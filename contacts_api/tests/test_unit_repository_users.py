@@ -35,7 +35,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         body = UserModel(username="test_user", email="test@example.com", password="test_password")
         gravatar_mock = MagicMock(spec=Gravatar)
         gravatar_mock.get_image.return_value = "http://example.com/avatar.jpg"
-        with patch("src.repository.users.Gravatar", return_value=gravatar_mock): 
+        with patch("libgravatar.Gravatar", return_value=gravatar_mock): 
             result = await create_user(body=body, db=self.session)
             self.assertEqual(result.email, body.email)
             self.assertEqual(result.avatar, "http://example.com/avatar.jpg")
@@ -45,7 +45,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         body = UserModel(username="test_user", email="test@example.com", password="test_password")
         gravatar_mock = MagicMock(spec=Gravatar)
         gravatar_mock.get_image.side_effect = Exception("Gravatar not available")
-        with patch("src.repository.users.Gravatar", return_value=gravatar_mock): 
+        with patch("libgravatar.Gravatar", return_value=gravatar_mock): 
             result = await create_user(body=body, db=self.session)
             self.assertEqual(result.email, body.email)
             self.assertIsNone(result.avatar)
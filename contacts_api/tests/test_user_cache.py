@@ -0,0 +1,183 @@
+import unittest
+import sys
+import os
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from redis.exceptions import ConnectionError
+from src.database.models import User
+from src.services.cache import LRUCache, UserCache, dump_user, load_user
+from src.services.redis_client import InMemoryRedis
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def setex(self, key, expire, value):
+        self.data[key] = value.encode()
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def publish(self, channel, message):
+        return 0
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        # Test the oldest untouched entry is evicted when the cache is full
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_expired_entry(self):
+        # Test entries are dropped after their TTL
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1, ttl=-1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.cache = UserCache(LRUCache(maxsize=10, ttl=60), self.redis)
+        self.user = User(id=1, username="test_user", email="test@example.com", password="secret",
+                         refresh_token="token", avatar=None, email_verified=True,
+                         created_at=datetime(2024, 4, 20, 12, 0))
+
+    def test_record_has_no_secrets(self):
+        # Test the serialized record leaves out the password and refresh token
+        record = dump_user(self.user)
+        self.assertNotIn("secret", record)
+        self.assertNotIn("token", record)
+        user = load_user(record)
+        self.assertEqual((user.id, user.email, user.created_at), (1, "test@example.com", self.user.created_at))
+
+    async def test_tiers(self):
+        # Test a miss goes to the loader and later reads hit the local tier, then Redis
+        loader = AsyncMock(return_value=self.user)
+        user = await self.cache.get_user("test@example.com", loader)
+        self.assertIs(user, self.user)
+        self.assertIn("user:test@example.com", self.redis.data)
+
+        user = await self.cache.get_user("test@example.com", loader)
+        self.assertEqual(user.id, 1)
+        self.cache.local.delete("user:test@example.com")
+        user = await self.cache.get_user("test@example.com", loader)
+        self.assertEqual(user.id, 1)
+
+        loader.assert_awaited_once()
+        self.assertEqual(self.cache.stats(), {"local_hits": 1, "redis_hits": 1, "misses": 1, "local_size": 1})
+
+    async def test_negative_entry(self):
+        # Test an unknown email is cached as missing
+        loader = AsyncMock(return_value=None)
+        self.assertIsNone(await self.cache.get_user("unknown@example.com", loader))
+        self.assertIsNone(await self.cache.get_user("unknown@example.com", loader))
+        loader.assert_awaited_once()
+
+    async def test_invalidate(self):
+        # Test invalidation removes the user from both tiers
+        loader = AsyncMock(return_value=self.user)
+        await self.cache.get_user("test@example.com", loader)
+        await self.cache.invalidate("test@example.com")
+        self.assertEqual(self.redis.data, {})
+        await self.cache.get_user("test@example.com", loader)
+        self.assertEqual(loader.await_count, 2)
+
+    async def test_redis_unavailable(self):
+        # Test the cache keeps working on the local tier when Redis is down
+        redis_client = MagicMock()
+        redis_client.get = AsyncMock(side_effect=ConnectionError())
+        cache = UserCache(LRUCache(maxsize=10, ttl=60), redis_client)
+        loader = AsyncMock(return_value=self.user)
+        await cache.get_user("test@example.com", loader)
+        await cache.get_user("test@example.com", loader)
+        loader.assert_awaited_once()
+        redis_client.get.assert_awaited_once()
+        redis_client.setex.assert_not_called()
+
+    async def test_invalidate_other_workers(self):
+        # Test a user changed on one worker is not served from another worker's local tier
+        redis_client = InMemoryRedis()
+        workers = [UserCache(LRUCache(maxsize=10, ttl=60), redis_client) for _ in range(2)]
+        for worker in workers:
+            await worker.start()
+            self.addAsyncCleanup(worker.stop)
+        await asyncio.sleep(0)
+        self.assertTrue(all(worker.subscribed for worker in workers))
+        loader = AsyncMock(return_value=self.user)
+        for worker in workers:
+            await worker.get_user("test@example.com", loader)
+        self.assertEqual(workers[1].stats()["local_size"], 1)
+
+        await workers[0].invalidate("test@example.com")
+        await asyncio.sleep(0)
+        self.assertEqual(workers[1].stats()["local_size"], 0)
+        changed = User(id=1, username="changed", email="test@example.com")
+        user = await workers[1].get_user("test@example.com", AsyncMock(return_value=changed))
+        self.assertEqual(user.username, "changed")
+
+    async def test_invalidation_during_read(self):
+        # Test a record read before an invalidation arrives is not kept in the local tier
+        redis_client = InMemoryRedis()
+        cache = UserCache(LRUCache(maxsize=10, ttl=60), redis_client)
+        await cache.start()
+        self.addAsyncCleanup(cache.stop)
+        await asyncio.sleep(0)
+
+        async def stale_loader():
+            await redis_client.publish("user-cache:invalidate", "user:test@example.com")
+            await asyncio.sleep(0)
+            return self.user
+
+        await cache.get_user("test@example.com", stale_loader)
+        self.assertEqual(len(cache.local), 0)
+
+    async def test_unsubscribed_bypasses_local_tier(self):
+        # Test the local tier is not used while the invalidations can't be received
+        redis_client = MagicMock()
+        redis_client.pubsub.return_value.subscribe = AsyncMock(side_effect=ConnectionError())
+        redis_client.pubsub.return_value.aclose = AsyncMock()
+        redis_client.get = AsyncMock(return_value=dump_user(self.user).encode())
+        cache = UserCache(LRUCache(maxsize=10, ttl=60), redis_client)
+        cache.local.set("user:test@example.com", dump_user(self.user))
+        with self.assertLogs("src.services.cache", "WARNING"):
+            await cache.start()
+            self.addAsyncCleanup(cache.stop)
+            await asyncio.sleep(0)
+        loader = AsyncMock()
+        await cache.get_user("test@example.com", loader)
+        await cache.get_user("test@example.com", loader)
+        self.assertEqual(cache.stats()["local_hits"], 0)
+        self.assertEqual(redis_client.get.await_count, 2)
+
+    async def test_repository_invalidates(self):
+        # Test the repository updates invalidate the cached user
+        from src.repository import users as repository_users
+        with patch.object(repository_users, "run_db", AsyncMock()), \
+                patch.object(repository_users, "user_cache") as cache_mock:
+            cache_mock.invalidate = AsyncMock()
+            await repository_users.update_token(self.user, "new_token", MagicMock())
+            await repository_users.confirm_email("test@example.com", MagicMock())
+            await repository_users.update_avatar("test@example.com", "http://example.com/a.jpg", MagicMock())
+        self.assertEqual([c.args for c in cache_mock.invalidate.await_args_list], [("test@example.com",)] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()